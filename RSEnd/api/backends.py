@@ -0,0 +1,86 @@
+import os
+
+import paddle.inference as paddle_infer
+
+from .runtime import apply_profile, model_variant_dir
+
+# convert_onnx.py 把模型转换后保存在模型目录（或 int8/ 子目录）下的这个文件中
+ONNX_FILE = 'model.onnx'
+
+
+class PaddleBackend:
+    """paddle.inference 执行后端。"""
+
+    def __init__(self, model_file, params_file, profile, predictor=None):
+        if predictor is None:
+            config = paddle_infer.Config(model_file, params_file)
+            apply_profile(config, profile)
+            predictor = paddle_infer.create_predictor(config)
+        self.predictor = predictor
+
+    def get_input_names(self):
+        return self.predictor.get_input_names()
+
+    def run(self, feeds):
+        """按输入名拷入 feeds 中的数组（模型不需要的输入被忽略），执行一次推理，按顺序返回所有输出。"""
+        for name in self.predictor.get_input_names():
+            if name in feeds:
+                handle = self.predictor.get_input_handle(name)
+                handle.reshape(feeds[name].shape)
+                handle.copy_from_cpu(feeds[name])
+        self.predictor.run()
+        return [self.predictor.get_output_handle(name).copy_to_cpu()
+                for name in self.predictor.get_output_names()]
+
+    def clone(self):
+        # 共享权重、独立执行上下文，供 PredictorPool 在多个线程中并行使用
+        return PaddleBackend(None, None, None, predictor=self.predictor.clone())
+
+
+class OnnxRuntimeBackend:
+    """
+    ONNX Runtime 执行后端，加载 convert_onnx.py 转换出的 model.onnx。
+    intra_op_threads 对应 profile 的 cpu_threads，inter_op_threads 大于 1 时开启算子间并行。
+    """
+
+    def __init__(self, onnx_file, profile):
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise ImportError("backend 为 onnxruntime 的运行时配置需要安装 onnxruntime: pip install onnxruntime")
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = profile['cpu_threads']
+        options.inter_op_num_threads = profile['inter_op_threads']
+        options.execution_mode = (ort.ExecutionMode.ORT_PARALLEL if profile['inter_op_threads'] > 1
+                                  else ort.ExecutionMode.ORT_SEQUENTIAL)
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(onnx_file, sess_options=options, providers=['CPUExecutionProvider'])
+        self.input_names = [i.name for i in self.session.get_inputs()]
+
+    def get_input_names(self):
+        return self.input_names
+
+    def run(self, feeds):
+        return self.session.run(None, {name: feeds[name] for name in self.input_names if name in feeds})
+
+    def clone(self):
+        # InferenceSession.run() 本身线程安全，池中的副本直接共享同一个会话
+        return self
+
+
+def create_backend(model_dir, profile, model_filename='model.pdmodel', params_filename='model.pdiparams'):
+    """
+    按运行时 profile 创建执行后端。加载器只负责预处理和后处理，推理统一通过返回对象的 run(feeds) 完成。
+
+    Args:
+        model_dir: 模型目录（precision 为 int8 时自动使用 int8/ 子目录）。
+        profile: resolve_profile() 返回的完整配置。
+        model_filename: Paddle 模型结构文件名，PaddleSeg 新版导出的是 model.json。
+    """
+    model_dir = model_variant_dir(model_dir, profile)
+    if profile['backend'] == 'onnxruntime':
+        onnx_file = os.path.join(model_dir, ONNX_FILE)
+        if not os.path.exists(onnx_file):
+            raise FileNotFoundError(f"未找到 {onnx_file}，请先运行 python convert_onnx.py")
+        return OnnxRuntimeBackend(onnx_file, profile)
+    return PaddleBackend(os.path.join(model_dir, model_filename), os.path.join(model_dir, params_filename), profile)
@@ -0,0 +1,116 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from .utils import load_image
+
+
+class BatchingQueue:
+    """
+    进程内的动态微批处理队列。
+
+    多个请求线程调用 predict()/submit() 提交图片，后台工作线程在 max_wait_ms 的时间窗内
+    收集最多 max_batch_size 个请求，调用一次 predictor.predict_batch()，再把结果分发回各个调用者。
+    predictor 为 PredictorPool 时可以开启 num_workers 个工作线程，多个批次并行推理。
+    对外暴露与预测器相同的 predict(image) 接口，可以直接传给 perform_* 服务函数。
+    """
+
+    def __init__(self, predictor, max_batch_size=8, max_wait_ms=5, num_workers=1):
+        self.predictor = predictor
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, max_wait_ms / 1000.0)
+        self._queue = queue.Queue()
+        self._stopped = threading.Event()
+        # 检查关闭标志与入队在同一把锁内完成，close() 之后不会再有请求进入队列（否则它的 Future 永远不会完成）
+        self._submit_lock = threading.Lock()
+        self._workers = [threading.Thread(target=self._loop, name=f"det-batching-{i}", daemon=True)
+                         for i in range(max(1, int(num_workers)))]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, image):
+        """
+        提交一张图片，返回 concurrent.futures.Future，结果为该图片的检测结果列表。
+        图片在调用者线程中解码，无法解码的输入直接在这里抛出，不会进入批次影响其他请求。
+        """
+        image = load_image(image)
+        future = Future()
+        with self._submit_lock:
+            if self._stopped.is_set():
+                raise RuntimeError("批处理队列已关闭")
+            self._queue.put((image, future))
+        return future
+
+    def predict(self, image, timeout=None):
+        """同步接口：提交并等待结果，行为与 predictor.predict 一致。"""
+        return self.submit(image).result(timeout=timeout)
+
+    def predict_batch(self, images, timeout=None):
+        """一次提交多张图片，它们会和其他请求一起被合并成批次，返回与输入顺序一致的结果列表。"""
+        futures = [self.submit(image) for image in images]
+        return [future.result(timeout=timeout) for future in futures]
+
+    def close(self):
+        with self._submit_lock:
+            self._stopped.set()
+            for _ in self._workers:
+                self._queue.put(None)
+        for worker in self._workers:
+            worker.join()
+        self._drain()
+
+    def _drain(self):
+        # 关闭后仍在队列中的请求直接失败，避免调用者永久阻塞
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if item is not None:
+                item[1].set_exception(RuntimeError("批处理队列已关闭"))
+
+    def _collect(self):
+        # 阻塞等待第一个请求，然后在时间窗内尽量凑满一个批次
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)  # 保留关闭信号，处理完当前批次后退出
+                break
+            batch.append(item)
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            images = [image for image, _ in batch]
+            futures = [future for _, future in batch]
+            try:
+                results = self.predictor.predict_batch(images)
+            except Exception as e:
+                if len(batch) == 1:
+                    futures[0].set_exception(e)
+                else:
+                    self._run_each(batch)
+                continue
+            for future, result in zip(futures, results):
+                future.set_result(result)
+
+    def _run_each(self, batch):
+        # 合并的批次推理失败时逐张重跑，异常只落在出错图片对应的请求上
+        for image, future in batch:
+            try:
+                future.set_result(self.predictor.predict_batch([image])[0])
+            except Exception as e:
+                future.set_exception(e)
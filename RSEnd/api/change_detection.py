@@ -12,12 +12,11 @@ from PIL import Image
 import imagehash
 DEBUG = True
 from PIL import Image
-from paddlers.deploy import Predictor
+from .model_registry import registry
 
 change_detection_bp = Blueprint('change_detection', __name__)
 
 
-predictor = Predictor("./models/rscd/", use_gpu=True)
 
 
 RESULT_FOLDER = 'static/output'
@@ -143,6 +142,8 @@ def predict_change_detection():
     path_b = data.get('path_b')
 
     if not path_a or not path_b: return jsonify({"error": "缺少图片路径"}), 400
+    # 变化检测模型由注册表统一管理，两个蓝图共用同一个实例，只加载一次
+    predictor = registry.get('change_detection')
     if not predictor: return jsonify({"error": "模型未加载，无法检测"}), 500
 
     analysis_result = perform_change_detection(path_a, path_b, predictor)
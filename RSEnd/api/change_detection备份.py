@@ -2,7 +2,6 @@ from flask import Blueprint, Flask, json, request, jsonify
 from flask_cors import CORS
 from skimage.metrics import structural_similarity as ssim
 import shutil
-import pymysql
 import cv2
 import numpy as np
 import os
@@ -11,12 +10,12 @@ from PIL import Image
 import imagehash
 DEBUG = True
 from PIL import Image
-from paddlers.deploy import Predictor
+from .model_registry import registry
+from services.persistence import persistence, PersistJob, history_input_job, history_record, result_job
 
 change_detection_bf_bp = Blueprint('change_detection_bf', __name__)
 
 
-predictor = Predictor("./models/rscd/", use_gpu=True)
 
 
 RESULT_FOLDER = 'static/output'
@@ -142,6 +141,8 @@ def predict_change_detection():
     path_b = data.get('path_b')
 
     if not path_a or not path_b: return jsonify({"error": "缺少图片路径"}), 400
+    # 变化检测模型由注册表统一管理，两个蓝图共用同一个实例，只加载一次
+    predictor = registry.get('change_detection')
     if not predictor: return jsonify({"error": "模型未加载，无法检测"}), 500
 
     try:
@@ -149,36 +150,27 @@ def predict_change_detection():
         result = predictor.predict((path_a, path_b))
         label_map = result['label_map']
 
-        final_path_a = os.path.join(HISTORY_INPUT_FOLDER, os.path.basename(path_a))
-        final_path_b = os.path.join(HISTORY_INPUT_FOLDER, os.path.basename(path_b))
-        shutil.copy(path_a, final_path_a)
-        shutil.copy(path_b, final_path_b)
+        final_path_a, input_file_a = history_input_job(path_a)
+        final_path_b, input_file_b = history_input_job(path_b)
 
-        # 将结果保存为图片
-        result_filename = f"{uuid.uuid4()}.png"
-        result_path = os.path.join(RESULT_FOLDER, result_filename)
-        # 转换为二值图像并保存
-        binary_map = (label_map > 0.5).astype(np.uint8) * 255
-        Image.fromarray(binary_map).save(result_path)
+        # 结果图片路径（按内容寻址），二值化和保存在后台写回线程中完成
+        def save_result(path):
+            # 转换为二值图像并保存
+            binary_map = (label_map > 0.5).astype(np.uint8) * 255
+            Image.fromarray(binary_map).save(path)
 
+        result_path, result_file = result_job('change_detection', [label_map], save_result)
         result_url = request.host_url + result_path.replace('\\', '/')
 
-        db_conn = pymysql.connect(host='127.0.0.1', port=3306, user='root', password='root', db='EndJob',
-                                  charset='utf8')
-        cursor = db_conn.cursor()
-
         # 将指标字典转换为JSON字符串以便存储
         metrics_data = {"change_area_km2": round((np.sum(label_map == 1) * 0.5 * 0.5) / 1_000_000, 4),
                         "change_rate": round((np.sum(label_map == 1) / label_map.size) * 100,
                                              2) if label_map.size > 0 else 0}
         metrics_str = json.dumps(metrics_data)
 
-        sql = "INSERT INTO history_records (task_type, result_url, before_image_url, after_image_url, detection_metrics_json) VALUES (%s, %s, %s, %s, %s)"
-        cursor.execute(sql, ('变化检测', result_url, final_path_a.replace('\\', '/'), final_path_b.replace('\\', '/'), metrics_str))
-
-        db_conn.commit()
-        cursor.close()
-        db_conn.close()
+        # 数据库中保存内容存储的相对路径，删除记录时据此回收不再被引用的文件
+        sql, params = history_record('变化检测', result_path, final_path_a, metrics_str, after_url=final_path_b)
+        persistence.submit(PersistJob([result_file, input_file_a, input_file_b], sql, params))
 
         # 返回结果图片的URL
 
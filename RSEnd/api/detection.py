@@ -0,0 +1,131 @@
+import os
+from functools import lru_cache
+from typing import Annotated, Optional
+
+import numpy as np
+import yaml
+from pydantic import BaseModel, Field, ValidationInfo, field_validator
+
+
+def nms(boxes, scores, iou_threshold):
+    """
+    贪心 NMS，返回保留框的下标（按分数从高到低）。
+
+    Args:
+        boxes: (N, 4) 的 [x1, y1, x2, y2]。
+        scores: (N,) 分数。
+        iou_threshold: 与已保留框的 IoU 超过该值的框被抑制。
+    """
+    x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    areas = np.maximum(x2 - x1, 0) * np.maximum(y2 - y1, 0)
+    order = np.argsort(-scores, kind='stable')
+    keep = []
+    while order.size > 0:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        w = np.maximum(np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]), 0)
+        h = np.maximum(np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]), 0)
+        inter = w * h
+        iou = inter / np.maximum(areas[i] + areas[rest] - inter, 1e-9)
+        order = rest[iou <= iou_threshold]
+    return np.array(keep, dtype=np.int64)
+
+
+def batched_nms(boxes, scores, class_ids, iou_threshold):
+    """按类别分别做 NMS：给每个类别的框加上互不重叠的坐标偏移，一次 NMS 即可等价于逐类 NMS。"""
+    if boxes.shape[0] == 0:
+        return np.zeros(0, dtype=np.int64)
+    offset = class_ids.astype(boxes.dtype)[:, None] * (boxes.max() + 1)
+    return nms(boxes + offset, scores, iou_threshold)
+
+
+@lru_cache(maxsize=None)
+def load_label_list(model_dir):
+    """模型导出配置 model.yml 中的类别名列表，不需要加载模型。"""
+    with open(os.path.join(model_dir, 'model.yml'), 'r', encoding='utf-8') as f:
+        return tuple(yaml.safe_load(f)['label_list'])
+
+
+class DetectionParams(BaseModel):
+    """
+    目标检测请求的后处理参数，阈值都在 [0, 1] 内。
+    校验时通过 context={'labels': 类别名列表} 传入模型的类别，class_thresholds 中未知的类别名会被拒绝。
+    """
+    score_threshold: Optional[float] = Field(None, ge=0, le=1)
+    class_thresholds: Optional[dict[str, Annotated[float, Field(ge=0, le=1)]]] = None
+    nms_iou: Optional[float] = Field(None, ge=0, le=1)
+
+    @field_validator('class_thresholds')
+    @classmethod
+    def _known_labels(cls, value, info: ValidationInfo):
+        labels = (info.context or {}).get('labels')
+        if value and labels is not None:
+            unknown = sorted(set(value) - set(labels))
+            if unknown:
+                raise ValueError(f"未知的类别 {unknown}，可选类别为 {list(labels)}")
+        return value
+
+
+class DetectionResult:
+    """
+    列式的目标检测结果：boxes (N, 4) [x1, y1, x2, y2]、scores (N,)、class_ids (N,)。
+    过滤、统计都在数组上完成，只有 to_json() 才会构造 Python 字典。
+    """
+
+    def __init__(self, boxes, scores, class_ids, label_list):
+        self.boxes = boxes
+        self.scores = scores
+        self.class_ids = class_ids
+        self.label_list = label_list
+
+    @classmethod
+    def from_raw(cls, np_boxes, label_list):
+        """由模型输出的 (N, 6) [class_id, score, x1, y1, x2, y2] 构造；class_id 为 -1 的占位行会被去掉。"""
+        np_boxes = np_boxes.reshape(-1, 6)
+        np_boxes = np_boxes[np_boxes[:, 0] >= 0]
+        return cls(np_boxes[:, 2:6].astype(np.float32), np_boxes[:, 1].astype(np.float32),
+                   np_boxes[:, 0].astype(np.int64), label_list)
+
+    @classmethod
+    def concatenate(cls, results, label_list):
+        if not results:
+            return cls(np.zeros((0, 4), np.float32), np.zeros(0, np.float32), np.zeros(0, np.int64), label_list)
+        return cls(np.concatenate([r.boxes for r in results]), np.concatenate([r.scores for r in results]),
+                   np.concatenate([r.class_ids for r in results]), label_list)
+
+    def __len__(self):
+        return self.scores.shape[0]
+
+    def select(self, index):
+        return DetectionResult(self.boxes[index], self.scores[index], self.class_ids[index], self.label_list)
+
+    def filter(self, score_threshold=0.5, class_thresholds=None, nms_iou=None):
+        """
+        按分数阈值过滤，可选逐类 NMS。
+
+        Args:
+            score_threshold: 全局分数阈值。
+            class_thresholds: {类别名: 阈值}，覆盖对应类别的全局阈值。
+            nms_iou: 不为 None 时在过滤后按类别做 NMS。
+        """
+        thresholds = np.full(len(self.label_list), score_threshold, dtype=np.float32)
+        for name, value in (class_thresholds or {}).items():
+            if name in self.label_list:
+                thresholds[self.label_list.index(name)] = value
+        result = self.select(self.scores >= thresholds[self.class_ids])
+        if nms_iou is not None:
+            result = result.select(batched_nms(result.boxes, result.scores, result.class_ids, nms_iou))
+        return result
+
+    def counts_by_class(self):
+        """{类别名: 数量}，只包含出现过的类别。"""
+        counts = np.bincount(self.class_ids, minlength=len(self.label_list))
+        return {self.label_list[i]: int(counts[i]) for i in np.flatnonzero(counts)}
+
+    def to_json(self):
+        """转换成接口返回的列表格式 [{'category_id', 'category', 'bbox': [x, y, w, h], 'score'}, ...]。"""
+        xywh = self.boxes.copy()
+        xywh[:, 2:] -= xywh[:, :2]
+        return [{'category_id': class_id, 'category': self.label_list[class_id], 'bbox': bbox, 'score': score}
+                for class_id, bbox, score in zip(self.class_ids.tolist(), xywh.tolist(), self.scores.tolist())]
@@ -1,34 +1,136 @@
-from flask import Blueprint, jsonify
+import base64
+import json
+from datetime import date, datetime, timedelta
+from typing import Optional, Union
+
+from flask import Blueprint, jsonify, request
+from pydantic import BaseModel, Field, ValidationError, field_validator
 import pymysql
+from services.db import db_pool
+from services.cache import history_cache
+from services.storage import blob_store
+from config import HISTORY_PAGE_SIZE, HISTORY_MAX_PAGE_SIZE
 
 
 history_bp = Blueprint('history', __name__)
 
+# 列表视图只取轻量列，detection_metrics_json 等大字段只在详情接口返回
+LIST_COLUMNS = ("id, task_type, result_url, before_image_url, after_image_url, "
+                "DATE_FORMAT(created_at, '%%Y-%%m-%%d %%H:%%i:%%s') AS created_at")
+DETAIL_COLUMNS = LIST_COLUMNS + ", detection_metrics_json"
+# 内容存储中的文件可能被多条记录共用，回收前确认没有其他记录引用
+REFERENCED_SQL = ("SELECT 1 FROM history_records WHERE result_url = %s OR before_image_url = %s "
+                  "OR after_image_url = %s LIMIT 1")
+
+
+class HistoryQuery(BaseModel):
+    """
+    GET /api/history/ 的查询参数。start / end 为 created_at 的闭区间，格式如 2024-05-01 或 2024-05-01 08:00:00；
+    只有日期的 end 包含当天全天。
+    """
+    limit: int = Field(HISTORY_PAGE_SIZE, ge=1, le=HISTORY_MAX_PAGE_SIZE)
+    cursor: Optional[str] = None
+    task_type: Optional[str] = None
+    start: Optional[Union[datetime, date]] = None
+    end: Optional[Union[datetime, date]] = None
+
+    @field_validator('start', 'end', mode='before')
+    @classmethod
+    def _date_only(cls, value):
+        # 只有日期部分的参数保留为 date，与带时间的 datetime 区分开（否则 end=2024-05-01 会变成当天零点）
+        if isinstance(value, str):
+            try:
+                return date.fromisoformat(value.strip())
+            except ValueError:
+                return value
+        return value
+
+
+def build_list_query(query, after=None):
+    """列表查询的 SQL 与参数。after 为上一页最后一条记录的 (created_at, id)。"""
+    conditions, params = [], []
+    if query.task_type:
+        conditions.append("task_type = %s")
+        params.append(query.task_type)
+    if query.start:
+        conditions.append("created_at >= %s")
+        params.append(query.start)
+    if isinstance(query.end, datetime):
+        conditions.append("created_at <= %s")
+        params.append(query.end)
+    elif query.end:
+        # 只有日期：包含当天全天，即早于次日零点
+        conditions.append("created_at < %s")
+        params.append(query.end + timedelta(days=1))
+    if after:
+        conditions.append("(created_at < %s OR (created_at = %s AND id < %s))")
+        params.extend([after[0], after[0], after[1]])
+    where = f"WHERE {' AND '.join(conditions)} " if conditions else ""
+    # ORDER BY 中的 created_at 会先匹配到 DATE_FORMAT 的同名别名（字符串排序，用不上索引），必须带表名
+    sql = (f"SELECT {LIST_COLUMNS} FROM history_records {where}"
+           f"ORDER BY history_records.created_at DESC, history_records.id DESC LIMIT %s")
+    # 多取一条判断是否还有下一页
+    params.append(query.limit + 1)
+    return sql, params
+
+
+def encode_cursor(record):
+    """把一页最后一条记录的 (created_at, id) 编码成不透明的游标字符串。"""
+    raw = json.dumps([record['created_at'], record['id']]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+def decode_cursor(cursor):
+    created_at, record_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    return datetime.strptime(created_at, '%Y-%m-%d %H:%M:%S'), int(record_id)
+
+
+def is_referenced(path):
+    """是否还有历史记录指向内容存储中的 path。"""
+    with db_pool.connection() as db_conn:
+        with db_conn.cursor() as cursor:
+            return cursor.execute(REFERENCED_SQL, (path, path, path)) > 0
+
+
 # 2. 把所有和历史记录相关的接口都搬到这里
+# 连接从进程共享的连接池中检出，用完归还，不再每个请求新建连接
 @history_bp.route('/', methods=['GET'])
 def get_history():
-    db_conn = pymysql.connect(host='127.0.0.1', port=3306, user='root', password='root', db='EndJob', charset='utf8')
-    cursor = db_conn.cursor(pymysql.cursors.DictCursor)
-    cursor.execute("SELECT * FROM history_records ORDER BY created_at DESC")
-    records = cursor.fetchall()
-    cursor.close()
-    db_conn.close()
-    for record in records:
-        if record.get('created_at'):
-            record['created_at'] = record['created_at'].strftime('%Y-%m-%d %H:%M:%S')
-    return jsonify(records)
+    """
+    按 (created_at, id) 倒序的键集(keyset)分页：下一页从上一页最后一条记录之后继续，
+    由 idx_history_created_id / idx_history_task_created_id 两个索引支撑，翻到多深都不需要 OFFSET 扫描。
+    返回 {"items": [...], "next_cursor": 下一页游标，没有更多记录时为 null}。
+    """
+    try:
+        query = HistoryQuery.model_validate(request.args.to_dict())
+        after = decode_cursor(query.cursor) if query.cursor else None
+    except ValidationError as e:
+        return jsonify({"error": "查询参数格式错误", "details": e.errors(include_url=False)}), 400
+    except (ValueError, TypeError):
+        return jsonify({"error": "无效的分页游标"}), 400
 
-@history_bp.route('/<int:record_id>', methods=['GET'])
-def get_history_record(record_id):
-    db_conn = pymysql.connect(host='127.0.0.1', port=3306, user='root', password='root', db='EndJob', charset='utf8')
-    cursor = db_conn.cursor(pymysql.cursors.DictCursor)
+    sql, params = build_list_query(query, after)
 
-    cursor.execute("SELECT * FROM history_records WHERE id = %s", (record_id,))
-    record = cursor.fetchone()  # fetchone() 用于获取单条记录
+    def load():
+        with db_pool.connection() as db_conn:
+            with db_conn.cursor(pymysql.cursors.DictCursor) as cursor:
+                cursor.execute(sql, params)
+                return list(cursor.fetchall())
 
-    cursor.close()
-    db_conn.close()
+    # 前端轮询的列表查询走缓存，有记录插入或删除时整体失效
+    records = history_cache.list(query.model_dump_json(), load)
+    next_cursor = encode_cursor(records[query.limit - 1]) if len(records) > query.limit else None
+    return jsonify({"items": records[:query.limit], "next_cursor": next_cursor})
 
+@history_bp.route('/<int:record_id>', methods=['GET'])
+def get_history_record(record_id):
+    def load():
+        with db_pool.connection() as db_conn:
+            with db_conn.cursor(pymysql.cursors.DictCursor) as cursor:
+                cursor.execute(f"SELECT {DETAIL_COLUMNS} FROM history_records WHERE id = %s", (record_id,))
+                return cursor.fetchone()  # fetchone() 用于获取单条记录
+
+    record = history_cache.detail(record_id, load)
     if record:
         return jsonify(record)
     else:
@@ -36,14 +138,16 @@ def get_history_record(record_id):
 
 @history_bp.route('/<int:record_id>', methods=['DELETE'])
 def delete_history(record_id):
-    db_conn = pymysql.connect(host='127.0.0.1', port=3306, user='root', password='root', db='EndJob', charset='utf8')
-    cursor = db_conn.cursor()
-
-    sql = "DELETE FROM history_records WHERE id = %s"
-    cursor.execute(sql, (record_id,))
-
-    db_conn.commit()
-    cursor.close()
-    db_conn.close()
+    with db_pool.connection() as db_conn:
+        with db_conn.cursor() as cursor:
+            cursor.execute("SELECT result_url, before_image_url, after_image_url FROM history_records WHERE id = %s",
+                           (record_id,))
+            paths = cursor.fetchone() or ()
+            sql = "DELETE FROM history_records WHERE id = %s"
+            cursor.execute(sql, (record_id,))
+        db_conn.commit()
+    history_cache.invalidate(record_id)
+    # 回收不再被任何记录引用的输入图和结果图
+    blob_store.collect(paths, is_referenced)
 
-    return jsonify({"message": "删除成功"})
\ No newline at end of file
+    return jsonify({"message": "删除成功"})
@@ -0,0 +1,151 @@
+import base64
+
+import cv2
+import numpy as np
+from PIL import Image
+
+
+def class_pixel_counts(label_map, num_classes=256):
+    """
+    一次遍历统计标签图中每个类别的像素数，返回长度为 num_classes 的 int64 数组。
+    uint8 标签图用 cv2.calcHist（不产生任何与图像同尺寸的中间数组），其他整数类型退回 np.bincount。
+    calcHist 以 float32 累加，计数超过 2^24 时会有舍入，因此大图按行分带统计（每带少于 2^24 个像素，计数精确），
+    各带结果在 int64 中相加。
+    """
+    if label_map.dtype == np.uint8 and label_map.ndim == 2:
+        h, w = label_map.shape
+        band = max(1, (2 ** 24 - 1) // max(w, 1))
+        counts = np.zeros(256, dtype=np.int64)
+        for y in range(0, h, band):
+            counts += cv2.calcHist([label_map[y:y + band]], [0], None, [256], [0, 256]).ravel().astype(np.int64)
+    else:
+        counts = np.bincount(label_map.ravel().astype(np.intp, copy=False), minlength=num_classes)
+    if counts.shape[0] < num_classes:
+        counts = np.pad(counts, (0, num_classes - counts.shape[0]))
+    return counts[:num_classes]
+
+
+def class_statistics(label_map, class_names, pixel_area_m2=0.25, skip_background=True):
+    """
+    每个类别的像素数、面积和占比。
+
+    Args:
+        label_map: (H, W) 类别标签图。
+        class_names: {类别 id: 类别名}。
+        pixel_area_m2: 单个像素代表的地面面积，默认 0.5m x 0.5m。
+        skip_background: 是否跳过 0 号背景类。
+
+    Returns:
+        list: [{'class_id', 'class_name', 'pixel_count', 'area_m2', 'percentage'}, ...]，顺序与 class_names 一致。
+    """
+    counts = class_pixel_counts(label_map, max(class_names) + 1)
+    total_pixels = label_map.size
+    stats = []
+    for class_id, class_name in class_names.items():
+        if skip_background and class_id == 0:
+            continue
+        pixel_count = int(counts[class_id])
+        stats.append({
+            "class_id": class_id,
+            "class_name": class_name,
+            "pixel_count": pixel_count,
+            "area_m2": round(pixel_count * pixel_area_m2, 2),
+            "percentage": round(pixel_count / total_pixels * 100, 2) if total_pixels > 0 else 0,
+        })
+    return stats
+
+
+def build_palette(color_map_bgr):
+    """把 {类别 id: [B, G, R]} 转换成 (N, 3) 的 RGB 调色板，N 为最大类别 id + 1，未定义的类别为黑色。"""
+    palette = np.zeros((max(color_map_bgr) + 1, 3), dtype=np.uint8)
+    for class_id, (b, g, r) in color_map_bgr.items():
+        palette[class_id] = (r, g, b)
+    return palette
+
+
+def colorize(label_map, palette, order='rgb', transparent_index=None):
+    """
+    通过查找表给 uint8 标签图上色：每个输出通道各做一次 cv2.LUT，不再逐类别扫描整幅图。
+
+    Args:
+        palette: build_palette() 得到的 (N, 3) RGB 调色板。
+        order: 'rgb' 或 'bgr'（直接交给 cv2.imwrite 时使用）。
+        transparent_index: 不为 None 时输出带 alpha 通道的图像，该类别完全透明、其余不透明。
+
+    Returns:
+        np.ndarray: (H, W, 3) 或 (H, W, 4) uint8。
+    """
+    table = np.zeros((256, 3), dtype=np.uint8)
+    table[:palette.shape[0]] = palette
+    channels = [table[:, c].copy() for c in ((0, 1, 2) if order == 'rgb' else (2, 1, 0))]
+    if transparent_index is not None:
+        alpha = np.full(256, 255, dtype=np.uint8)
+        alpha[transparent_index] = 0
+        channels.append(alpha)
+    label_map = label_map.astype(np.uint8, copy=False)
+    return cv2.merge([cv2.LUT(label_map, lut) for lut in channels])
+
+
+def save_palettized_png(label_map, palette, path, transparent_index=None):
+    """
+    把标签图直接保存成调色板(P 模式)PNG：像素值就是类别 id，颜色由 PNG 的调色板决定，
+    不需要生成 RGB/RGBA 彩色图，文件也只有每像素 1 字节的数据量。
+    transparent_index 指定的类别（通常是背景 0）在浏览器/地图叠加时显示为透明。
+    """
+    image = Image.fromarray(label_map.astype(np.uint8, copy=False), 'P')
+    image.putpalette(palette.ravel().tolist())
+    if transparent_index is None:
+        image.save(path, format='PNG')
+    else:
+        image.save(path, format='PNG', transparency=transparent_index)
+    return path
+
+
+# 接口返回标签图时可选的编码，由请求的 label_map_encoding 参数协商
+LABEL_MAP_ENCODINGS = ('png', 'rle', 'bitmask', 'raw')
+
+
+def encode_rle(label_map):
+    """按行优先顺序的游程编码：values[i] 连续重复 counts[i] 次。块状分布的分割结果游程数远小于像素数。"""
+    flat = label_map.ravel()
+    starts = np.concatenate(([0], np.flatnonzero(flat[1:] != flat[:-1]) + 1))
+    counts = np.diff(np.append(starts, flat.shape[0]))
+    return {"values": flat[starts].tolist(), "counts": counts.tolist()}
+
+
+def decode_rle(encoded, dtype=np.uint8):
+    return np.repeat(np.asarray(encoded["values"], dtype=dtype), encoded["counts"]).reshape(
+        encoded["height"], encoded["width"])
+
+
+def encode_bitmask(label_map):
+    """每个出现的非背景类别一张按位打包（np.packbits，行优先、高位在前）的二值掩膜，base64 编码。二值图只有类别 1。"""
+    counts = class_pixel_counts(label_map)
+    return {"masks": {str(class_id): base64.b64encode(np.packbits(label_map.ravel() == class_id)).decode('ascii')
+                      for class_id in np.flatnonzero(counts[1:]) + 1}}
+
+
+def encode_png(label_map):
+    """单通道（灰度）PNG 的 base64：像素值就是类别 id，前端解码后直接读取任一颜色通道。"""
+    ok, buf = cv2.imencode('.png', label_map.astype(np.uint8, copy=False), [cv2.IMWRITE_PNG_COMPRESSION, 1])
+    if not ok:
+        raise ValueError("标签图 PNG 编码失败")
+    return {"data": base64.b64encode(buf.tobytes()).decode('ascii')}
+
+
+def encode_label_map(label_map, encoding='png'):
+    """
+    按 encoding 编码接口返回的标签图，结果都带有 encoding / height / width 字段。
+    'raw' 为旧的嵌套列表格式（每个像素一个 JSON 整数），只为兼容保留，大图时体积和序列化耗时都很高。
+    """
+    if encoding == 'png':
+        body = encode_png(label_map)
+    elif encoding == 'rle':
+        body = encode_rle(label_map)
+    elif encoding == 'bitmask':
+        body = encode_bitmask(label_map)
+    elif encoding == 'raw':
+        body = {"data": label_map.tolist()}
+    else:
+        raise ValueError(f"不支持的标签图编码: {encoding}，可选 {', '.join(LABEL_MAP_ENCODINGS)}")
+    return {"encoding": encoding, "height": int(label_map.shape[0]), "width": int(label_map.shape[1]), **body}
@@ -1,7 +1,12 @@
 from flask import Blueprint, request, jsonify
 import os, cv2, uuid, json, numpy as np, shutil, pymysql
 from PIL import Image
-from .utils import CustomPaddleSegPredictorFromDetConfig, get_extended_image_info, get_image_quality_metrics
+from services.persistence import persistence, PersistJob, history_input_job, history_record, result_job
+from .utils import get_extended_image_info, get_image_quality_metrics
+from .label_maps import class_statistics, build_palette, save_palettized_png, encode_label_map, LABEL_MAP_ENCODINGS
+from .responses import json_response
+from config import LABEL_MAP_ENCODING_DEFAULT
+from .model_registry import registry, land_segmentation_key
 
 land_segmentation_bp = Blueprint('land_segmentation', __name__)
 
@@ -20,14 +25,7 @@ CLASS_COLOR_MAP = {
     6: [255, 0, 255]    # 其他 - 紫色
 }
 CLASS_NAMES = {0: "背景", 1: "建筑", 2: "道路", 3: "水体", 4: "植被", 5: "耕地", 6: "其他"}
-
-try:
-    # !!注意：请确保 "models/land_segmentation_model/" 是您地物分割模型的正确路径
-    predictor_ls = CustomPaddleSegPredictorFromDetConfig("models/land_segmentation/")
-    print("地物分割模型加载成功！")
-except Exception as e:
-    print(f"加载地物分割模型失败: {e}")
-    predictor_ls = None
+CLASS_PALETTE = build_palette(CLASS_COLOR_MAP)
 
 @land_segmentation_bp.route('/upload_and_analyze_single', methods=['POST'])
 def upload_and_analyze_single():
@@ -46,7 +44,6 @@ def upload_and_analyze_single():
 @land_segmentation_bp.route('/predict', methods=['POST'])
 def predict_land_segmentation():
     print("\n--- [DEBUG] 进入 predict_land_segmentation 接口 ---")
-    temp_path = None  # 初始化变量
     try:
         if 'file' not in request.files:
             print("[DEBUG] 错误: 请求中没有找到 'file'")
@@ -60,19 +57,28 @@ def predict_land_segmentation():
 
         threshold = request.form.get('threshold', 0.5, type=float)
         model_name = request.form.get('model', 'ppliteseg')
-        print(f"[DEBUG] 参数: threshold={threshold}, model={model_name}")
-
-        ext = os.path.splitext(file.filename)[1]
-        temp_path = os.path.join(TEMP_FOLDER, f"{uuid.uuid4()}{ext}")
-        file.save(temp_path)
-        print(f"[DEBUG] 文件已保存到临时路径: {temp_path}")
-
+        # 标签图的返回编码：png / rle / bitmask 内嵌在响应中，url 返回单独下载的灰度 PNG，none 不返回
+        encoding = request.form.get('label_map_encoding') or request.args.get('label_map_encoding') \
+            or LABEL_MAP_ENCODING_DEFAULT
+        if encoding not in LABEL_MAP_ENCODINGS + ('url', 'none'):
+            return jsonify({"error": f"不支持的标签图编码: {encoding}"}), 400
+        print(f"[DEBUG] 参数: threshold={threshold}, model={model_name}, label_map_encoding={encoding}")
+
+        # 直接在内存中处理上传的字节，不再落盘到临时文件再读回
+        image_bytes = file.read()
+        print(f"[DEBUG] 已读取上传文件: {len(image_bytes)} 字节")
+
+        # 'model' 字段选择地物分割模型变体，注册表按内存预算决定哪些变体常驻
+        model_key = land_segmentation_key(model_name)
+        if not model_key:
+            return jsonify({"error": f"不支持的模型: {model_name}"}), 400
+        predictor_ls = registry.get(model_key)
         if not predictor_ls:
             print("[DEBUG] 致命错误: 模型未加载")
             return jsonify({"error": "地物分割模型未加载"}), 500
 
         print("[DEBUG] 开始调用模型进行预测...")
-        result = predictor_ls.predict(temp_path)
+        result = predictor_ls.predict(image_bytes)
         print("[DEBUG] 模型预测完成。")
 
         # 检查预测结果是否符合预期
@@ -85,59 +91,46 @@ def predict_land_segmentation():
 
         # --- 计算指标 ---
         print("[DEBUG] 开始计算指标...")
-        metrics_data = []
-        total_pixels = label_map.size
-        for class_id, class_name in CLASS_NAMES.items():
-            if class_id == 0: continue
-            pixel_count = np.sum(label_map == class_id)
-            area_m2 = round(pixel_count * 0.5 * 0.5, 2)
-            percentage = round((pixel_count / total_pixels) * 100, 2) if total_pixels > 0 else 0
-            metrics_data.append({"class_name": class_name, "area_m2": area_m2, "percentage": percentage})
+        # 一次直方图统计得到所有类别的像素数，不再逐类别扫描整幅标签图
+        metrics_data = [{"class_name": s["class_name"], "area_m2": s["area_m2"], "percentage": s["percentage"]}
+                        for s in class_statistics(label_map, CLASS_NAMES, pixel_area_m2=0.5 * 0.5)]
         print("[DEBUG] 指标计算完成。")
 
         # --- 生成结果图 ---
         print("[DEBUG] 开始生成彩色结果图...")
-        color_map_image = np.zeros((label_map.shape[0], label_map.shape[1], 3), dtype=np.uint8)
-        for class_id, color in CLASS_COLOR_MAP.items():
-            color_map_image[label_map == class_id] = color
-        result_filename = f"{uuid.uuid4()}.png"
-        result_path_full = os.path.join(RESULT_FOLDER, result_filename)
-        cv2.imwrite(result_path_full, color_map_image)
-        print(f"[DEBUG] 结果图已保存到: {result_path_full}")
-
-        # --- 保存历史记录 ---
-        print("[DEBUG] 开始保存历史记录到数据库...")
-        final_input_path = os.path.join(HISTORY_INPUT_FOLDER, os.path.basename(temp_path))
-        shutil.copy(temp_path, final_input_path)
-        db_conn = pymysql.connect(host='127.0.0.1', port=3306, user='root', password='root', db='EndJob',
-                                  charset='utf8')
-        cursor = db_conn.cursor()
+        # 标签图直接保存为调色板 PNG，颜色与原先逐类别填色后 cv2.imwrite 的结果一致
+        # 按标签图内容寻址，同一张图重复分割时复用已有的结果图
+        result_path_full, result_file = result_job(
+            'land_segmentation', [CLASS_PALETTE, label_map],
+            lambda path: save_palettized_png(label_map, CLASS_PALETTE, path))
+
+        # --- 保存历史记录：结果图、输入图和数据库记录都交给后台写回队列 ---
+        final_input_path, input_file = history_input_job(image_bytes)
         metrics_str = json.dumps(metrics_data)
-        sql = "INSERT INTO history_records (task_type, result_url, before_image_url, detection_metrics_json) VALUES (%s, %s, %s, %s)"
-        cursor.execute(sql, ('地物分割', result_path_full.replace('\\', '/'), final_input_path.replace('\\', '/'),
-                             metrics_str))
-        db_conn.commit()
-        cursor.close()
-        db_conn.close()
-        print("[DEBUG] 历史记录保存成功。")
-
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
-            print(f"[DEBUG] 临时文件 {temp_path} 已删除。")
+        sql, params = history_record('地物分割', result_path_full, final_input_path, metrics_str)
+        persistence.submit(PersistJob([result_file, input_file], sql, params))
+        print(f"[DEBUG] 结果图与历史记录已提交后台写入: {result_path_full}")
+
+        if encoding == 'none':
+            raw_label_map = None
+        elif encoding == 'url':
+            label_map_path, label_map_file = result_job(
+                'label_map', [label_map], lambda path: cv2.imwrite(path, label_map.astype(np.uint8, copy=False)))
+            persistence.submit(PersistJob([label_map_file]))
+            raw_label_map = {"encoding": "url", "height": int(label_map.shape[0]), "width": int(label_map.shape[1]),
+                             "url": request.host_url + label_map_path.replace('\\', '/')}
+        else:
+            raw_label_map = encode_label_map(label_map, encoding)
 
         print("[DEBUG] 接口处理成功，准备返回结果。")
-        return jsonify({
+        return json_response({
             "result_url": request.host_url + result_path_full.replace('\\', '/'),
             "detection_metrics": metrics_data,
-            "raw_label_map": label_map.tolist()
+            "raw_label_map": raw_label_map
         })
     except Exception as e:
         print(f"\n !!! [DEBUG] 发生严重错误 !!!")
         import traceback
         traceback.print_exc()  # 这会打印出完整的错误堆栈信息
 
-        if temp_path and os.path.exists(temp_path):
-            os.remove(temp_path)
-            print(f"[DEBUG] 发生错误后，临时文件 {temp_path} 已删除。")
-
         return jsonify({"error": f"分割过程中发生错误: {str(e)}"}), 500
\ No newline at end of file
@@ -1,17 +1,28 @@
 from flask import Blueprint, request, jsonify
 from pydantic import BaseModel, ValidationError, Field
 from typing import Optional
-import math, requests, io, os, uuid
-from PIL import Image
-from config import TEMP_FOLDER
+import math
+import cv2
+import numpy as np
 from services.analysis_service import perform_road_extraction_analysis, perform_object_detection, perform_change_detection, perform_land_segmentation
-from .road_extraction import predictor_road
-from .object_detection import predictor_obj # 导入其他模块的函数
-from .change_detection import predictor
-from .land_segmentation import predictor_ls
+from .model_registry import registry
+from .detection import DetectionParams, load_label_list
+from .responses import json_response
+from .tile_fetcher import TileFetcher
+from .tile_cache import DiskTileCache
+from config import (TILE_FETCH_WORKERS, TILE_FETCH_PER_HOST, TILE_FETCH_TIMEOUT_S, TILE_FETCH_RETRIES,
+                    TILE_CACHE_ENABLED, TILE_CACHE_FOLDER, TILE_CACHE_MAX_MB, TILE_CACHE_TTL_S,
+                    MAP_PLAN_MAX_TILES, MAP_PLAN_MAX_PIXELS, MAP_PLAN_TIME_BUDGET_S, MAP_PLAN_MIN_SCALE,
+                    MAP_PLAN_MAX_ZOOM_DROP, MAP_PLAN_MAX_SUB_JOBS, MAP_PLAN_TILE_SECONDS, MAP_PLAN_SECONDS_PER_MPIX)
 
 map_analysis_bp = Blueprint('map_analysis', __name__)
 
+# 所有请求共用的瓦片下载器（长连接池 + 下载线程池 + 本地磁盘瓦片缓存）
+tile_fetcher = TileFetcher(max_workers=TILE_FETCH_WORKERS, per_host=TILE_FETCH_PER_HOST,
+                           timeout=TILE_FETCH_TIMEOUT_S, retries=TILE_FETCH_RETRIES,
+                           cache=DiskTileCache(TILE_CACHE_FOLDER, max_bytes=TILE_CACHE_MAX_MB * 1024 * 1024,
+                                               ttl_s=TILE_CACHE_TTL_S) if TILE_CACHE_ENABLED else None)
+
 
 # --- Pydantic 输入验证模型 ---
 class Coordinate(BaseModel):
@@ -24,6 +35,10 @@ class SingleImagePayload(BaseModel):
     northEast: Coordinate
     zoom: int
     tileUrlTemplate: str
+    # 目标检测可选的后处理参数
+    scoreThreshold: Optional[float] = None
+    classThresholds: Optional[dict[str, float]] = None
+    nmsIou: Optional[float] = None
 
 class ChangeDetectionPayload(BaseModel):
     task_type: str
@@ -36,60 +51,202 @@ class ChangeDetectionPayload(BaseModel):
 
 # --- 瓦片计算与拼接核心函数 ---
 
-def deg2num(lat_deg, lon_deg, zoom):
-    """将经纬度转换为瓦片编号"""
-    lat_rad = math.radians(lat_deg)
-    n = 2.0 ** zoom
-    xtile = int((lon_deg + 180.0) / 360.0 * n)
-    ytile = int((1.0 - math.asinh(math.tan(lat_rad)) / math.pi) / 2.0 * n)
-    return (xtile, ytile)
+TILE_SIZE = 256  # 高德瓦片是256x256
 
 
-def fetch_and_stitch_tiles(sw, ne, zoom, url_template):
-    """根据边界坐标和缩放等级，下载并拼接瓦片"""
+def deg2num_frac(lat_deg, lon_deg, zoom):
+    """将经纬度转换为 Web 墨卡托下的连续瓦片坐标，小数部分是点在瓦片内的位置。"""
+    lat_rad = math.radians(lat_deg)
+    n = 2.0 ** zoom
+    x = (lon_deg + 180.0) / 360.0 * n
+    y = (1.0 - math.asinh(math.tan(lat_rad)) / math.pi) / 2.0 * n
+    return (x, y)
 
-    # 1. 计算需要下载的瓦片范围
-    xtile_sw, ytile_sw = deg2num(sw.lat, sw.lng, zoom)
-    xtile_ne, ytile_ne = deg2num(ne.lat, ne.lng, zoom)
 
-    # 确保范围正确
-    min_x, max_x = sorted((xtile_sw, xtile_ne))
-    min_y, max_y = sorted((ytile_sw, ytile_ne))
+def deg2num(lat_deg, lon_deg, zoom):
+    """将经纬度转换为瓦片编号"""
+    x, y = deg2num_frac(lat_deg, lon_deg, zoom)
+    return (int(x), int(y))
 
-    # 2. 下载所有瓦片
-    tile_images = {}
-    gaode_url_template = "https://webst02.is.autonavi.com/appmaptile?style=6&x={x}&y={y}&z={z}"
 
-    print(f"准备下载 {max_x - min_x + 1} x {max_y - min_y + 1} 个瓦片...")
-    for x in range(min_x, max_x + 1):
-        for y in range(min_y, max_y + 1):
-            url = url_template.format(s=2, x=x, y=y, z=zoom)
+def num2deg(x, y, zoom):
+    """连续瓦片坐标转换为经纬度 (lat, lng)，deg2num_frac 的逆运算。"""
+    n = 2.0 ** zoom
+    return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n)))), x / n * 360.0 - 180.0
+
+
+def pixel_bounds(sw, ne, zoom, tile_size=TILE_SIZE):
+    """经纬度矩形在该缩放等级全球像素坐标中的范围 (left, top, right, bottom)，左上含、右下不含。"""
+    x_sw, y_sw = deg2num_frac(sw.lat, sw.lng, zoom)
+    x_ne, y_ne = deg2num_frac(ne.lat, ne.lng, zoom)
+    left, right = sorted((x_sw * tile_size, x_ne * tile_size))
+    top, bottom = sorted((y_sw * tile_size, y_ne * tile_size))
+    left, top = math.floor(left), math.floor(top)
+    # 至少保留 1 个像素
+    return left, top, max(math.ceil(right), left + 1), max(math.ceil(bottom), top + 1)
+
+
+def _tile_writer(mosaic, bounds, x, y, tile_size):
+    """返回在下载线程中执行的解码函数：把瓦片解码后只把与裁剪范围相交的部分写入预先分配的拼图数组。"""
+    left, top, right, bottom = bounds
+
+    def write(content):
+        tile = cv2.imdecode(np.frombuffer(content, np.uint8), cv2.IMREAD_COLOR)
+        if tile is None:
+            raise ValueError("无法解码瓦片")
+        if tile.shape[:2] != (tile_size, tile_size):
+            tile = cv2.resize(tile, (tile_size, tile_size), interpolation=cv2.INTER_AREA)
+        tx0, ty0 = x * tile_size, y * tile_size
+        x0, x1 = max(left, tx0), min(right, tx0 + tile_size)
+        y0, y1 = max(top, ty0), min(bottom, ty0 + tile_size)
+        # 各瓦片写入的区域互不重叠，多个下载线程可以同时写同一个数组
+        mosaic[y0 - top:y1 - top, x0 - left:x1 - left] = tile[y0 - ty0:y1 - ty0, x0 - tx0:x1 - tx0]
+        return True
+    return write
+
+
+def fetch_and_stitch_many(sw, ne, zoom, url_templates):
+    """
+    同一范围、多个瓦片源（如变化检测的前后两期）一起下载：所有瓦片同时提交给共享的下载器，
+    按主机限制并发，下载和解码并行进行。
+
+    结果精确裁剪到 southWest / northEast 对应的像素范围（而不是覆盖它的整块瓦片），每个瓦片解码后直接写入
+    预先按裁剪尺寸分配的 BGR numpy 数组，不再构建整块瓦片大小的 PIL 画布。
+    返回与 url_templates 一一对应的 (H, W, 3) BGR uint8 数组，某个源失败时对应位置为 None。
+    """
+
+    # 1. 计算裁剪范围和需要下载的瓦片范围
+    bounds = left, top, right, bottom = pixel_bounds(sw, ne, zoom)
+    min_x, max_x = left // TILE_SIZE, (right - 1) // TILE_SIZE
+    min_y, max_y = top // TILE_SIZE, (bottom - 1) // TILE_SIZE
+    tiles = [(x, y) for x in range(min_x, max_x + 1) for y in range(min_y, max_y + 1)]
+
+    # 2. 并发下载所有瓦片，解码结果直接写入各自的拼图数组
+    print(f"准备下载 {len(url_templates)} x {max_x - min_x + 1} x {max_y - min_y + 1} 个瓦片，"
+          f"裁剪为 {right - left} x {bottom - top} 像素...")
+    mosaics, futures = [], []
+    for url_template in url_templates:
+        mosaic = np.zeros((bottom - top, right - left, 3), dtype=np.uint8)
+        mosaics.append(mosaic)
+        futures.append([tile_fetcher.fetch_tile(url_template, zoom, x, y, _tile_writer(mosaic, bounds, x, y, TILE_SIZE))
+                        for x, y in tiles])
+
+    # 3. 等待每个瓦片源完成；任一瓦片出错则该源失败，缺失(非 200)的瓦片留黑
+    results = []
+    for mosaic, tile_futures in zip(mosaics, futures):
+        written = 0
+        for (x, y), future in zip(tiles, tile_futures):
             try:
-                response = requests.get(url, timeout=5)
-                if response.status_code == 200:
-                    tile_images[(x, y)] = Image.open(io.BytesIO(response.content))
+                written += bool(future.result())
             except Exception as e:
                 print(f"下载瓦片 (x={x}, y={y}, z={zoom}) 失败: {e}")
-                return None
+                written = 0
+                for other in tile_futures:
+                    other.cancel()
+                break
+        results.append(mosaic if written else None)
+    return results
 
-    if not tile_images:
-        return None
 
-    # 3. 拼接瓦片
-    tile_size = 256  # 高德瓦片是256x256
-    width = (max_x - min_x + 1) * tile_size
-    height = (max_y - min_y + 1) * tile_size
-
-    stitched_image = Image.new('RGB', (width, height))
-
-    for x in range(min_x, max_x + 1):
-        for y in range(min_y, max_y + 1):
-            if (x, y) in tile_images:
-                paste_x = (x - min_x) * tile_size
-                paste_y = (y - min_y) * tile_size
-                stitched_image.paste(tile_images[(x, y)], (paste_x, paste_y))
-
-    return stitched_image
+def fetch_and_stitch_tiles(sw, ne, zoom, url_template):
+    """根据边界坐标和缩放等级，下载瓦片并拼接、裁剪成 BGR 数组"""
+    return fetch_and_stitch_many(sw, ne, zoom, [url_template])[0]
+
+
+# --- 计算预算规划 ---
+
+def _tile_count(bounds):
+    left, top, right, bottom = bounds
+    return ((right - 1) // TILE_SIZE - left // TILE_SIZE + 1) * ((bottom - 1) // TILE_SIZE - top // TILE_SIZE + 1)
+
+
+def _seconds_per_tile():
+    """按下载器实测的单次请求网络耗时（不含主机信号量排队）和单主机并发数估算每个瓦片摊到的下载秒数。"""
+    stats = tile_fetcher.stats()
+    latency = stats["seconds"] / stats["requests"] if stats["requests"] else MAP_PLAN_TILE_SECONDS
+    return latency / tile_fetcher.per_host
+
+
+def _make_plan(mode, sw, ne, requested_zoom, zoom, bounds, tiles, scale, seconds):
+    left, top, right, bottom = bounds
+    center_lat = math.radians((sw.lat + ne.lat) / 2)
+    return {
+        "mode": mode,
+        "requested_zoom": requested_zoom,
+        "zoom": zoom,
+        "scale": round(scale, 4),
+        "tiles": tiles,
+        # 送入模型的影像尺寸；origin 为影像左上角在该缩放等级全球像素坐标中的位置，前端据此把结果像素映射回经纬度
+        "width": max(1, round((right - left) * scale)),
+        "height": max(1, round((bottom - top) * scale)),
+        "origin": [left, top],
+        "meters_per_pixel": round(156543.03392804097 * math.cos(center_lat) / 2 ** zoom / scale, 3),
+        "estimated_seconds": round(seconds, 1),
+        "sub_jobs": [],
+    }
+
+
+def plan_extent(sw, ne, zoom, task_type, sources=1, allow_split=True):
+    """
+    在下载任何瓦片之前，按 Web 墨卡托算出各缩放等级下的瓦片数和像素数，选出满足计算预算的分析方案：
+    依次尝试请求的缩放等级、把影像缩小（不低于 MAP_PLAN_MIN_SCALE 倍）、降低缩放等级（最多 MAP_PLAN_MAX_ZOOM_DROP 级），
+    取第一个同时满足瓦片数、像素数和预计耗时预算的方案，mode 为 'direct' / 'downsample' / 'zoom'。
+
+    都不满足时 mode 为 'split'，sub_jobs 给出按请求缩放等级等分的子区域（每个子区域单独请求都在预算内），
+    子区域数超过 MAP_PLAN_MAX_SUB_JOBS 时 mode 为 'reject'。sources 为瓦片源数（变化检测为 2）。
+    """
+    seconds_per_mpix = MAP_PLAN_SECONDS_PER_MPIX.get(task_type, max(MAP_PLAN_SECONDS_PER_MPIX.values()))
+    seconds_per_tile = _seconds_per_tile()
+
+    for z in range(zoom, max(zoom - MAP_PLAN_MAX_ZOOM_DROP, 0) - 1, -1):
+        bounds = left, top, right, bottom = pixel_bounds(sw, ne, z)
+        tiles = _tile_count(bounds) * sources
+        if tiles > MAP_PLAN_MAX_TILES:
+            continue
+        mpix = (right - left) * (bottom - top) / 1e6
+        download_s = tiles * seconds_per_tile
+        # 推理耗时与像素数成正比：像素预算和剩余的时间预算各自决定一个允许的最大缩放比例
+        scale = min(1.0, math.sqrt(MAP_PLAN_MAX_PIXELS / 1e6 / mpix),
+                    math.sqrt(max(MAP_PLAN_TIME_BUDGET_S - download_s, 0) / (mpix * seconds_per_mpix)))
+        if scale < MAP_PLAN_MIN_SCALE:
+            continue
+        mode = 'downsample' if scale < 1 else ('zoom' if z < zoom else 'direct')
+        return _make_plan(mode, sw, ne, zoom, z, bounds, tiles, scale,
+                          download_s + mpix * scale ** 2 * seconds_per_mpix)
+
+    bounds = left, top, right, bottom = pixel_bounds(sw, ne, zoom)
+    tiles = _tile_count(bounds) * sources
+    plan = _make_plan('reject', sw, ne, zoom, zoom, bounds, tiles, 1.0,
+                      tiles * seconds_per_tile + (right - left) * (bottom - top) / 1e6 * seconds_per_mpix)
+    if not allow_split:
+        return plan
+
+    # 按请求的缩放等级把范围等分成 k x k 个子区域，找出每个子区域都能在预算内完成的最小 k
+    k = 2
+    while k * k <= MAP_PLAN_MAX_SUB_JOBS:
+        xs = [left + (right - left) * i / k for i in range(k + 1)]
+        ys = [top + (bottom - top) * j / k for j in range(k + 1)]
+        sub_jobs = []
+        for j in range(k):
+            for i in range(k):
+                south, west = num2deg(xs[i] / TILE_SIZE, ys[j + 1] / TILE_SIZE, zoom)
+                north, east = num2deg(xs[i + 1] / TILE_SIZE, ys[j] / TILE_SIZE, zoom)
+                sub_jobs.append({"southWest": Coordinate(lat=south, lng=west),
+                                 "northEast": Coordinate(lat=north, lng=east)})
+        if all(plan_extent(job["southWest"], job["northEast"], zoom, task_type, sources, allow_split=False)["mode"]
+               != 'reject' for job in sub_jobs):
+            plan["mode"] = 'split'
+            plan["sub_jobs"] = [{name: coord.model_dump() for name, coord in job.items()} for job in sub_jobs]
+            return plan
+        k += 1
+    return plan
+
+
+def apply_plan(image, plan):
+    """按方案把拼接好的影像缩放到送入模型的尺寸。"""
+    if plan["scale"] >= 1:
+        return image
+    return cv2.resize(image, (plan["width"], plan["height"]), interpolation=cv2.INTER_AREA)
 
 
 @map_analysis_bp.route('/predict_from_coords', methods=['POST'])
@@ -106,58 +263,55 @@ def predict_from_coords():
             payload = ChangeDetectionPayload.model_validate(data)
         else:
             payload = SingleImagePayload.model_validate(data)
+            # 目标检测的后处理参数与 /api/object_detection/predict 使用同一套校验（取值范围、类别名）
+            det_params = DetectionParams.model_validate(
+                {"score_threshold": payload.scoreThreshold, "class_thresholds": payload.classThresholds,
+                 "nms_iou": payload.nmsIou},
+                context={"labels": load_label_list(registry.model_dir('object_detection'))})
     except ValidationError as e:
-        return jsonify({"error": "请求数据格式错误", "details": e.errors()}), 400
+        return jsonify({"error": "请求数据格式错误",
+                        "details": e.errors(include_url=False, include_context=False)}), 400
 
     analysis_result = None
 
+    # 下载前先按计算预算确定缩放等级和缩放比例，范围过大时拒绝并返回拆分建议
+    plan = plan_extent(payload.southWest, payload.northEast, payload.zoom, task_type,
+                       sources=2 if task_type == 'change_detection' else 1)
+    if plan["mode"] == 'split':
+        return jsonify({"error": f"所选区域过大（{plan['tiles']} 个瓦片），请拆分为 {len(plan['sub_jobs'])} 个子区域分别分析",
+                        "plan": plan}), 413
+    if plan["mode"] == 'reject':
+        return jsonify({"error": "所选区域过大，超出单次分析的计算预算，请缩小范围", "plan": plan}), 413
+
     try:
         if task_type == 'change_detection':
-            # 下载两张影像并保存临时文件
-            image_a = fetch_and_stitch_tiles(payload.southWest, payload.northEast, payload.zoom, payload.beforeTileUrl)
-            image_b = fetch_and_stitch_tiles(payload.southWest, payload.northEast, payload.zoom, payload.afterTileUrl)
+            # 前后两期影像的瓦片一起并发下载，拼接裁剪后的 BGR 数组直接传给服务函数，不再经过临时文件
+            image_a, image_b = fetch_and_stitch_many(payload.southWest, payload.northEast, plan["zoom"],
+                                                     [payload.beforeTileUrl, payload.afterTileUrl])
 
             if image_a is None or image_b is None:
                 return jsonify({"error": "从地图服务获取影像失败"}), 500
 
-            temp_path_a = os.path.join(TEMP_FOLDER, f"{uuid.uuid4()}_a.png")
-            temp_path_b = os.path.join(TEMP_FOLDER, f"{uuid.uuid4()}_b.png")
-            image_a.save(temp_path_a)
-            image_b.save(temp_path_b)
-
-            # 注意这里是两个路径传入
-
-            try:
-                image_a.save(temp_path_a)
-                image_b.save(temp_path_b)
-                analysis_result = perform_change_detection(temp_path_a, temp_path_b, predictor)
-            finally:
-                if os.path.exists(temp_path_a):
-                    os.remove(temp_path_a)
-                if os.path.exists(temp_path_b):
-                    os.remove(temp_path_b)
+            analysis_result = perform_change_detection(apply_plan(image_a, plan), apply_plan(image_b, plan),
+                                                       registry.get('change_detection'))
 
         else:
             # 单图分析（道路或目标检测）
-            stitched_image = fetch_and_stitch_tiles(payload.southWest, payload.northEast, payload.zoom,
+            stitched_image = fetch_and_stitch_tiles(payload.southWest, payload.northEast, plan["zoom"],
                                                     payload.tileUrlTemplate)
             if stitched_image is None:
                 return jsonify({"error": "从地图服务获取影像失败"}), 500
 
-            temp_path = os.path.join(TEMP_FOLDER, f"{uuid.uuid4()}.png")
-
-            try:
-                stitched_image.save(temp_path)
-                if payload.task_type == 'road_extraction':
-                    analysis_result = perform_road_extraction_analysis(temp_path, predictor_road)
-                elif payload.task_type == 'object_detection':
-                    analysis_result = perform_object_detection(temp_path, predictor_obj)
-                elif task_type == 'land_segmentation':
-                    analysis_result = perform_land_segmentation(temp_path, predictor_ls)
-            finally:
-                # 确保单图分析的临时文件也被清理
-                if os.path.exists(temp_path):
-                    os.remove(temp_path)
+            image = apply_plan(stitched_image, plan)
+            if payload.task_type == 'road_extraction':
+                analysis_result = perform_road_extraction_analysis(image, registry.get('road_extraction'))
+            elif payload.task_type == 'object_detection':
+                analysis_result = perform_object_detection(image, registry.get('object_detection'),
+                                                           score_threshold=det_params.score_threshold,
+                                                           class_thresholds=det_params.class_thresholds,
+                                                           nms_iou=det_params.nms_iou)
+            elif task_type == 'land_segmentation':
+                analysis_result = perform_land_segmentation(image, registry.get('land_segmentation'))
 
         # --- 统一结果返回逻辑 ---
         if analysis_result and analysis_result.get("success"):
@@ -168,9 +322,10 @@ def predict_from_coords():
                 "message": f"{task_type} 分析成功！",
                 "result_url": full_result_url,
                 "detection_metrics": analysis_result.get("metrics"),
-                "raw_results": analysis_result.get("raw_results")
+                "raw_results": analysis_result.get("raw_results"),
+                "plan": plan
             }
-            return jsonify(final_response)
+            return json_response(final_response)
         else:
             error_msg = analysis_result.get("error", "未知错误") if analysis_result else "服务函数未返回任何结果"
             return jsonify({"error": f"执行分析任务时发生错误: {error_msg}"}), 500
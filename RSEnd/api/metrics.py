@@ -0,0 +1,83 @@
+import numpy as np
+
+
+def confusion_matrix(pred, label, num_classes):
+    """像素级混淆矩阵 (num_classes, num_classes)，行是真值、列是预测；超出类别范围的像素不计入。"""
+    pred = np.asarray(pred, dtype=np.int64).ravel()
+    label = np.asarray(label, dtype=np.int64).ravel()
+    valid = (label >= 0) & (label < num_classes) & (pred >= 0) & (pred < num_classes)
+    return np.bincount(label[valid] * num_classes + pred[valid],
+                       minlength=num_classes * num_classes).reshape(num_classes, num_classes)
+
+
+def mean_iou(cm):
+    """由混淆矩阵计算 mIoU，只对真值或预测中出现过的类别求平均。"""
+    inter = np.diag(cm).astype(np.float64)
+    union = cm.sum(axis=0) + cm.sum(axis=1) - inter
+    present = union > 0
+    return float((inter[present] / union[present]).mean()) if present.any() else 1.0
+
+
+def f1_score(cm, positive=1):
+    """二分类（如变化/未变化）中 positive 类的 F1。"""
+    tp = float(cm[positive, positive])
+    fp = float(cm[:, positive].sum() - tp)
+    fn = float(cm[positive, :].sum() - tp)
+    return 2 * tp / (2 * tp + fp + fn) if tp + fp + fn > 0 else 1.0
+
+
+def average_precision(recall, precision):
+    """VOC 的全点插值 AP。"""
+    recall = np.concatenate([[0.0], recall, [1.0]])
+    precision = np.concatenate([[0.0], precision, [0.0]])
+    precision = np.maximum.accumulate(precision[::-1])[::-1]
+    idx = np.flatnonzero(recall[1:] != recall[:-1])
+    return float(np.sum((recall[idx + 1] - recall[idx]) * precision[idx + 1]))
+
+
+def _box_iou(box, boxes):
+    w = np.maximum(np.minimum(box[2], boxes[:, 2]) - np.maximum(box[0], boxes[:, 0]), 0)
+    h = np.maximum(np.minimum(box[3], boxes[:, 3]) - np.maximum(box[1], boxes[:, 1]), 0)
+    inter = w * h
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return inter / np.maximum(area + areas - inter, 1e-9)
+
+
+def detection_map(predictions, ground_truths, num_classes, iou_threshold=0.5):
+    """
+    mAP@iou_threshold，对真值中出现过的类别求平均。
+
+    Args:
+        predictions: 每张图片的 DetectionResult（按分数排序匹配）。
+        ground_truths: 与 predictions 一一对应的 DetectionResult，分数不参与计算。
+    """
+    aps = []
+    for class_id in range(num_classes):
+        records, num_gt = [], 0
+        for image_id, (pred, gt) in enumerate(zip(predictions, ground_truths)):
+            num_gt += int(np.count_nonzero(gt.class_ids == class_id))
+            mask = pred.class_ids == class_id
+            records.extend((score, image_id, box) for score, box in zip(pred.scores[mask], pred.boxes[mask]))
+        if num_gt == 0:
+            continue
+        records.sort(key=lambda r: -r[0])
+        matched = {}
+        tp = np.zeros(len(records))
+        for i, (_, image_id, box) in enumerate(records):
+            gt = ground_truths[image_id]
+            gt_boxes = gt.boxes[gt.class_ids == class_id]
+            if gt_boxes.shape[0] == 0:
+                continue
+            ious = _box_iou(box, gt_boxes)
+            best = int(np.argmax(ious))
+            used = matched.setdefault(image_id, set())
+            if ious[best] >= iou_threshold and best not in used:
+                used.add(best)
+                tp[i] = 1
+        tp_cum = np.cumsum(tp)
+        recall = tp_cum / num_gt
+        precision = tp_cum / np.arange(1, len(records) + 1)
+        aps.append(average_precision(recall, precision) if records else 0.0)
+    return float(np.mean(aps)) if aps else 1.0
+
@@ -0,0 +1,312 @@
+import hashlib
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from flask import g, has_request_context
+
+from config import (DET_BATCH_MAX_SIZE, DET_BATCH_MAX_WAIT_MS, PREDICTOR_POOL_SIZE, SEG_TILE_SIZE, SEG_TILE_OVERLAP,
+                    DET_TILE_SIZE, DET_TILE_OVERLAP, DET_TILE_MERGE_IOU, DET_TILE_MIN_SCORE,
+                    MODEL_LOAD_WORKERS, MODEL_WARMUP_SIZE, MODEL_MEMORY_BUDGET_MB, MODEL_MEMORY_OVERHEAD,
+                    LAND_SEGMENTATION_MODELS, LAND_SEGMENTATION_DEFAULT)
+from .batching import BatchingQueue
+from .predictor_pool import PredictorPool
+from .runtime import resolve_profile, paddlers_kwargs, model_variant_dir
+from .tiling import TiledSegPredictor, TiledDetPredictor
+from .utils import CustomPaddleDetPredictor, CustomPaddleSegPredictor, CustomPaddleSegPredictorFromDetConfig
+
+
+class ModelEntry:
+    """注册表中的一个模型：构建函数、预热函数、当前的加载状态以及内存与使用统计。"""
+
+    def __init__(self, name, build, warmup=None, model_dir=None):
+        self.name = name
+        self.build = build
+        self.warmup = warmup
+        self.model_dir = model_dir
+        self.model = None
+        self.state = 'pending'  # pending -> loading -> ready / failed；ready 被淘汰后变为 evicted，再次使用时重新加载
+        self.error = None
+        self.load_seconds = None
+        self.memory_bytes = 0
+        self.last_used = 0.0
+        self.loads = 0
+        self.evictions = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+
+def estimate_model_memory(model_dir, copies=PREDICTOR_POOL_SIZE):
+    """
+    估算一个已加载模型的常驻内存：权重文件大小 × MODEL_MEMORY_OVERHEAD × 预测器副本数 copies。
+    clone() 出的副本虽共享权重，但各自持有独立的中间张量和推理工作区，且部分后端（如 TensorRT 引擎）
+    会按副本重复分配显存；按副本数线性放大是偏保守的上界，宁可早淘汰也不让预算失真。
+    不测量进程 RSS：多个模型同进程驻留时无法把 RSS 归到单个模型上。
+    """
+    if not model_dir or not os.path.isdir(model_dir):
+        return 0
+    weights = sum(os.path.getsize(os.path.join(model_dir, f)) for f in os.listdir(model_dir)
+                  if f.endswith('.pdiparams'))
+    return int(weights * MODEL_MEMORY_OVERHEAD * max(1, copies))
+
+
+def model_fingerprint(model_dir):
+    """
+    模型目录的版本指纹：目录下（含 int8/ 等子目录）所有文件的相对路径、大小和修改时间的哈希。
+    替换权重、重新量化/转换或修改 runtime.yml 都会改变指纹，结果缓存据此失效。只读取文件元数据，不读文件内容。
+    """
+    if not model_dir or not os.path.isdir(model_dir):
+        return 'none'
+    digest = hashlib.blake2b(digest_size=8)
+    for root, dirs, files in os.walk(model_dir):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            stat = os.stat(path)
+            digest.update(f"{os.path.relpath(path, model_dir)}:{stat.st_size}:{stat.st_mtime_ns};".encode('utf-8'))
+    return digest.hexdigest()
+
+
+class ModelRegistry:
+    """
+    集中的模型注册表。
+
+    模型在第一次 get() 时加载，或者由 warm_up_async() 在后台线程池中并行加载；加载完成后用代表性尺寸的
+    输入跑一次预热推理。status() 不会阻塞，健康检查可以在模型全部驻留之前就返回每个模型的就绪状态。
+
+    设置了 memory_budget_bytes 时，已驻留模型的估算内存之和超过预算后按最近最少使用(LRU)淘汰模型，
+    被淘汰的模型在下一次 get() 时重新加载。每个模型的加载、淘汰、命中次数都会记录下来，用于评估节点规格。
+
+    请求中通过 get() 取得的模型记为被该请求持有，请求结束时由 release_request()（注册为 Flask 的 teardown_request）
+    释放。淘汰仍被请求持有的模型时只把它从注册表中摘下，close() 推迟到最后一个持有它的请求结束后执行，
+    正在切窗推理的请求不会因批处理队列被关闭而失败。请求之外（脚本、预热）取得的模型不计入持有。
+    """
+
+    def __init__(self, max_workers=4, memory_budget_bytes=None):
+        self._entries = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="model-loader")
+        self.memory_budget_bytes = memory_budget_bytes
+        self._budget_lock = threading.Lock()
+        self._holders = {}  # id(模型) -> [模型, 持有它的请求数]
+        self._retired = set()  # 已被淘汰、等最后一个持有者释放后再关闭的模型 id
+        self._holders_lock = threading.Lock()
+
+    def register(self, name, build, warmup=None, model_dir=None):
+        self._entries[name] = ModelEntry(name, build, warmup, model_dir)
+
+    def get(self, name):
+        """返回已加载的模型；尚未加载时在当前线程加载（其他线程正在加载时等待其完成）。加载失败返回 None。"""
+        entry = self._entries[name]
+        # 读取模型和登记持有在同一把锁内完成，淘汰线程不会在两者之间关闭模型
+        with entry.lock:
+            entry.last_used = time.monotonic()
+            if entry.model is not None:
+                entry.hits += 1
+                return self._hold(entry.model)
+            entry.misses += 1
+        return self._load(entry, hold=True)
+
+    def release_request(self, exc=None):
+        """释放当前请求持有的模型；被淘汰的模型在最后一个持有者释放时关闭。"""
+        for model in g.pop('_registry_models', []):
+            with self._holders_lock:
+                holder = self._holders[id(model)]
+                holder[1] -= 1
+                if holder[1] > 0:
+                    continue
+                del self._holders[id(model)]
+                retired = id(model) in self._retired
+                self._retired.discard(id(model))
+            if retired:
+                self._close(model)
+
+    def warm_up_async(self, names=None):
+        """在后台线程池中并行加载并预热模型，立即返回。默认只预热各任务的主模型，不预热 'xxx:变体'。"""
+        for name in names or [n for n in self._entries if ':' not in n]:
+            self._executor.submit(self._load, self._entries[name])
+
+    def version(self, name):
+        """
+        模型当前的版本：模型目录指纹（见 model_fingerprint）加上实际使用的运行时 profile，不会触发加载。
+        通过 RUNTIME_PROFILE_OVERRIDES 切换到 int8 / onnxruntime 等 profile 时输出会变化，结果缓存也随之失效。
+        """
+        model_dir = self._entries[name].model_dir
+        fingerprint = model_fingerprint(model_dir)
+        if not model_dir or not os.path.isdir(model_dir):
+            return fingerprint
+        try:
+            profile_name, profile = resolve_profile(model_dir)
+        except KeyError:
+            return fingerprint
+        runtime = f"{profile_name}:{profile['device']}:{profile['backend']}:{profile['precision']}"
+        return f"{fingerprint}-{hashlib.blake2b(runtime.encode('utf-8'), digest_size=4).hexdigest()}"
+
+    def model_dir(self, name):
+        return self._entries[name].model_dir
+
+    def is_ready(self, name):
+        return self._entries[name].state == 'ready'
+
+    def resident_bytes(self):
+        return sum(entry.memory_bytes for entry in self._entries.values() if entry.state == 'ready')
+
+    def status(self):
+        return {name: {"state": entry.state, "error": entry.error, "load_seconds": entry.load_seconds,
+                       "memory_mb": round(entry.memory_bytes / 1024 / 1024, 1), "loads": entry.loads,
+                       "evictions": entry.evictions, "hits": entry.hits, "misses": entry.misses}
+                for name, entry in self._entries.items()}
+
+    def usage(self):
+        """整体内存占用与预算，配合 status() 中每个模型的计数用于节点容量规划。"""
+        budget = self.memory_budget_bytes
+        return {"resident_mb": round(self.resident_bytes() / 1024 / 1024, 1),
+                "budget_mb": round(budget / 1024 / 1024, 1) if budget else None,
+                "loads": sum(e.loads for e in self._entries.values()),
+                "evictions": sum(e.evictions for e in self._entries.values()),
+                "hits": sum(e.hits for e in self._entries.values()),
+                "misses": sum(e.misses for e in self._entries.values())}
+
+    def _hold(self, model):
+        if model is None or not has_request_context():
+            return model
+        with self._holders_lock:
+            self._holders.setdefault(id(model), [model, 0])[1] += 1
+        g.setdefault('_registry_models', []).append(model)
+        return model
+
+    def _load(self, entry, hold=False):
+        with entry.lock:
+            if entry.state == 'ready':
+                return self._hold(entry.model) if hold else entry.model
+            if entry.state == 'failed':
+                return None
+            entry.state = 'loading'
+            start = time.perf_counter()
+            try:
+                model = entry.build()
+                if entry.warmup:
+                    entry.warmup(model)
+                entry.model = model
+                entry.memory_bytes = estimate_model_memory(entry.model_dir)
+                entry.load_seconds = round(time.perf_counter() - start, 2)
+                entry.loads += 1
+                entry.last_used = time.monotonic()
+                entry.state = 'ready'
+                if hold:
+                    self._hold(model)
+                print(f"模型 {entry.name} 加载并预热完成，用时 {entry.load_seconds}s")
+            except Exception as e:
+                entry.error = str(e)
+                entry.state = 'failed'
+                print(f"加载模型 {entry.name} 失败: {e}")
+                traceback.print_exc()
+                return None
+        self._enforce_budget(keep=entry)
+        return model
+
+    def _enforce_budget(self, keep):
+        """驻留内存超过预算时，按 last_used 从旧到新淘汰模型，刚加载的 keep 不参与淘汰。"""
+        if not self.memory_budget_bytes:
+            return
+        with self._budget_lock:
+            candidates = sorted((e for e in self._entries.values() if e.state == 'ready' and e is not keep),
+                                key=lambda e: e.last_used)
+            for entry in candidates:
+                if self.resident_bytes() <= self.memory_budget_bytes:
+                    return
+                self._evict(entry)
+
+    def _evict(self, entry):
+        with entry.lock:
+            if entry.state != 'ready':
+                return
+            model, entry.model = entry.model, None
+            entry.state = 'evicted'
+            entry.evictions += 1
+            # 仍被请求持有的模型推迟到最后一个持有者释放时再关闭，请求结束后内存随引用释放
+            with self._holders_lock:
+                in_use = id(model) in self._holders
+                if in_use:
+                    self._retired.add(id(model))
+        if not in_use:
+            self._close(model)
+        print(f"内存预算不足，已淘汰模型 {entry.name}")
+
+    @staticmethod
+    def _close(model):
+        # 带后台线程的包装器（如批处理队列）需要显式关闭
+        if hasattr(model, 'close'):
+            model.close()
+
+
+def _dummy_image(name):
+    size = MODEL_WARMUP_SIZE[name]
+    return np.zeros((size, size, 3), dtype=np.uint8)
+
+
+def _build_object_detection():
+    pool = PredictorPool(CustomPaddleDetPredictor("models/object_detection/"), size=PREDICTOR_POOL_SIZE)
+    # 并发请求统一经过微批处理队列，每个预测器副本对应一个后台线程合并推理
+    batcher = BatchingQueue(pool, max_batch_size=DET_BATCH_MAX_SIZE, max_wait_ms=DET_BATCH_MAX_WAIT_MS,
+                            num_workers=PREDICTOR_POOL_SIZE)
+    # 大图按原始分辨率切窗检测，窗口经批处理队列成批推理后合并
+    return TiledDetPredictor(batcher, tile_size=DET_TILE_SIZE, overlap=DET_TILE_OVERLAP,
+                             batch_size=DET_BATCH_MAX_SIZE, merge_iou=DET_TILE_MERGE_IOU,
+                             min_score=DET_TILE_MIN_SCORE)
+
+
+def _build_road_extraction():
+    # 大图自动切块推理，各窗口在预测器池的多个副本上并行执行
+    return TiledSegPredictor(
+        PredictorPool(CustomPaddleSegPredictor("models/road_extraction/"), size=PREDICTOR_POOL_SIZE),
+        tile_size=SEG_TILE_SIZE, overlap=SEG_TILE_OVERLAP, max_workers=PREDICTOR_POOL_SIZE)
+
+
+def _land_segmentation_builder(model_dir):
+    return lambda: TiledSegPredictor(
+        PredictorPool(CustomPaddleSegPredictorFromDetConfig(model_dir), size=PREDICTOR_POOL_SIZE),
+        tile_size=SEG_TILE_SIZE, overlap=SEG_TILE_OVERLAP, max_workers=PREDICTOR_POOL_SIZE)
+
+
+def land_segmentation_key(variant=None):
+    """把前端 'model' 字段选择的地物分割模型变体映射为注册表中的名字，未知变体返回 None。"""
+    variant = variant or LAND_SEGMENTATION_DEFAULT
+    if variant not in LAND_SEGMENTATION_MODELS:
+        return None
+    return 'land_segmentation' if variant == LAND_SEGMENTATION_DEFAULT else f'land_segmentation:{variant}'
+
+
+def _build_change_detection():
+    from paddlers.deploy import Predictor
+    _, profile = resolve_profile("./models/rscd/")
+    return PredictorPool(Predictor(model_variant_dir("./models/rscd/", profile), **paddlers_kwargs(profile)),
+                         size=PREDICTOR_POOL_SIZE)
+
+
+def _warm_up_object_detection(tiled):
+    tiled.predictor.predictor.warm_up(lambda loader: loader.predict(_dummy_image('object_detection')))
+
+
+def _warm_up_segmentation(name):
+    return lambda tiled: tiled.predictor.warm_up(lambda loader: loader.predict_image(_dummy_image(name)))
+
+
+def _warm_up_change_detection(pool):
+    img = _dummy_image('change_detection')
+    pool.warm_up(lambda loader: loader.predict((img, img)))
+
+
+registry = ModelRegistry(max_workers=MODEL_LOAD_WORKERS,
+                         memory_budget_bytes=MODEL_MEMORY_BUDGET_MB * 1024 * 1024 if MODEL_MEMORY_BUDGET_MB else None)
+registry.register('object_detection', _build_object_detection, _warm_up_object_detection,
+                  model_dir="models/object_detection/")
+registry.register('road_extraction', _build_road_extraction, _warm_up_segmentation('road_extraction'),
+                  model_dir="models/road_extraction/")
+registry.register('change_detection', _build_change_detection, _warm_up_change_detection, model_dir="models/rscd/")
+for _variant, _model_dir in LAND_SEGMENTATION_MODELS.items():
+    registry.register(land_segmentation_key(_variant), _land_segmentation_builder(_model_dir),
+                      _warm_up_segmentation('land_segmentation'), model_dir=_model_dir)
@@ -1,9 +1,13 @@
 from flask import Blueprint, request, jsonify
+from pydantic import ValidationError
 import os, cv2, uuid, json, numpy as np, shutil, pymysql
 import traceback
 from PIL import Image
 from services.analysis_service import perform_object_detection
-from .utils import CustomPaddleDetPredictor, get_extended_image_info, get_image_quality_metrics
+from .utils import get_extended_image_info, get_image_quality_metrics
+from .model_registry import registry
+from .detection import DetectionParams, load_label_list
+from .responses import json_response
 
 object_detection_bp = Blueprint('object_detection', __name__)
 
@@ -11,13 +15,6 @@ TEMP_FOLDER = 'temp_uploads'
 RESULT_FOLDER = 'static/output'
 HISTORY_INPUT_FOLDER = 'static/history_inputs'
 
-try:
-    predictor_obj = CustomPaddleDetPredictor("models/object_detection/")
-    print("目标检测模型加载成功！")
-except Exception as e:
-    print(f"加载目标检测模型失败: {e}")
-    predictor_obj = None
-
 @object_detection_bp.route('/upload_and_analyze_single', methods=['POST'])
 def upload_and_analyze_single():
     if 'file' not in request.files: return jsonify({"error": "没有找到文件"}), 400
@@ -38,13 +35,26 @@ def predict_object_detection():
     data = request.get_json()
     temp_path = data.get('path')
     if not temp_path: return jsonify({"error": "缺少图片路径"}), 400
-    if not predictor_obj: return jsonify({"error": "目标检测模型未加载"}), 500
+    # 可选的后处理参数：score_threshold、class_thresholds({类别名: 阈值})、nms_iou，先校验再加载模型
+    try:
+        params = DetectionParams.model_validate(
+            data, context={"labels": load_label_list(registry.model_dir('object_detection'))})
+    except ValidationError as e:
+        return jsonify({"error": "后处理参数格式错误",
+                        "details": e.errors(include_url=False, include_context=False)}), 400
+    # 模型由注册表统一管理，第一次使用时才加载
+    detector = registry.get('object_detection')
+    if not detector: return jsonify({"error": "目标检测模型未加载"}), 500
 
-    analysis_result = perform_object_detection(temp_path, predictor_obj)
+    analysis_result = perform_object_detection(temp_path, detector,
+                                               score_threshold=params.score_threshold,
+                                               class_thresholds=params.class_thresholds,
+                                               nms_iou=params.nms_iou)
 
     # 3. 接口层：根据服务结果包装HTTP响应
     if analysis_result and analysis_result["success"]:
-        return jsonify({
+        # 检测框很多时 raw_results 较大，用快速序列化并按需压缩
+        return json_response({
             "result_url": request.host_url + analysis_result["result_url_relative"],
             "detection_metrics": analysis_result["metrics"],
             "raw_results": analysis_result["raw_results"]
@@ -0,0 +1,64 @@
+import copy
+import queue
+from contextlib import contextmanager
+
+
+def clone_loader(loader):
+    """
+    复制一个加载器实例，让副本持有预测器的 clone()。
+    clone 出来的预测器与原预测器共享模型权重，只各自拥有独立的执行上下文，可以在不同线程中并行 run()。
+    适用于 api/utils.py 中的加载器（.predictor 是 api/backends.py 中的执行后端）以及
+    paddlers.deploy.Predictor（.predictor 是 Paddle 预测器），两者都提供 clone()。
+    """
+    replica = copy.copy(loader)
+    replica.predictor = loader.predictor.clone()
+    return replica
+
+
+class PredictorPool:
+    """
+    线程安全的预测器池：每个模型持有 size 个共享权重的预测器副本，每个请求独占检出一个，用完归还。
+    对外暴露与加载器相同的 predict()/predict_image()/predict_batch() 接口，可以直接传给 perform_* 服务函数。
+    """
+
+    def __init__(self, loader, size=2):
+        self.size = max(1, int(size))
+        self.cfg = getattr(loader, 'cfg', None)
+        self._idle = queue.Queue()
+        self._idle.put(loader)
+        for _ in range(self.size - 1):
+            self._idle.put(clone_loader(loader))
+
+    @contextmanager
+    def checkout(self, timeout=None):
+        """检出一个空闲的预测器，没有空闲时阻塞等待；with 块结束后自动归还。"""
+        try:
+            loader = self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError("等待空闲预测器超时")
+        try:
+            yield loader
+        finally:
+            self._idle.put(loader)
+
+    def warm_up(self, fn):
+        """依次对池中每个预测器副本调用 fn(loader)，让所有副本都完成首次推理的初始化。"""
+        loaders = [self._idle.get() for _ in range(self.size)]
+        try:
+            for loader in loaders:
+                fn(loader)
+        finally:
+            for loader in loaders:
+                self._idle.put(loader)
+
+    def predict(self, *args, **kwargs):
+        with self.checkout() as loader:
+            return loader.predict(*args, **kwargs)
+
+    def predict_image(self, *args, **kwargs):
+        with self.checkout() as loader:
+            return loader.predict_image(*args, **kwargs)
+
+    def predict_batch(self, *args, **kwargs):
+        with self.checkout() as loader:
+            return loader.predict_batch(*args, **kwargs)
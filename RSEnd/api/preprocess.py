@@ -0,0 +1,94 @@
+import threading
+
+import cv2
+import numpy as np
+
+
+class PreprocessPlan:
+    """
+    由 model.yml 中的预处理算子列表在加载时编译出的融合预处理计划。
+
+    - Resize 在 uint8 图像上执行；
+    - 归一化 (v / 255 - mean) / std 预先展开成每个通道 256 项的 float32 查找表；
+    - BGR->RGB 通道交换与 HWC->CHW 转置在查表写入时一并完成，直接写进预分配的 float32 缓冲区。
+    整个过程不产生 float64 中间结果，也不再对整幅图像做多次拷贝。
+    """
+
+    def __init__(self, resize=None, lut=None, to_rgb=False):
+        self.resize = resize  # (w, h) 或 None
+        # lut: (3, 256) float32，未配置归一化时退化为恒等映射；cv2.LUT 需要 (1, 256) 形状的表
+        lut = lut if lut is not None else np.tile(np.arange(256, dtype=np.float32), (3, 1))
+        self.luts = [np.ascontiguousarray(row.reshape(1, 256)) for row in lut]
+        # 输出第 c 个通道取自输入的哪个通道
+        self.channel_order = (2, 1, 0) if to_rgb else (0, 1, 2)
+        self._local = threading.local()
+
+    def output_hw(self, img):
+        """预处理后输出张量的 (H, W)。"""
+        if self.resize is not None:
+            return self.resize[1], self.resize[0]
+        return img.shape[0], img.shape[1]
+
+    def buffer(self, batch_size, h, w):
+        """返回当前线程可复用的 (batch_size, 3, h, w) float32 缓冲区，形状变化时才重新分配。"""
+        buf = getattr(self._local, 'buf', None)
+        if buf is None or buf.shape != (batch_size, 3, h, w):
+            buf = np.empty((batch_size, 3, h, w), dtype=np.float32)
+            self._local.buf = buf
+        return buf
+
+    def __call__(self, img, out=None):
+        """
+        Args:
+            img: 已解码的 BGR uint8 图像 (H, W, 3)。
+            out: 可选的 (3, H', W') float32 目标数组；为 None 时写入线程内复用的缓冲区。
+
+        Returns:
+            np.ndarray: (1, 3, H', W') 的 float32 输入张量（out 为 None 时是复用缓冲区的视图，
+            须在下一次调用前交给预测器）。
+        """
+        if self.resize is not None:
+            img = cv2.resize(img, self.resize)
+        if out is None:
+            h, w = img.shape[:2]
+            out = self.buffer(1, h, w)[0]
+        # cv2.split 得到连续的 uint8 单通道，cv2.LUT 查表后直接写进缓冲区的对应通道平面
+        channels = cv2.split(img)
+        for c, src in enumerate(self.channel_order):
+            cv2.LUT(channels[src], self.luts[c], dst=out[c])
+        return out[np.newaxis]
+
+
+def normalize_lut(mean, std, is_scale=True):
+    """把 (v / 255 - mean) / std 展开成 (3, 256) 的 float32 查找表（在 float64 下计算一次后转换）。"""
+    values = np.arange(256, dtype=np.float64)
+    if is_scale:
+        values = values / 255.0
+    mean = np.asarray(mean, dtype=np.float64).reshape(-1, 1)
+    std = np.asarray(std, dtype=np.float64).reshape(-1, 1)
+    return ((values[np.newaxis, :] - mean) / std).astype(np.float32)
+
+
+def compile_det_plan(ops):
+    """编译 PaddleDetection 导出的 'Preprocess' 列表 (Resize / NormalizeImage / Permute)，其他算子忽略。"""
+    resize, lut = None, None
+    for op in ops:
+        op_type = op.get('type')
+        if op_type == 'Resize':
+            target_size = op['target_size']
+            resize = (target_size, target_size) if isinstance(target_size, int) else tuple(target_size)
+        elif op_type == 'NormalizeImage':
+            lut = normalize_lut(op['mean'], op['std'], op.get('is_scale', True))
+    return PreprocessPlan(resize=resize, lut=lut)
+
+
+def compile_seg_plan(ops, default_mean=None, default_std=None):
+    """编译分割模型的 'Transforms' 列表 (Normalize，可带 to_rgb)，其他算子忽略。"""
+    lut, to_rgb = None, False
+    for op in ops:
+        if op['type'] == 'Normalize':
+            mean = op.get('mean', default_mean)
+            std = op.get('std', default_std)
+            lut = normalize_lut(mean, std)
+            to_rgb = op.get('to_rgb', False)
+    return PreprocessPlan(lut=lut, to_rgb=to_rgb)
@@ -0,0 +1,42 @@
+import gzip
+import json
+
+import numpy as np
+from flask import Response, request
+
+from config import RESPONSE_COMPRESS_MIN_BYTES, RESPONSE_COMPRESS_LEVEL
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(obj):
+    """标准库 json 的兜底转换：numpy 标量和数组。"""
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    raise TypeError(f"无法序列化为 JSON: {type(obj)}")
+
+
+def dumps(payload):
+    """序列化为 UTF-8 JSON 字节。安装了 orjson 时使用它（比标准库快数倍，并直接支持 numpy 数组），否则退回标准库。"""
+    if orjson is not None:
+        return orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(payload, ensure_ascii=False, separators=(',', ':'), default=_default).encode('utf-8')
+
+
+def json_response(payload, status=200):
+    """
+    代替 jsonify 返回较大的 JSON 结果：快速序列化，客户端接受 gzip 且响应体不小于
+    RESPONSE_COMPRESS_MIN_BYTES 时压缩后返回。
+    """
+    body = dumps(payload)
+    response = Response(body, status=status, mimetype='application/json')
+    response.vary.add('Accept-Encoding')
+    if len(body) >= RESPONSE_COMPRESS_MIN_BYTES and 'gzip' in request.accept_encodings:
+        response.set_data(gzip.compress(body, compresslevel=RESPONSE_COMPRESS_LEVEL))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
@@ -1,7 +1,8 @@
 from flask import Blueprint, request, jsonify
 import os, uuid
 from services.analysis_service import perform_road_extraction_analysis
-from .utils import get_extended_image_info, get_image_quality_metrics, CustomPaddleSegPredictor
+from .utils import get_extended_image_info, get_image_quality_metrics
+from .model_registry import registry
 
 
 road_extraction_bp = Blueprint('road_extraction', __name__)
@@ -10,13 +11,6 @@ TEMP_FOLDER = 'temp_uploads'
 RESULT_FOLDER = 'static/output'
 HISTORY_INPUT_FOLDER = 'static/history_inputs'
 
-try:
-    predictor_road = CustomPaddleSegPredictor("models/road_extraction/")
-    print("道路提取模型（使用自定义引擎）加载成功！")
-except Exception as e:
-    print(f"加载道路提取模型失败: {e}")
-    predictor_road = None
-
 @road_extraction_bp.route('/upload_and_analyze_single', methods=['POST'])
 def upload_and_analyze_single():
     if 'file' not in request.files: return jsonify({"error": "没有找到文件"}), 400
@@ -38,6 +32,7 @@ def predict_road_extraction():
     data = request.get_json()
     temp_path = data.get('path')
     if not temp_path: return jsonify({"error": "缺少图片路径"}), 400
+    predictor_road = registry.get('road_extraction')
     if not predictor_road: return jsonify({"error": "道路提取模型未加载"}), 500
 
     analysis_result = perform_road_extraction_analysis(temp_path, predictor_road)
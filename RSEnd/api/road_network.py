@@ -0,0 +1,145 @@
+import math
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from skimage.morphology import skeletonize
+
+from .tiling import tile_windows
+
+
+def skeletonize_tiled(binary_map, tile_size=2048, halo=64, max_workers=4):
+    """
+    分块并行骨架化。
+
+    每个块向四周多取 halo 像素的上下文一起细化，只写回块本身的区域。细化是局部迭代操作，
+    迭代次数约为道路宽度的一半，只要 halo 大于最宽道路的一半，结果与整图骨架化一致。
+    不含道路像素的块直接跳过；小于一个块的图整图处理。
+
+    Args:
+        binary_map: (H, W) 道路二值图（非 0 为道路）。
+
+    Returns:
+        np.ndarray: (H, W) bool 骨架图。
+    """
+    mask = np.asarray(binary_map) > 0
+    h, w = mask.shape
+    if h <= tile_size and w <= tile_size:
+        return skeletonize(mask)
+
+    skeleton = np.zeros((h, w), dtype=bool)
+    # 长度不是 tile_size 整数倍时最后一个窗口会与前一个重叠，只使用 tile_windows 给出的写回区间：
+    # 它们互不重叠、恰好覆盖整幅图，各线程写回的区域不会冲突
+    blocks = [(ys, xs) for ys in tile_windows(h, tile_size, 0) for xs in tile_windows(w, tile_size, 0)]
+
+    def run(block):
+        (_, _, y0, y1), (_, _, x0, x1) = block
+        wy0, wy1, wx0, wx1 = max(0, y0 - halo), min(h, y1 + halo), max(0, x0 - halo), min(w, x1 + halo)
+        window = mask[wy0:wy1, wx0:wx1]
+        if not window[y0 - wy0:y1 - wy0, x0 - wx0:x1 - wx0].any():
+            return
+        skeleton[y0:y1, x0:x1] = skeletonize(window)[y0 - wy0:y1 - wy0, x0 - wx0:x1 - wx0]
+
+    with ThreadPoolExecutor(max_workers=max(1, int(max_workers))) as executor:
+        for future in [executor.submit(run, block) for block in blocks]:
+            future.result()
+    return skeleton
+
+
+def _member(sorted_index, query):
+    """query 中每个平铺下标是否是骨架像素，以及它在 sorted_index 中的位置。"""
+    pos = np.searchsorted(sorted_index, query)
+    pos = np.minimum(pos, sorted_index.shape[0] - 1)
+    return sorted_index[pos] == query, pos
+
+
+def skeleton_graph(skeleton):
+    """
+    把骨架像素组织成稀疏图：节点是骨架像素，边连接 8 邻域内相邻的像素，正交边权重 1、对角边权重 √2。
+    若对角两像素共享一个也是骨架的 4 邻域像素，这条对角边是多余的（经由该像素已经连通），不加入图中，
+    避免路径长度和节点度数在拐角处被重复计算。全程只处理骨架像素，不构造与图像同尺寸的中间数组。
+
+    Returns:
+        tuple: (节点平铺下标 (N,), 边起点 (E,), 边终点 (E,), 边权重 (E,))，边的端点为节点序号。
+    """
+    h, w = skeleton.shape
+    index = np.flatnonzero(skeleton)
+    if index.shape[0] == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return index, empty, empty, np.zeros(0)
+    rows, cols = np.divmod(index, w)
+    src, dst, weight = [], [], []
+    # 每条无向边只从一个方向枚举：右、下、右下、左下
+    for dy, dx in ((0, 1), (1, 0), (1, 1), (1, -1)):
+        valid = (rows + dy < h) & (cols + dx >= 0) & (cols + dx < w)
+        nodes = np.flatnonzero(valid)
+        hit, pos = _member(index, index[nodes] + dy * w + dx)
+        nodes, pos = nodes[hit], pos[hit]
+        if dy and dx:
+            corner_a, _ = _member(index, index[nodes] + dx)
+            corner_b, _ = _member(index, index[nodes] + w)
+            keep = ~(corner_a | corner_b)
+            nodes, pos = nodes[keep], pos[keep]
+        src.append(nodes)
+        dst.append(pos)
+        weight.append(np.full(nodes.shape[0], math.sqrt(2) if dy and dx else 1.0))
+    return index, np.concatenate(src), np.concatenate(dst), np.concatenate(weight)
+
+
+def _components(num_nodes, src, dst, node_mask=None):
+    """节点子集（node_mask 为 None 时为全部节点）上的连通分量标签，子集外的节点标签为 -1。"""
+    if node_mask is not None:
+        keep = node_mask[src] & node_mask[dst]
+        src, dst = src[keep], dst[keep]
+    graph = coo_matrix((np.ones(src.shape[0], dtype=np.int8), (src, dst)), shape=(num_nodes, num_nodes))
+    _, labels = connected_components(graph, directed=False)
+    if node_mask is None:
+        return labels
+    # 重新编号为 0..k-1，子集外的节点记为 -1
+    _, labels = np.unique(np.where(node_mask, labels, -1), return_inverse=True)
+    return labels - 1 if not node_mask.all() else labels
+
+
+def analyze_road_network(binary_map, tile_size=2048, halo=64, max_workers=4):
+    """
+    道路网络分析：分块并行骨架化，再在骨架的稀疏像素图上一次性得到所有拓扑指标。
+
+    - 端点：度为 1 的骨架像素；
+    - 交叉口：度不小于 3 的骨架像素，相邻的交叉像素合并为一个交叉口；
+    - 路段：去掉交叉口像素后骨架的连通分量，长度包含连接到交叉口的那一段；
+    - 连通分量：整个骨架图的连通分量（骨架化保持拓扑，与原二值图的 8 连通分量数一致）。
+
+    Returns:
+        dict: skeleton (H, W) bool、length_px 总长度（像素，考虑对角）、endpoints、junctions、
+            components、segment_lengths_px (每个路段的长度，降序)。
+    """
+    skeleton = skeletonize_tiled(binary_map, tile_size, halo, max_workers)
+    index, src, dst, weight = skeleton_graph(skeleton)
+    n = index.shape[0]
+    if n == 0:
+        return {"skeleton": skeleton, "length_px": 0.0, "endpoints": 0, "junctions": 0, "components": 0,
+                "segment_lengths_px": np.zeros(0)}
+
+    degree = np.bincount(src, minlength=n) + np.bincount(dst, minlength=n)
+    is_junction = degree >= 3
+    components = int(_components(n, src, dst).max()) + 1
+
+    junction_labels = _components(n, src, dst, is_junction)
+    junctions = int(junction_labels.max()) + 1 if is_junction.any() else 0
+
+    segment_labels = _components(n, src, dst, ~is_junction)
+    num_segments = int(segment_labels.max()) + 1 if (~is_junction).any() else 0
+    # 每条边记到它的非交叉口端点所在的路段上；两端都是交叉口的边属于交叉口内部，不计入路段
+    owner = np.where(segment_labels[src] >= 0, segment_labels[src], segment_labels[dst])
+    in_segment = owner >= 0
+    segment_lengths = np.bincount(owner[in_segment], weights=weight[in_segment], minlength=num_segments)
+
+    return {
+        "skeleton": skeleton,
+        "length_px": float(weight.sum()),
+        "endpoints": int(np.count_nonzero(degree == 1)),
+        "junctions": junctions,
+        "components": components,
+        "segment_lengths_px": np.sort(segment_lengths)[::-1],
+    }
@@ -0,0 +1,152 @@
+import os
+import time
+
+import yaml
+
+from config import RUNTIME_PROFILE_OVERRIDES
+
+# 每个模型目录下与 model.yml 并列的运行时配置文件
+RUNTIME_FILE = 'runtime.yml'
+# quantize_models.py 生成的 INT8 模型保存在模型目录下的这个子目录中
+INT8_SUBDIR = 'int8'
+
+# 运行时配置项的默认值，runtime.yml 中的每个 profile 只需写出与默认值不同的项
+DEFAULT_PROFILE = {
+    'device': 'cpu',           # cpu | gpu
+    'backend': 'native',       # native: Paddle 自带的 CPU 内核；onednn: 启用 oneDNN(MKLDNN)；onnxruntime: 见 api/backends.py
+    'precision': 'fp32',       # fp32 | int8：int8 加载 int8/ 子目录中的离线量化模型
+    'cpu_threads': 1,          # CPU 数学库线程数（onnxruntime 的 intra_op 线程数）
+    'inter_op_threads': 1,     # 仅 onnxruntime：算子间并行线程数
+    'onednn_cache_capacity': 0,  # 动态输入尺寸时 oneDNN 缓存的形状数量，0 表示不限制
+    'ir_optim': True,          # 是否启用 IR 图优化
+    'memory_optim': False,     # 是否启用显存/内存复用优化
+    'enable_passes': [],       # 额外追加的 IR pass
+    'delete_passes': [],       # 需要删除的 IR pass
+}
+
+
+def load_runtime_profiles(model_dir):
+    """读取模型目录下的 runtime.yml，返回 (默认 profile 名, {profile 名: 配置})；文件不存在时只有一个 'default'。"""
+    path = os.path.join(model_dir, RUNTIME_FILE)
+    if not os.path.exists(path):
+        return 'default', {'default': {}}
+    with open(path, 'r', encoding='utf-8') as f:
+        cfg = yaml.safe_load(f) or {}
+    profiles = cfg.get('profiles') or {'default': {}}
+    return cfg.get('default', next(iter(profiles))), profiles
+
+
+def resolve_profile(model_dir, name=None):
+    """
+    确定模型使用的运行时 profile。
+    优先级：显式传入的 name > config.RUNTIME_PROFILE_OVERRIDES[模型目录名] > runtime.yml 中的 default。
+
+    Returns:
+        tuple: (profile 名, 合并了默认值的完整配置 dict)
+    """
+    default_name, profiles = load_runtime_profiles(model_dir)
+    model_name = os.path.basename(os.path.normpath(model_dir))
+    name = name or RUNTIME_PROFILE_OVERRIDES.get(model_name) or default_name
+    if name not in profiles:
+        raise KeyError(f"{model_dir} 的 {RUNTIME_FILE} 中没有名为 '{name}' 的运行时配置")
+    return name, {**DEFAULT_PROFILE, **profiles[name]}
+
+
+def model_variant_dir(model_dir, profile):
+    """profile 对应的模型文件所在目录：int8 精度使用量化子目录，不存在时报错提示先运行 quantize_models.py。"""
+    if profile['precision'] != 'int8':
+        return model_dir
+    variant_dir = os.path.join(model_dir, INT8_SUBDIR)
+    if not os.path.isdir(variant_dir):
+        raise FileNotFoundError(f"未找到量化模型 {variant_dir}，请先运行 python quantize_models.py")
+    return variant_dir
+
+
+def apply_profile(config, profile):
+    """把运行时 profile 应用到 paddle.inference.Config 上。"""
+    if profile['device'] == 'gpu':
+        config.enable_use_gpu(100, 0)
+    else:
+        config.disable_gpu()
+        config.set_cpu_math_library_num_threads(profile['cpu_threads'])
+        if profile['backend'] == 'onednn':
+            config.enable_mkldnn()
+            if profile['onednn_cache_capacity']:
+                config.set_mkldnn_cache_capacity(profile['onednn_cache_capacity'])
+            if profile['precision'] == 'int8':
+                # 量化模型中的 quantize/dequantize 算子由 oneDNN 融合成真正的 INT8 内核
+                config.enable_mkldnn_int8()
+    config.switch_ir_optim(profile['ir_optim'])
+    if profile['memory_optim']:
+        config.enable_memory_optim()
+    for pass_name in profile['enable_passes']:
+        config.pass_builder().append_pass(pass_name)
+    for pass_name in profile['delete_passes']:
+        config.delete_pass(pass_name)
+    return config
+
+
+def paddlers_kwargs(profile):
+    """把运行时 profile 转换成 paddlers.deploy.Predictor 的构造参数（它自己创建 Config，不支持逐个 pass 配置）。"""
+    return {
+        'use_gpu': profile['device'] == 'gpu',
+        'cpu_thread_num': profile['cpu_threads'],
+        'use_mkl': profile['backend'] == 'onednn',
+        'mkl_thread_num': profile['cpu_threads'],
+    }
+
+
+def benchmark_profiles(build, model_dir, sample, repeat=10, warmup=2):
+    """
+    启动自检基准：用 runtime.yml 中的每个 profile 分别创建预测器并测量单次推理延迟。
+
+    Args:
+        build: 以 profile 名为参数、返回加载器实例的函数，例如 lambda p: CustomPaddleSegPredictor(model_dir, p)。
+        model_dir: 模型目录。
+        sample: 传给 predict() 的样例输入。
+
+    Returns:
+        list: [(profile 名, 平均延迟 ms 或错误信息)]，按延迟从低到高排列，失败的排在最后。
+    """
+    _, profiles = load_runtime_profiles(model_dir)
+    timings, failures = [], []
+    for name in profiles:
+        try:
+            loader = build(name)
+            for _ in range(warmup):
+                loader.predict(sample)
+            start = time.perf_counter()
+            for _ in range(repeat):
+                loader.predict(sample)
+            timings.append((name, (time.perf_counter() - start) / repeat * 1000))
+        except Exception as e:
+            failures.append((name, f"失败: {e}"))
+    return sorted(timings, key=lambda item: item[1]) + failures
+
+
+def print_benchmark_report(model_dir, report):
+    print(f"--- 运行时配置自检: {model_dir} ---")
+    for name, latency in report:
+        print(f"  {name:<16} {latency:8.2f} ms" if not isinstance(latency, str) else f"  {name:<16} {latency}")
+    if report and not isinstance(report[0][1], str):
+        print(f"  最快的配置: {report[0][0]}（可在 config.RUNTIME_PROFILE_OVERRIDES 中指定）")
+
+
+def self_benchmark(sample_image):
+    """对四个模型的所有运行时 profile 逐一测速并打印报告，由 main.py 在 RUNTIME_SELF_BENCHMARK 开启时调用。"""
+    from paddlers.deploy import Predictor
+    from .utils import CustomPaddleDetPredictor, CustomPaddleSegPredictor, CustomPaddleSegPredictorFromDetConfig
+
+    def rscd(p):
+        profile = resolve_profile("models/rscd/", p)[1]
+        return Predictor(model_variant_dir("models/rscd/", profile), **paddlers_kwargs(profile))
+
+    targets = [
+        ("models/object_detection/", lambda p: CustomPaddleDetPredictor("models/object_detection/", p), sample_image),
+        ("models/road_extraction/", lambda p: CustomPaddleSegPredictor("models/road_extraction/", p), sample_image),
+        ("models/land_segmentation/",
+         lambda p: CustomPaddleSegPredictorFromDetConfig("models/land_segmentation/", p), sample_image),
+        ("models/rscd/", rscd, (sample_image, sample_image)),
+    ]
+    for model_dir, build, sample in targets:
+        print_benchmark_report(model_dir, benchmark_profiles(build, model_dir, sample))
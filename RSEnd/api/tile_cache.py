@@ -0,0 +1,145 @@
+import hashlib
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+
+class DiskTileCache:
+    """
+    XYZ 瓦片的本地磁盘缓存，键为 (URL 模板, z, x, y)，文件保存在 root/<模板哈希>/<z>/<x>/<y>.tile。
+
+    - 过期：写入超过 ttl_s 秒的瓦片视为未命中，重新下载后覆盖；
+    - 容量：内存中按最近使用顺序维护所有瓦片的大小，总字节数超过 max_bytes 时删除最久未使用的瓦片。
+      命中时刷新文件的访问时间，启动时在后台线程扫描已有文件重建索引（按访问时间排序），扫描期间缓存照常可用；
+    - 并发：写入先写临时文件再 os.replace，读者只会看到完整的旧文件或新文件；读到刚被淘汰的文件按未命中处理。
+      多个进程共用同一目录也是安全的，只是各自的容量统计只包含本进程见过的瓦片。
+    """
+
+    def __init__(self, root, max_bytes=1 << 30, ttl_s=7 * 24 * 3600):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.ttl_s = ttl_s
+        self._index = OrderedDict()  # 路径 -> 字节数，最久未使用的在前
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "expired": 0, "stores": 0, "evictions": 0}
+        threading.Thread(target=self._scan, name="tile-cache-scan", daemon=True).start()
+
+    def path(self, url_template, z, x, y):
+        template_key = hashlib.blake2b(url_template.encode('utf-8'), digest_size=6).hexdigest()
+        return os.path.join(self.root, template_key, str(z), str(x), f"{y}.tile")
+
+    def get(self, url_template, z, x, y):
+        """返回缓存的瓦片字节，未命中或已过期返回 None。"""
+        path = self.path(url_template, z, x, y)
+        try:
+            with open(path, 'rb') as f:
+                mtime = os.fstat(f.fileno()).st_mtime
+                data = None if time.time() - mtime > self.ttl_s else f.read()
+        except OSError:
+            self._count("misses")
+            return None
+        if data is None:
+            self._count("expired")
+            self._count("misses")
+            return None
+        with self._lock:
+            if path in self._index:
+                self._index.move_to_end(path)
+            else:
+                self._add(path, len(data))
+            self._stats["hits"] += 1
+        try:
+            # 只刷新访问时间，修改时间保持为写入时间，过期仍按写入时刻计算；重启扫描按访问时间恢复 LRU 顺序
+            os.utime(path, (time.time(), mtime))
+        except OSError:
+            pass
+        return data
+
+    def put(self, url_template, z, x, y, data):
+        path = self.path(url_template, z, x, y)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"!!! 写入瓦片缓存失败: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        with self._lock:
+            self._add(path, len(data))
+            self._stats["stores"] += 1
+            victims = self._evict()
+        for victim in victims:
+            try:
+                os.remove(victim)
+            except OSError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats, entries=len(self._index), size_mb=round(self._bytes / 1024 / 1024, 1),
+                         max_mb=round(self.max_bytes / 1024 / 1024, 1))
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        return stats
+
+    def _add(self, path, size, recent=True):
+        """在持有锁时更新索引。recent=False 用于启动扫描，已有条目保持不变、新条目放在最旧的一端。"""
+        if path in self._index:
+            if not recent:
+                return
+            self._bytes -= self._index.pop(path)
+        self._index[path] = size
+        self._bytes += size
+        if not recent:
+            self._index.move_to_end(path, last=False)
+
+    def _evict(self):
+        """在持有锁时从最久未使用的一端移出条目直到不超过预算，返回需要删除的文件。"""
+        victims = []
+        while self._bytes > self.max_bytes and self._index:
+            path, size = self._index.popitem(last=False)
+            self._bytes -= size
+            self._stats["evictions"] += 1
+            victims.append(path)
+        return victims
+
+    def _scan(self):
+        entries = []
+        for root, _, files in os.walk(self.root):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                if name.endswith('.tmp'):
+                    # 上次进程异常退出时残留的临时文件
+                    if time.time() - stat.st_mtime > 3600:
+                        try:
+                            os.remove(path)
+                        except OSError:
+                            pass
+                    continue
+                entries.append((max(stat.st_atime, stat.st_mtime), path, stat.st_size))
+        # 从新到旧逐个放到最旧的一端，最终最旧的文件排在最前
+        entries.sort(reverse=True)
+        with self._lock:
+            for _, path, size in entries:
+                self._add(path, size, recent=False)
+            victims = self._evict()
+        for victim in victims:
+            try:
+                os.remove(victim)
+            except OSError:
+                pass
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
@@ -0,0 +1,91 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class TileFetcher:
+    """
+    并发的地图瓦片下载器。
+
+    - 所有请求共用一个 requests.Session，HTTPAdapter 为每个主机保持最多 max_workers 个长连接，不再每张瓦片重新建连；
+    - 下载在共享的线程池中并发进行，另外按主机限制同时进行的请求数（per_host），避免被瓦片服务限流；
+    - 连接错误和 502/503/504 自动重试 retries 次（指数退避）。
+
+    fetch_tiles() 立即返回每个瓦片对应的 Future，结果为瓦片字节（非 200 时为 None），
+    传入 transform 时在下载线程中对字节做进一步处理（如解码），解码也随下载一起并行。
+    配置了 cache（DiskTileCache）时先查本地缓存，命中的瓦片不发网络请求，下载成功的瓦片写入缓存。
+    """
+
+    def __init__(self, max_workers=16, per_host=8, timeout=5, retries=2, cache=None):
+        self.timeout = timeout
+        self.cache = cache
+        self.per_host = max(1, int(per_host))
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=max_workers,
+                              max_retries=Retry(total=retries, backoff_factor=0.2, status_forcelist=(502, 503, 504),
+                                                allowed_methods=frozenset(['GET'])))
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tile-fetch")
+        self._host_limits = {}
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "failures": 0, "bytes": 0, "seconds": 0.0}
+
+    def fetch_tile(self, url_template, zoom, x, y, transform=None):
+        """下载单个瓦片，返回 Future；每个瓦片需要不同的 transform（如写入拼图的不同位置）时使用。"""
+        return self._executor.submit(self._get_tile, url_template, zoom, x, y, transform)
+
+    def fetch_tiles(self, url_template, zoom, tiles, transform=None):
+        """tiles 为 [(x, y), ...]，URL 由模板按 {s}/{x}/{y}/{z} 填充。"""
+        return [self.fetch_tile(url_template, zoom, x, y, transform) for x, y in tiles]
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats["seconds"] = round(stats["seconds"], 3)
+        if self.cache:
+            stats["cache"] = self.cache.stats()
+        return stats
+
+    def _host_limit(self, url):
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._host_limits:
+                self._host_limits[host] = threading.BoundedSemaphore(self.per_host)
+            return self._host_limits[host]
+
+    def _get_tile(self, url_template, zoom, x, y, transform):
+        content = self.cache.get(url_template, zoom, x, y) if self.cache else None
+        if content is None:
+            content = self._get(url_template.format(s=2, x=x, y=y, z=zoom))
+            if content is not None and self.cache:
+                self.cache.put(url_template, zoom, x, y, content)
+        if content is None:
+            return None
+        return transform(content) if transform else content
+
+    def _get(self, url):
+        with self._host_limit(url):
+            # 拿到主机信号量之后才开始计时，只统计网络耗时，排队等待不计入（规划器会再除以 per_host）
+            start = time.perf_counter()
+            try:
+                response = self.session.get(url, timeout=self.timeout)
+                content = response.content if response.status_code == 200 else None
+            except Exception:
+                self._count(failures=1)
+                raise
+            finally:
+                self._count(requests=1, seconds=time.perf_counter() - start)
+        if content is not None:
+            self._count(bytes=len(content))
+        return content
+
+    def _count(self, **deltas):
+        with self._lock:
+            for name, delta in deltas.items():
+                self._stats[name] += delta
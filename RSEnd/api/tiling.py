@@ -0,0 +1,169 @@
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import numpy as np
+
+from .detection import DetectionResult, batched_nms
+from .utils import load_image
+
+
+def tile_windows(length, tile_size, overlap):
+    """
+    沿一个维度切分滑窗，返回 [(窗口起点, 窗口终点, 写回起点, 写回终点), ...]。
+    相邻窗口的重叠区域从中点一分为二，每个窗口只写回离自身边缘较远的那一半，
+    所有写回区间恰好覆盖 [0, length) 且互不重叠。
+    """
+    if length <= tile_size:
+        return [(0, length, 0, length)]
+    stride = max(1, tile_size - overlap)
+    starts = list(range(0, length - tile_size, stride)) + [length - tile_size]
+    windows = []
+    for i, start in enumerate(starts):
+        end = start + tile_size
+        keep_start = 0 if i == 0 else (starts[i - 1] + tile_size + start) // 2
+        keep_end = length if i == len(starts) - 1 else (start + tile_size + starts[i + 1]) // 2
+        windows.append((start, end, keep_start, keep_end))
+    return windows
+
+
+class TiledSegPredictor:
+    """
+    分割模型的滑窗分块推理包装器。
+
+    大图按 tile_size 切成带 overlap 重叠的窗口逐块推理，结果直接写回预先分配好的 uint8 标签图。
+    分割模型只输出类别标签（没有 logits 可以混合），重叠区域取离窗口中心更近的那块的预测，
+    丢弃上下文不足的窗口边缘。同一时刻最多只有 max_workers 个窗口的张量驻留内存，
+    峰值内存与输入尺寸无关；predictor 为 PredictorPool 时多个窗口可以并行推理。
+    小于一个窗口的图片直接整图推理。
+    """
+
+    def __init__(self, predictor, tile_size=1024, overlap=64, max_workers=1):
+        if overlap >= tile_size:
+            raise ValueError("overlap 必须小于 tile_size")
+        self.predictor = predictor
+        self.tile_size = int(tile_size)
+        self.overlap = int(overlap)
+        self.max_workers = max(1, int(max_workers))
+
+    def predict(self, image):
+        return self.predict_image(load_image(image))
+
+    def predict_image(self, img):
+        h, w = img.shape[:2]
+        if h <= self.tile_size and w <= self.tile_size:
+            return self.predictor.predict_image(img)
+
+        label_map = np.zeros((h, w), dtype=np.uint8)
+        windows = [(ys, xs) for ys in tile_windows(h, self.tile_size, self.overlap)
+                   for xs in tile_windows(w, self.tile_size, self.overlap)]
+
+        def run(window):
+            (y0, y1, ky0, ky1), (x0, x1, kx0, kx1) = window
+            tile = np.ascontiguousarray(img[y0:y1, x0:x1])
+            tile_label = self.predictor.predict_image(tile)['label_map']
+            label_map[ky0:ky1, kx0:kx1] = tile_label[ky0 - y0:ky1 - y0, kx0 - x0:kx1 - x0]
+
+        # 控制同时在途的窗口数量，避免一次性提交所有窗口导致内存随面积增长
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            pending = set()
+            for window in windows:
+                if len(pending) >= self.max_workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        future.result()
+                pending.add(executor.submit(run, window))
+            for future in pending:
+                future.result()
+        return {'label_map': label_map}
+
+
+class TiledDetPredictor:
+    """
+    目标检测的滑窗分块推理包装器。
+
+    大图（如地图拼接出的多瓦片影像）不再整体缩放到模型的输入尺寸，而是按 tile_size 切成带 overlap 重叠的
+    窗口，以原始分辨率分批推理（predictor 为 BatchingQueue 时这些窗口会和其他请求一起合并成批次）。
+    每个窗口的检测框平移回全图坐标；贴着内部窗口边缘的框是被截断的目标片段，与相邻窗口中同一目标的片段或完整框
+    取外接矩形合并（比重叠区域大的目标在每个窗口中都不完整，不能简单丢弃），
+    最后用逐类 NMS 合并重叠区域里的重复框。计算量与面积成正比，小目标不会因为整体缩放而丢失。
+    """
+
+    def __init__(self, predictor, tile_size=640, overlap=128, batch_size=8, merge_iou=0.5, min_score=0.05):
+        if overlap >= tile_size:
+            raise ValueError("overlap 必须小于 tile_size")
+        self.predictor = predictor
+        self.tile_size = int(tile_size)
+        self.overlap = int(overlap)
+        self.batch_size = max(1, int(batch_size))
+        self.merge_iou = merge_iou
+        self.min_score = min_score
+
+    def predict(self, image):
+        img = load_image(image)
+        h, w = img.shape[:2]
+        if h <= self.tile_size and w <= self.tile_size:
+            return self.predictor.predict(img)
+
+        windows = [(ys, xs) for ys in tile_windows(h, self.tile_size, self.overlap)
+                   for xs in tile_windows(w, self.tile_size, self.overlap)]
+        merged, cuts = [], []
+        for i in range(0, len(windows), self.batch_size):
+            chunk = windows[i:i + self.batch_size]
+            tiles = [img[y0:y1, x0:x1] for (y0, y1, _, _), (x0, x1, _, _) in chunk]
+            for ((y0, y1, _, _), (x0, x1, _, _)), result in zip(chunk, self.predictor.predict_batch(tiles)):
+                result, cut = self._to_global(result, x0, y0, x1, y1, w, h)
+                merged.append(result)
+                cuts.append(cut)
+
+        result = self._merge_cut(DetectionResult.concatenate(merged, merged[0].label_list), np.concatenate(cuts))
+        keep = batched_nms(result.boxes, result.scores, result.class_ids, self.merge_iou)
+        return result.select(keep)
+
+    def _to_global(self, result, x0, y0, x1, y1, w, h, margin=2):
+        """返回平移到全图坐标的结果，以及每个框是否被内部窗口边缘截断。"""
+        result = result.select(result.scores >= self.min_score)
+        boxes = result.boxes
+        # 触碰内部窗口边缘（不是整幅图的边缘）的框视为被截断
+        cut = np.zeros(len(result), dtype=bool)
+        if x0 > 0:
+            cut |= boxes[:, 0] <= margin
+        if y0 > 0:
+            cut |= boxes[:, 1] <= margin
+        if x1 < w:
+            cut |= boxes[:, 2] >= (x1 - x0) - margin
+        if y1 < h:
+            cut |= boxes[:, 3] >= (y1 - y0) - margin
+        result.boxes = result.boxes + np.array([x0, y0, x0, y0], dtype=np.float32)
+        return result, cut
+
+    @staticmethod
+    def _merge_cut(result, cut, min_overlap=0.5):
+        """
+        把每个截断框与同类别、相交面积至少占较小框 min_overlap 的框（相邻窗口中同一目标的其他片段，或它在某个窗口中
+        的完整框）合并成外接矩形，分数取最大值。合并后的框继续吸收新的片段，跨越多个窗口的大目标也能拼回完整的框。
+        """
+        if not cut.any():
+            return result
+        boxes, scores, class_ids = result.boxes.copy(), result.scores.copy(), result.class_ids
+        alive = np.ones(len(result), dtype=bool)
+        for i in np.flatnonzero(cut)[np.argsort(-scores[cut], kind='stable')]:
+            if not alive[i]:
+                continue
+            while True:
+                inter_w = np.minimum(boxes[:, 2], boxes[i, 2]) - np.maximum(boxes[:, 0], boxes[i, 0])
+                inter_h = np.minimum(boxes[:, 3], boxes[i, 3]) - np.maximum(boxes[:, 1], boxes[i, 1])
+                inter = np.clip(inter_w, 0, None) * np.clip(inter_h, 0, None)
+                areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+                hit = (alive & (class_ids == class_ids[i]) & (inter > 0)
+                       & (inter >= min_overlap * np.minimum(areas, areas[i])))
+                hit[i] = False
+                if not hit.any():
+                    break
+                boxes[i, :2] = np.minimum(boxes[i, :2], boxes[hit, :2].min(axis=0))
+                boxes[i, 2:] = np.maximum(boxes[i, 2:], boxes[hit, 2:].max(axis=0))
+                scores[i] = max(scores[i], scores[hit].max())
+                alive[hit] = False
+        return DetectionResult(boxes[alive], scores[alive], class_ids[alive], result.label_list)
+
+    def close(self):
+        if hasattr(self.predictor, 'close'):
+            self.predictor.close()
@@ -1,97 +1,82 @@
+import io
 import os
 import cv2
 import yaml
 import numpy as np
-import paddle.inference as paddle_infer
 from PIL import Image
 import imagehash
+from .preprocess import compile_det_plan, compile_seg_plan
+from .runtime import resolve_profile
+from .backends import create_backend
+from .detection import DetectionResult
 
 
 # 加载器一：专用于 PaddleDetection 导出的模型
 class CustomPaddleDetPredictor:
-    def __init__(self, model_dir):
+    def __init__(self, model_dir, profile=None):
         self.config_path = os.path.join(model_dir, 'model.yml')
         self.cfg = self.load_config(self.config_path)
-        self.predictor = self.create_predictor(model_dir)
+        # 预处理算子列表在加载时编译一次，不再每次调用都解释执行
+        self.plan = compile_det_plan(self.cfg['Preprocess'])
+        # 运行时配置(执行后端、oneDNN、线程数、pass 开关等)来自模型目录下的 runtime.yml；
+        # model.yml 始终从原目录读取，precision 为 int8 时模型文件来自 int8/ 子目录
+        self.profile_name, self.profile = resolve_profile(model_dir, profile)
+        self.predictor = create_backend(model_dir, self.profile)
 
     def load_config(self, config_path):
         with open(config_path, 'r', encoding='utf-8') as f:
             return yaml.safe_load(f)
 
-    def create_predictor(self, model_dir):
-        model_file = os.path.join(model_dir, 'model.pdmodel')
-        params_file = os.path.join(model_dir, 'model.pdiparams')
-        config = paddle_infer.Config(model_file, params_file)
-        config.delete_pass("conv_bn_fuse_pass")
-        return paddle_infer.create_predictor(config)
-
-    def preprocess(self, image_path):
-        img = cv2.imread(image_path)
-        ori_shape = img.shape[:2]
-        for op in self.cfg['Preprocess']:
-            # 获取操作类型，并进行判断
-            op_type = op.get('type')  # 使用 .get() 更安全，如果'type'不存在也不会报错
-
-            if op_type == 'Resize':
-                target_size = op['target_size']  # 从op中直接获取，而不是op['Resize']
-                img = cv2.resize(img,
-                                 (target_size, target_size) if isinstance(target_size, int) else tuple(target_size))
-            elif op_type == 'NormalizeImage':
-                mean = np.array(op['mean']).reshape(1, 1, -1)
-                std = np.array(op['std']).reshape(1, 1, -1)
-                if op.get('is_scale', True): img = img / 255.0
-                img = (img - mean) / std
-            elif op_type == 'Permute':  # <-- 正确的判断方式
-                img = img.transpose((2, 0, 1))
-
-        input_data = np.expand_dims(img, axis=0).astype('float32')
-        im_shape = np.array([ori_shape]).astype('float32')
-        # scale_factor 对于YOLO系列通常是必须的，但你的模型可能不需要。
-        # 如果你的模型输入只有 image 和 im_shape，可以注释掉 scale_factor
-        scale_factor = np.array([[1., 1.]]).astype('float32')
+    def preprocess(self, img, out=None):
+        # img 为已解码的 BGR uint8 图像；Resize / NormalizeImage / Permute 由编译好的计划一次完成
+        ori_h, ori_w = img.shape[:2]
+        input_data = self.plan(img, out=out)
+        # 与 PaddleDetection 的约定一致：im_shape 是缩放后的尺寸，scale_factor 是缩放后/原始的比例，
+        # 模型据此把检测框还原到原图坐标
+        h, w = self.plan.output_hw(img)
+        im_shape = np.array([[h, w]], dtype=np.float32)
+        scale_factor = np.array([[h / ori_h, w / ori_w]], dtype=np.float32)
         return input_data, im_shape, scale_factor
 
     def postprocess(self, np_boxes):
-        results = []
-        if np_boxes.shape[0] > 0:
-            for box in np_boxes:
-                class_id, score, x1, y1, x2, y2 = box.tolist()
-                if score < 0.5: continue
-                results.append({'category_id': int(class_id), 'category': self.cfg['label_list'][int(class_id)],
-                                'bbox': [x1, y1, x2 - x1, y2 - y1], 'score': score})
-        return results
-
-    def predict(self, image_path):
-        # Preprocess step remains the same, it prepares our three "ingredients"
-        input_data, im_shape, scale_factor = self.preprocess(image_path)
-
-        # --- 【核心修改】按名字准备输入数据，而不是按顺序 ---
+        # 返回未经阈值过滤的列式结果，阈值和 NMS 由调用方按请求参数通过 DetectionResult.filter() 决定
+        return DetectionResult.from_raw(np_boxes, self.cfg['label_list'])
+
+    def predict(self, image):
+        return self.predict_batch([image])[0]
+
+    def predict_batch(self, images):
+        """
+        一次 predictor.run() 处理多张图片（路径、编码字节或 BGR 数组均可），返回与输入顺序一致的结果列表。
+        任何一张图片解码或推理失败都会让整次调用抛出异常；合并多个请求的调用方（BatchingQueue）
+        应在入队前各自解码，只传入已解码的数组。
+        """
+        images = [load_image(image) for image in images]
+
+        # 每张图片直接预处理进批次缓冲区的对应位置，省去逐张张量再拼接的拷贝
+        h, w = self.plan.output_hw(images[0])
+        batch = self.plan.buffer(len(images), h, w)
+        samples = [self.preprocess(img, out=batch[i]) for i, img in enumerate(images)]
+
+        # --- 【核心修改】按名字准备输入数据，而不是按顺序；模型不需要的输入由后端忽略 ---
         inputs = {
-            'image': input_data,
-            'im_shape': im_shape,
-            'scale_factor': scale_factor
+            'image': batch,
+            'im_shape': np.concatenate([s[1] for s in samples], axis=0),
+            'scale_factor': np.concatenate([s[2] for s in samples], axis=0)
         }
 
-        input_names = self.predictor.get_input_names()
-        for name in input_names:
-            # 检查模型需要的输入名(name)，我们是否准备了对应的食材(inputs[name])
-            if name in inputs:
-                input_handle = self.predictor.get_input_handle(name)
-                input_handle.copy_from_cpu(inputs[name])
-        # --- 修改结束 ---
-
-        # 运行推理
-        self.predictor.run()
-
-        # 获取输出的逻辑不变
-        output_names = self.predictor.get_output_names()
-        np_boxes = self.predictor.get_output_handle(output_names[0]).copy_to_cpu()
-
-        return self.postprocess(np_boxes)
+        # 运行推理：输出0是所有图片的检测框拼在一起的 (M, 6)，输出1是每张图片各自的检测框数量
+        outputs = self.predictor.run(inputs)
+        np_boxes = outputs[0]
+        if len(samples) == 1:
+            return [self.postprocess(np_boxes)]
+        boxes_num = outputs[1]
+        offsets = np.cumsum(boxes_num)[:-1]
+        return [self.postprocess(boxes) for boxes in np.split(np_boxes, offsets)]
 
 
 class CustomPaddleSegPredictorFromDetConfig:
-    def __init__(self, model_dir):
+    def __init__(self, model_dir, profile=None):
         # 加载您的 model.yml 文件
         self.config_path = os.path.join(model_dir, 'model.yml')
         if not os.path.exists(self.config_path):
@@ -100,109 +85,109 @@ class CustomPaddleSegPredictorFromDetConfig:
         with open(self.config_path, 'r', encoding='utf-8') as f:
             self.cfg = yaml.safe_load(f)
 
-        self.predictor = self.create_predictor(model_dir)
-        print("分割模型（定制化yml配置）加载器初始化成功。")
+        # 检查 'Transforms' 键是否存在
+        if 'Transforms' not in self.cfg:
+            raise KeyError("在 model.yml 中没有找到 'Transforms' 键，请检查配置文件。")
+        # 预处理算子列表在加载时编译一次
+        self.plan = compile_seg_plan(self.cfg['Transforms'])
 
-    def create_predictor(self, model_dir):
-        model_file = os.path.join(model_dir, 'model.pdmodel')
-        params_file = os.path.join(model_dir, 'model.pdiparams')
-        config = paddle_infer.Config(model_file, params_file)
-        return paddle_infer.create_predictor(config)
+        self.profile_name, self.profile = resolve_profile(model_dir, profile)
+        self.predictor = create_backend(model_dir, self.profile)
+        print("分割模型（定制化yml配置）加载器初始化成功。")
 
-    def preprocess(self, image_path):
+    def preprocess(self, img):
         # --- 【核心修正】完全按照您的 model.yml 来进行预处理 ---
-        img = cv2.imread(image_path)
-        # 将数据类型转为 float32 用于计算
-        img = img.astype('float32')
-
-        # 保存原始图像尺寸，用于后处理时恢复
-        self.ori_shape = img.shape[:2]
+        # img 为已解码的 BGR uint8 图像 (H, W, 3)
+        # 原始图像尺寸随返回值传给后处理，不保存在实例上，保证多线程共享时互不干扰
+        ori_shape = img.shape[:2]
 
-        # 检查 'Transforms' 键是否存在
-        if 'Transforms' not in self.cfg:
-            raise KeyError("在 model.yml 中没有找到 'Transforms' 键，请检查配置文件。")
+        # to_rgb 通道交换、归一化和 (H, W, C) -> (1, C, H, W) 转置由编译好的计划一次完成，全程 float32
+        input_data = self.plan(img)
+        return input_data, ori_shape
 
-        # 遍历 'Transforms' 中定义的所有操作
-        for op in self.cfg['Transforms']:
-            if op['type'] == 'Normalize':
-                # 如果指定了 to_rgb: True，则进行 BGR -> RGB 的颜色空间转换
-                if op.get('to_rgb', False):
-                    img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-
-                # 进行归一化
-                mean = np.array(op['mean'], dtype=np.float32)
-                std = np.array(op['std'], dtype=np.float32)
-                img = (img / 255.0 - mean) / std
-
-        # 将图像维度从 (H, W, C) 转换为 (C, H, W) 以符合模型输入要求
-        img = img.transpose((2, 0, 1))
-        # 增加一个批处理维度，变为 (1, C, H, W)
-        input_data = np.expand_dims(img, axis=0)
-        return input_data
-
-    def postprocess(self, seg_map):
+    def postprocess(self, seg_map, ori_shape):
         # 将模型输出的分割图 (H, W) 恢复到原始图像的尺寸
-        label_map = cv2.resize(seg_map.astype(np.uint8), (self.ori_shape[1], self.ori_shape[0]),
+        label_map = cv2.resize(seg_map.astype(np.uint8), (ori_shape[1], ori_shape[0]),
                                interpolation=cv2.INTER_NEAREST)
         return {'label_map': label_map}
 
-    def predict(self, image_path):
+    def predict(self, image):
+        return self.predict_image(load_image(image))
+
+    def predict_image(self, img):
         # 1. 调用我们新的、正确的预处理函数
-        input_data = self.preprocess(image_path)
+        input_data, ori_shape = self.preprocess(img)
 
-        # 2. 设置模型输入
+        # 2. 设置模型输入并运行推理（paddle.inference 或 onnxruntime，由运行时配置决定）
         input_names = self.predictor.get_input_names()
-        input_handle = self.predictor.get_input_handle(input_names[0])
-        input_handle.copy_from_cpu(input_data)
-
-        # 3. 运行推理
-        self.predictor.run()
+        outputs = self.predictor.run({input_names[0]: input_data})
 
-        # 4. 获取模型输出
-        output_names = self.predictor.get_output_names()
-        output_handle = self.predictor.get_output_handle(output_names[0])
-        seg_map_output = output_handle.copy_to_cpu()
+        # 3. 获取模型输出
+        seg_map_output = outputs[0]
 
         # 输出通常是 (1, H, W)，我们需要去掉批处理维度
         seg_map = np.squeeze(seg_map_output, axis=0)
 
-        # 5. 调用后处理函数，将结果图恢复至原始尺寸
-        return self.postprocess(seg_map)
+        # 4. 调用后处理函数，将结果图恢复至原始尺寸
+        return self.postprocess(seg_map, ori_shape)
 
 # 加载器二：专用于 PaddleSeg 导出的模型
 class CustomPaddleSegPredictor:
-    def __init__(self, model_dir):
+    def __init__(self, model_dir, profile=None):
         config_path = os.path.join(model_dir, 'model.yml')
         with open(config_path, 'r', encoding='utf-8') as f:
             self.cfg = yaml.safe_load(f)
-        config = paddle_infer.Config(os.path.join(model_dir, 'model.json'), os.path.join(model_dir, 'model.pdiparams'))
-        self.predictor = paddle_infer.create_predictor(config)
-
-    def preprocess(self, image_path):
-        img = cv2.imread(image_path).astype('float32')
-        for op in self.cfg['Deploy']['transforms']:
-            if op['type'] == 'Normalize':
-                mean = np.array(op.get('mean', [0.5, 0.5, 0.5]), dtype=np.float32)
-                std = np.array(op.get('std', [0.5, 0.5, 0.5]), dtype=np.float32)
-                img = (img / 255.0 - mean) / std
-        img = img.transpose((2, 0, 1))
-        input_data = np.expand_dims(img, axis=0)
-        return input_data.astype('float32')
-
-    def predict(self, image_path):
-        input_data = self.preprocess(image_path)
+        self.plan = compile_seg_plan(self.cfg['Deploy']['transforms'], default_mean=[0.5, 0.5, 0.5],
+                                     default_std=[0.5, 0.5, 0.5])
+        self.profile_name, self.profile = resolve_profile(model_dir, profile)
+        self.predictor = create_backend(model_dir, self.profile, model_filename='model.json')
+
+    def preprocess(self, img):
+        return self.plan(img)
+
+    def predict(self, image):
+        return self.predict_image(load_image(image))
+
+    def predict_image(self, img):
+        input_data = self.preprocess(img)
         input_names = self.predictor.get_input_names()
-        input_handle = self.predictor.get_input_handle(input_names[0])
-        input_handle.reshape(input_data.shape)
-        input_handle.copy_from_cpu(input_data)
-        self.predictor.run()
-        output_names = self.predictor.get_output_names()
-        output_handle = self.predictor.get_output_handle(output_names[0])
-        output_data = output_handle.copy_to_cpu()
+        output_data = self.predictor.run({input_names[0]: input_data})[0]
         return {'label_map': output_data[0]}
 
 
 # 其他通用辅助函数
+def load_image(image):
+    """
+    把各种形式的输入统一成 BGR uint8 数组，供所有预测器和服务函数使用。
+
+    Args:
+        image: 图片路径(str)、编码后的图片字节(bytes/bytearray/memoryview)、
+            已解码的 BGR numpy 数组，或 PIL.Image（RGB，会转换为 BGR）。
+
+    Returns:
+        np.ndarray: BGR uint8 图像；传入 numpy 数组时原样返回，不做拷贝。
+    """
+    if isinstance(image, np.ndarray):
+        return image
+    if isinstance(image, str):
+        img = cv2.imread(image)
+    elif isinstance(image, (bytes, bytearray, memoryview)):
+        img = cv2.imdecode(np.frombuffer(image, np.uint8), cv2.IMREAD_COLOR)
+    elif isinstance(image, Image.Image):
+        img = cv2.cvtColor(np.asarray(image.convert('RGB')), cv2.COLOR_RGB2BGR)
+    else:
+        raise TypeError(f"不支持的图片输入类型: {type(image)}")
+    if img is None:
+        raise ValueError("无法读取或解码图片")
+    return img
+
+
+def image_extension(data):
+    """根据编码字节的文件头判断扩展名（如 '.png'、'.jpg'），用于保存上传的原始字节。"""
+    fmt = Image.open(io.BytesIO(data)).format or 'PNG'
+    return '.jpg' if fmt == 'JPEG' else f".{fmt.lower()}"
+
+
 def get_image_sharpness(image_path):
     try:
         img = cv2.imread(image_path);
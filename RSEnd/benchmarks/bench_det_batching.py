@@ -0,0 +1,78 @@
+# 文件名: benchmarks/bench_det_batching.py
+# 目标检测微批处理的吞吐量/延迟基准测试，在 RSEnd 目录下运行:
+#   python -m benchmarks.bench_det_batching --image static/images/12345/A/train_9.png
+import argparse
+import threading
+import time
+
+import numpy as np
+
+from api.batching import BatchingQueue
+from api.utils import CustomPaddleDetPredictor
+
+
+def run_clients(target, image_path, clients, requests_per_client):
+    """启动 clients 个并发线程，各自串行发送 requests_per_client 个请求，返回 (总耗时, 每个请求的延迟列表)。"""
+    latencies = []
+    lock = threading.Lock()
+
+    def worker():
+        local = []
+        for _ in range(requests_per_client):
+            t0 = time.perf_counter()
+            target.predict(image_path)
+            local.append(time.perf_counter() - t0)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=worker) for _ in range(clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return time.perf_counter() - start, latencies
+
+
+def report(name, elapsed, latencies):
+    lat_ms = np.array(latencies) * 1000
+    print(f"{name:<24} 吞吐量 {len(latencies) / elapsed:8.2f} img/s   "
+          f"p50 {np.percentile(lat_ms, 50):8.1f} ms   p95 {np.percentile(lat_ms, 95):8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="目标检测微批处理基准测试")
+    parser.add_argument('--model-dir', default='models/object_detection/')
+    parser.add_argument('--image', required=True)
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=10, help="每个客户端线程发送的请求数")
+    parser.add_argument('--max-batch-size', type=int, default=8)
+    parser.add_argument('--windows', type=float, nargs='+', default=[0, 2, 5, 10, 20],
+                        help="要测试的批处理时间窗(毫秒)")
+    args = parser.parse_args()
+
+    predictor = CustomPaddleDetPredictor(args.model_dir)
+    predictor.predict(args.image)  # 预热
+
+    # 基线：所有线程串行共享同一个预测器，一次 run() 处理一张图
+    lock = threading.Lock()
+
+    class Serialized:
+        def predict(self, image_path):
+            with lock:
+                return predictor.predict(image_path)
+
+    elapsed, latencies = run_clients(Serialized(), args.image, args.clients, args.requests)
+    report("不批处理(逐张)", elapsed, latencies)
+
+    for window in args.windows:
+        batcher = BatchingQueue(predictor, max_batch_size=args.max_batch_size, max_wait_ms=window)
+        try:
+            elapsed, latencies = run_clients(batcher, args.image, args.clients, args.requests)
+        finally:
+            batcher.close()
+        report(f"批处理 窗口={window:g}ms", elapsed, latencies)
+
+
+if __name__ == '__main__':
+    main()
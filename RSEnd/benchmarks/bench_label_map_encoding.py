@@ -0,0 +1,42 @@
+# 文件名: benchmarks/bench_label_map_encoding.py
+# 地物分割接口返回标签图的编码对比：旧的 label_map.tolist() + 标准库 json 与 api/label_maps.py 中各种紧凑编码，
+# 报告编码+序列化耗时、响应体大小以及 gzip 压缩后的大小。在 RSEnd 目录下运行:
+#   python -m benchmarks.bench_label_map_encoding --sizes 1024 2048
+import argparse
+import gzip
+import json
+import time
+
+from api.label_maps import encode_label_map
+from api.responses import dumps
+from benchmarks.bench_label_maps import synthetic_label_map
+
+
+def measure(fn, repeat):
+    fn()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        body = fn()
+    return (time.perf_counter() - start) / repeat * 1000, body
+
+
+def main():
+    parser = argparse.ArgumentParser(description="标签图响应编码基准测试")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1024, 2048])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        label_map = synthetic_label_map(size)
+        print(f"[{size}x{size}]")
+        cases = [("旧 tolist + json", lambda: json.dumps({"raw_label_map": label_map.tolist()}).encode('utf-8'))]
+        cases += [(f"{encoding} + dumps", lambda e=encoding: dumps({"raw_label_map": encode_label_map(label_map, e)}))
+                  for encoding in ('raw', 'rle', 'bitmask', 'png')]
+        for name, fn in cases:
+            elapsed_ms, body = measure(fn, args.repeat)
+            gzipped = len(gzip.compress(body, compresslevel=5))
+            print(f"  {name:<18} {elapsed_ms:9.1f} ms   {len(body) / 1024:10.1f} KB   gzip {gzipped / 1024:9.1f} KB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+# 文件名: benchmarks/bench_label_maps.py
+# 大尺寸标签图的类别统计与上色基准：改造前逐类别扫描的写法与 api/label_maps.py 的单次遍历 / 查找表写法对比，
+# 报告耗时、tracemalloc 峰值分配和 PNG 文件大小。在 RSEnd 目录下运行:
+#   python -m benchmarks.bench_label_maps --sizes 2048 4096 8192
+import argparse
+import io
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from api.label_maps import class_statistics, colorize, save_palettized_png
+from services.analysis_service import CLASS_COLOR_MAP, CLASS_NAMES, CLASS_PALETTE
+
+
+def legacy_statistics(label_map):
+    """改造前 perform_land_segmentation 的指标计算。"""
+    metrics = []
+    for class_id, class_name in CLASS_NAMES.items():
+        if class_id == 0: continue
+        pixel_count = np.sum(label_map == class_id)
+        metrics.append((class_name, round(pixel_count * 0.5 * 0.5, 2),
+                        round((pixel_count / label_map.size) * 100, 2)))
+    return metrics
+
+
+def legacy_colorize(label_map):
+    """改造前 perform_land_segmentation 的 RGBA 上色。"""
+    rgba = np.zeros((label_map.shape[0], label_map.shape[1], 4), dtype=np.uint8)
+    for class_id, color_bgr in CLASS_COLOR_MAP.items():
+        if class_id == 0: continue
+        rgba[label_map == class_id] = [color_bgr[2], color_bgr[1], color_bgr[0], 255]
+    return rgba
+
+
+def legacy_save(label_map):
+    buf = io.BytesIO()
+    Image.fromarray(legacy_colorize(label_map), 'RGBA').save(buf, format='PNG')
+    return buf.tell()
+
+
+def palettized_save(label_map):
+    buf = io.BytesIO()
+    save_palettized_png(label_map, CLASS_PALETTE, buf, transparent_index=0)
+    return buf.tell()
+
+
+def measure(fn, arg, repeat):
+    fn(arg)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(arg)
+    elapsed_ms = (time.perf_counter() - start) / repeat * 1000
+    tracemalloc.start()
+    fn(arg)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed_ms, peak / 1024 / 1024
+
+
+def synthetic_label_map(size):
+    """块状分布的 7 类标签图，接近真实分割结果的空间结构（纯随机噪声会让 PNG 压缩失真）。"""
+    coarse = np.random.default_rng(0).integers(0, len(CLASS_NAMES), (size // 64, size // 64), dtype=np.uint8)
+    return cv2.resize(coarse, (size, size), interpolation=cv2.INTER_NEAREST)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="标签图统计与上色基准测试")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[2048, 4096, 8192])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        label_map = synthetic_label_map(size)
+        new_stats = [(s["class_name"], s["area_m2"], s["percentage"]) for s in class_statistics(label_map, CLASS_NAMES)]
+        assert new_stats == legacy_statistics(label_map), "统计结果不一致"
+        assert np.array_equal(colorize(label_map, CLASS_PALETTE, transparent_index=0)[..., 3] > 0,
+                              legacy_colorize(label_map)[..., 3] > 0), "上色结果不一致"
+
+        print(f"[{size}x{size}]")
+        for name, fn in (("统计 逐类扫描", legacy_statistics),
+                         ("统计 单次直方图", lambda m: class_statistics(m, CLASS_NAMES)),
+                         ("上色 逐类填色 RGBA", legacy_colorize),
+                         ("上色 查找表 RGBA", lambda m: colorize(m, CLASS_PALETTE, transparent_index=0)),
+                         ("保存 RGBA PNG", legacy_save),
+                         ("保存 调色板 PNG", palettized_save)):
+            elapsed_ms, peak_mb = measure(fn, label_map, args.repeat)
+            print(f"  {name:<16} {elapsed_ms:9.1f} ms   峰值分配 {peak_mb:8.1f} MB")
+        print(f"  PNG 大小: RGBA {legacy_save(label_map) / 1024:.0f} KB, 调色板 {palettized_save(label_map) / 1024:.0f} KB")
+
+
+if __name__ == '__main__':
+    main()
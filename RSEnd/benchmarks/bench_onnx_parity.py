@@ -0,0 +1,94 @@
+# 文件名: benchmarks/bench_onnx_parity.py
+# paddle.inference 与 ONNX Runtime 两个执行后端的一致性检查和延迟对比：同一张图片经过同一套预处理，
+# 分别交给两个后端推理，比较原始输出张量和最终结果，再各自测量端到端的单张延迟。
+# 先运行 python convert_onnx.py，然后在 RSEnd 目录下运行:
+#   python -m benchmarks.bench_onnx_parity --image static/images/12345/A/train_9.png
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from api.metrics import confusion_matrix, mean_iou, detection_map
+from api.utils import CustomPaddleDetPredictor, CustomPaddleSegPredictor, CustomPaddleSegPredictorFromDetConfig
+from config import DET_SCORE_THRESHOLD
+
+# 模型名 -> (加载器类, 模型目录)
+MODELS = {
+    'object_detection': (CustomPaddleDetPredictor, "models/object_detection/"),
+    'road_extraction': (CustomPaddleSegPredictor, "models/road_extraction/"),
+    'land_segmentation': (CustomPaddleSegPredictorFromDetConfig, "models/land_segmentation/"),
+}
+
+
+def model_feeds(name, loader, img):
+    """与加载器 predict 相同的预处理结果，组织成 {输入名: 数组}。"""
+    input_names = loader.predictor.get_input_names()
+    if name == 'object_detection':
+        image, im_shape, scale_factor = loader.preprocess(img)
+        return {'image': image.copy(), 'im_shape': im_shape, 'scale_factor': scale_factor}
+    if name == 'land_segmentation':
+        return {input_names[0]: loader.preprocess(img)[0].copy()}
+    return {input_names[0]: loader.preprocess(img).copy()}
+
+
+def compare_outputs(paddle_outputs, onnx_outputs):
+    """逐个输出比较形状和最大绝对误差。"""
+    for i, (a, b) in enumerate(zip(paddle_outputs, onnx_outputs)):
+        if a.shape != b.shape:
+            print(f"  输出{i}: 形状不一致 {a.shape} vs {b.shape}")
+            continue
+        diff = float(np.abs(a.astype(np.float64) - b.astype(np.float64)).max()) if a.size else 0.0
+        print(f"  输出{i}: 形状 {a.shape}，最大绝对误差 {diff:.3e}")
+
+
+def compare_results(name, paddle_result, onnx_result):
+    """比较后处理之后的结果：检测用 mAP@0.5（以 paddle 结果为参照），分割用 mIoU 和像素一致率。"""
+    if name == 'object_detection':
+        paddle_result = paddle_result.filter(score_threshold=DET_SCORE_THRESHOLD)
+        onnx_result = onnx_result.filter(score_threshold=DET_SCORE_THRESHOLD)
+        agreement = detection_map([onnx_result], [paddle_result], len(paddle_result.label_list))
+        print(f"  检测框 {len(paddle_result)} vs {len(onnx_result)}，mAP@0.5 = {agreement:.4f}")
+        return
+    a, b = paddle_result['label_map'], onnx_result['label_map']
+    num_classes = int(max(a.max(), b.max())) + 1
+    print(f"  mIoU = {mean_iou(confusion_matrix(b, a, num_classes)):.4f}，像素一致率 {float((a == b).mean()) * 100:.2f}%")
+
+
+def latency_ms(loader, img, repeat, warmup=2):
+    for _ in range(warmup):
+        loader.predict(img)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        loader.predict(img)
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="执行后端一致性与延迟对比")
+    parser.add_argument('--image', required=True)
+    parser.add_argument('--models', nargs='+', default=list(MODELS), choices=list(MODELS))
+    parser.add_argument('--paddle-profile', default='onednn')
+    parser.add_argument('--onnx-profile', default='onnxruntime')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    img = cv2.imread(args.image)
+    for name in args.models:
+        cls, model_dir = MODELS[name]
+        print(f"[{name}] 输入 {img.shape[1]}x{img.shape[0]}")
+        paddle_loader = cls(model_dir, args.paddle_profile)
+        onnx_loader = cls(model_dir, args.onnx_profile)
+
+        feeds = model_feeds(name, paddle_loader, img)
+        compare_outputs(paddle_loader.predictor.run(feeds), onnx_loader.predictor.run(feeds))
+        compare_results(name, paddle_loader.predict(img), onnx_loader.predict(img))
+
+        paddle_ms = latency_ms(paddle_loader, img, args.repeat)
+        onnx_ms = latency_ms(onnx_loader, img, args.repeat)
+        print(f"  {args.paddle_profile:<14} {paddle_ms:8.2f} ms/张")
+        print(f"  {args.onnx_profile:<14} {onnx_ms:8.2f} ms/张   加速比 {paddle_ms / onnx_ms:.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+# 文件名: benchmarks/bench_tile_fetch.py
+# 地图瓦片下载基准：在本地启动一个注入固定延迟的替身瓦片服务，对比改造前逐张 requests.get 顺序下载
+# 与 api/map_analysis.py 中共享连接池 + 并发下载（变化检测前后两期同时下载）的耗时，
+# 以及本地瓦片缓存预热后再次分析同一区域的耗时（使用临时缓存目录）。结果按经纬度范围精确裁剪，
+# 边界取在瓦片中心，裁剪后每边比整块瓦片拼接少一个瓦片宽度。在 RSEnd 目录下运行:
+#   python -m benchmarks.bench_tile_fetch --grid 10 --latency-ms 50
+import argparse
+import io
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import requests
+from PIL import Image
+
+from api.map_analysis import Coordinate, deg2num, num2deg, fetch_and_stitch_many, tile_fetcher
+from api.tile_cache import DiskTileCache
+
+
+def start_tile_server(latency_s):
+    buf = io.BytesIO()
+    Image.fromarray(np.random.default_rng(0).integers(0, 255, (256, 256, 3), dtype=np.uint8)).save(buf, 'PNG')
+    tile = buf.getvalue()
+    connections = set()
+    served = [0]
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # 支持长连接
+
+        def do_GET(self):
+            connections.add(self.client_address)
+            served[0] += 1
+            time.sleep(latency_s)
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/png')
+            self.send_header('Content-Length', str(len(tile)))
+            self.end_headers()
+            self.wfile.write(tile)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, connections, served
+
+
+def legacy_fetch(sw, ne, zoom, url_template):
+    """改造前 fetch_and_stitch_tiles 的下载部分：嵌套循环逐张 requests.get，不复用连接。"""
+    xtile_sw, ytile_sw = deg2num(sw.lat, sw.lng, zoom)
+    xtile_ne, ytile_ne = deg2num(ne.lat, ne.lng, zoom)
+    min_x, max_x = sorted((xtile_sw, xtile_ne))
+    min_y, max_y = sorted((ytile_sw, ytile_ne))
+    tile_images = {}
+    for x in range(min_x, max_x + 1):
+        for y in range(min_y, max_y + 1):
+            response = requests.get(url_template.format(s=2, x=x, y=y, z=zoom), timeout=5)
+            if response.status_code == 200:
+                tile_images[(x, y)] = Image.open(io.BytesIO(response.content))
+    return tile_images
+
+
+def main():
+    parser = argparse.ArgumentParser(description="地图瓦片下载基准测试")
+    parser.add_argument('--grid', type=int, default=10, help="范围内每边的瓦片数")
+    parser.add_argument('--latency-ms', type=float, default=50)
+    parser.add_argument('--zoom', type=int, default=16)
+    args = parser.parse_args()
+
+    server, connections, served = start_tile_server(args.latency_ms / 1000)
+    tile_fetcher.cache = DiskTileCache(tempfile.mkdtemp(prefix='tile-cache-'))
+    url = f"http://127.0.0.1:{server.server_address[1]}/tiles/{{z}}/{{x}}/{{y}}.png"
+    # 取范围内瓦片中心点作为边界，保证恰好覆盖 grid x grid 个瓦片
+    x0, y0 = 53000, 28000
+    sw = Coordinate(**dict(zip(('lat', 'lng'), num2deg(x0 + 0.5, y0 + args.grid - 0.5, args.zoom))))
+    ne = Coordinate(**dict(zip(('lat', 'lng'), num2deg(x0 + args.grid - 0.5, y0 + 0.5, args.zoom))))
+    print(f"{args.grid}x{args.grid} 个瓦片 x 2 期，每个请求注入 {args.latency_ms:.0f} ms 延迟")
+
+    connections.clear()
+    start = time.perf_counter()
+    legacy = [legacy_fetch(sw, ne, args.zoom, url), legacy_fetch(sw, ne, args.zoom, url)]
+    print(f"  顺序下载   {time.perf_counter() - start:7.2f} s   连接数 {len(connections)}")
+    assert all(len(tiles) == args.grid ** 2 for tiles in legacy)
+
+    # 两期使用不同的 URL 模板，模拟前后两期来自不同图层（缓存按模板区分）
+    urls = [url, url + '?epoch=after']
+    for name in ("并发下载", "缓存命中"):
+        connections.clear()
+        served[0] = 0
+        start = time.perf_counter()
+        images = fetch_and_stitch_many(sw, ne, args.zoom, urls)
+        print(f"  {name}   {time.perf_counter() - start:7.2f} s   连接数 {len(connections)}   请求数 {served[0]}"
+              f"   (含拼接裁剪，每期 {images[0].shape[1]}x{images[0].shape[0]}，"
+              f"整块瓦片为 {args.grid * 256}x{args.grid * 256})")
+    print(f"  下载器统计 {tile_fetcher.stats()}")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
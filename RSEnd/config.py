@@ -4,6 +4,64 @@
 RESULT_FOLDER = 'static/output'
 HISTORY_INPUT_FOLDER = 'static/history_inputs'
 TEMP_FOLDER = 'temp_uploads'
+# 按内容寻址的存储目录：历史输入图和结果图按内容哈希保存，相同内容只存一份
+BLOB_FOLDER = 'static/blobs'
+# 最近被写入或复用过的文件在该秒数内不回收（复用它的记录可能还在后台写回队列中）
+BLOB_GC_GRACE_S = 60
+
+# --- 分析结果缓存配置 ---
+# 相同输入、相同模型版本和参数的分析直接返回缓存的指标与结果图，不再推理
+RESULT_CACHE_ENABLED = True
+RESULT_CACHE_FOLDER = 'cache/results'
+# 内存层最多缓存的结果数与存活秒数；磁盘层不过期，模型目录变化时整体失效
+RESULT_CACHE_MEMORY_ENTRIES = 256
+RESULT_CACHE_MEMORY_TTL_S = 3600
+# 修改指标计算方式或返回格式时加一，使旧的缓存结果全部失效
+RESULT_CACHE_SCHEMA = 1
+
+# --- 接口响应编码配置 ---
+# 地物分割接口返回标签图的默认编码（png / rle / bitmask / url / raw / none），可由请求的 label_map_encoding 覆盖
+LABEL_MAP_ENCODING_DEFAULT = 'png'
+# 不小于该字节数、且客户端接受 gzip 的 JSON 响应压缩后返回；压缩级别 1-9，越大越慢
+RESPONSE_COMPRESS_MIN_BYTES = 1024
+RESPONSE_COMPRESS_LEVEL = 5
+
+# --- 地图瓦片下载配置 ---
+# 并发下载线程数（同时也是连接池中每个主机保持的长连接数），以及对同一主机同时进行的请求数上限
+TILE_FETCH_WORKERS = 16
+TILE_FETCH_PER_HOST = 8
+# 单个瓦片请求的超时秒数与失败重试次数（连接错误和 502/503/504）
+TILE_FETCH_TIMEOUT_S = 5
+TILE_FETCH_RETRIES = 2
+
+# --- 地图瓦片缓存配置 ---
+# 下载过的瓦片按 (URL 模板, z, x, y) 缓存在本地磁盘，再次分析同一区域时不再访问瓦片服务
+TILE_CACHE_ENABLED = True
+TILE_CACHE_FOLDER = 'cache/tiles'
+# 缓存总大小上限(MB)，超出后淘汰最久未使用的瓦片；瓦片缓存超过 TILE_CACHE_TTL_S 秒后重新下载
+TILE_CACHE_MAX_MB = 1024
+TILE_CACHE_TTL_S = 7 * 24 * 3600
+
+# --- 地图分析计算预算配置 ---
+# 按经纬度范围分析前先估算瓦片数、像素数和耗时，超出预算时先缩小影像，再降低缩放等级，仍超出则拒绝并给出拆分建议
+# 单次请求最多下载的瓦片数（变化检测两期合计），以及送入模型的单张影像最多像素数
+MAP_PLAN_MAX_TILES = 512
+MAP_PLAN_MAX_PIXELS = 4096 * 4096
+# 单次请求预计耗时（下载 + 推理）的上限秒数
+MAP_PLAN_TIME_BUDGET_S = 120
+# 影像最多缩小到该比例；需要缩得更小时改为降低一级缩放等级（下载的瓦片也少为 1/4）
+MAP_PLAN_MIN_SCALE = 0.5
+# 最多比请求的缩放等级低几级；仍超出预算时按请求的缩放等级拆分，子区域数超过上限则直接拒绝
+MAP_PLAN_MAX_ZOOM_DROP = 2
+MAP_PLAN_MAX_SUB_JOBS = 16
+# 估算耗时用：还没有下载统计时假设的单个瓦片请求秒数，以及各任务每百万像素的推理秒数
+MAP_PLAN_TILE_SECONDS = 0.1
+MAP_PLAN_SECONDS_PER_MPIX = {
+    'object_detection': 1.0,
+    'road_extraction': 1.5,
+    'land_segmentation': 1.5,
+    'change_detection': 2.0,
+}
 
 # --- 数据库连接配置 ---
 # !! 请根据您自己的数据库设置修改这里的 password !!
@@ -14,4 +72,97 @@ DB_CONFIG = {
     'password': 'root', # 如果您的密码不是'root'，请修改这里
     'db': 'EndJob',
     'charset': 'utf8'
-}
\ No newline at end of file
+}
+
+# --- 数据库连接池配置 ---
+# 历史记录接口和后台写回队列共用一个连接池；连接全部被占用时最多等待 DB_POOL_TIMEOUT_S 秒
+DB_POOL_SIZE = 8
+DB_POOL_TIMEOUT_S = 5
+# 空闲超过该秒数的连接在检出前先 ping 一次，断开则自动重连
+DB_POOL_PING_INTERVAL_S = 30
+
+# --- 历史记录分页配置 ---
+# GET /api/history/ 每页默认条数与允许的最大条数（limit 参数）
+HISTORY_PAGE_SIZE = 20
+HISTORY_MAX_PAGE_SIZE = 100
+
+# --- 历史记录缓存配置 ---
+# 历史列表/详情查询的读穿透缓存：条目存活秒数与最多缓存的查询数（超出后淘汰最久未使用的）
+HISTORY_CACHE_TTL_S = 30
+HISTORY_CACHE_MAX_ENTRIES = 1024
+# 配置 Redis 地址（如 'redis://127.0.0.1:6379/0'）后多个服务进程共享缓存，需要 pip install redis
+HISTORY_CACHE_REDIS_URL = None
+
+# --- 目标检测微批处理配置 ---
+# 一个批次最多合并的请求数，以及第一个请求到达后最多等待凑批的时间(毫秒)
+DET_BATCH_MAX_SIZE = 8
+DET_BATCH_MAX_WAIT_MS = 5
+
+# --- 预测器池配置 ---
+# 每个模型持有的预测器副本数量(共享权重)，即该模型可同时并行执行的推理数
+PREDICTOR_POOL_SIZE = 2
+
+# --- 分割模型滑窗分块推理配置 ---
+# 长或宽超过 SEG_TILE_SIZE 的图片按窗口分块推理，相邻窗口重叠 SEG_TILE_OVERLAP 像素
+SEG_TILE_SIZE = 1024
+SEG_TILE_OVERLAP = 64
+
+# --- 推理运行时配置 ---
+# 每个模型目录下的 runtime.yml 定义若干运行时 profile(oneDNN、线程数、IR/内存优化、pass 开关)。
+# 这里可以按模型目录名覆盖 runtime.yml 中的 default，例如 {'object_detection': 'native'}
+RUNTIME_PROFILE_OVERRIDES = {}
+# 为 True 时启动前对每个模型的所有 profile 跑一遍自检基准并打印延迟
+RUNTIME_SELF_BENCHMARK = False
+RUNTIME_BENCHMARK_IMAGE = 'static/images/12345/A/train_9.png'
+
+# --- 模型加载与预热配置 ---
+# 为 True 时服务启动后立即在后台并行加载所有模型；否则在第一次请求时才加载
+MODEL_WARMUP_ON_STARTUP = True
+# 并行加载模型的线程数
+MODEL_LOAD_WORKERS = 4
+# 预热推理使用的代表性输入边长：检测模型固定缩放到 640，分割模型按切块尺寸
+MODEL_WARMUP_SIZE = {
+    'object_detection': 640,
+    'road_extraction': SEG_TILE_SIZE,
+    'land_segmentation': SEG_TILE_SIZE,
+    'change_detection': 1024,
+}
+
+# --- 模型内存预算 ---
+# 已驻留模型的估算内存超过预算(MB)后按 LRU 淘汰，None 表示不限制
+MODEL_MEMORY_BUDGET_MB = None
+# 估算常驻内存时每个预测器副本相对权重文件大小的放大系数（中间张量、工作区等），总估算再乘以 PREDICTOR_POOL_SIZE
+MODEL_MEMORY_OVERHEAD = 2.0
+# 地物分割可选的模型变体（前端 'model' 字段的取值 -> 模型目录）
+LAND_SEGMENTATION_MODELS = {
+    'ppliteseg': 'models/land_segmentation/',
+}
+LAND_SEGMENTATION_DEFAULT = 'ppliteseg'
+
+# --- 目标检测后处理默认参数（可被每个请求覆盖）---
+DET_SCORE_THRESHOLD = 0.5
+# 逐类 NMS 的 IoU 阈值，None 表示只使用模型导出时自带的 NMS
+DET_NMS_IOU = None
+
+# --- 目标检测滑窗分块推理配置 ---
+# 长或宽超过 DET_TILE_SIZE 的图片按原始分辨率切窗检测，相邻窗口重叠 DET_TILE_OVERLAP 像素
+DET_TILE_SIZE = 640
+DET_TILE_OVERLAP = 128
+# 合并相邻窗口重复框的 NMS IoU 阈值，以及参与合并前丢弃的极低分框
+DET_TILE_MERGE_IOU = 0.5
+DET_TILE_MIN_SCORE = 0.05
+
+# --- 道路网络分析配置 ---
+# 骨架化按 ROAD_SKELETON_TILE_SIZE 分块并行，每块向外多取 ROAD_SKELETON_HALO 像素上下文（需大于最宽道路的一半）
+ROAD_SKELETON_TILE_SIZE = 2048
+ROAD_SKELETON_HALO = 64
+ROAD_SKELETON_WORKERS = 4
+
+# --- 后台写回队列配置 ---
+# 结果图保存、历史输入拷贝和数据库写入在后台线程中进行；队列满时请求线程阻塞等待
+PERSIST_QUEUE_SIZE = 256
+# 每批最多合并的任务数，以及第一个任务到达后最多等待凑批的时间(毫秒)
+PERSIST_BATCH_SIZE = 32
+PERSIST_FLUSH_INTERVAL_MS = 200
+# 请求静态文件时，若文件仍在写回队列中，最多等待的秒数
+PERSIST_WAIT_TIMEOUT_S = 10
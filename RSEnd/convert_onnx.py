@@ -0,0 +1,54 @@
+# 文件名: convert_onnx.py
+# 把 models/ 下导出的 Paddle 推理模型（model.pdmodel 或新版 PaddleSeg 的 model.json）转换为 ONNX，
+# 保存为同目录下的 model.onnx，供 runtime.yml 中 backend: onnxruntime 的 profile 使用；
+# 已经量化出 int8/ 子目录的模型也会一并转换。在 RSEnd 目录下运行（需要 pip install paddle2onnx onnxruntime）:
+#   python convert_onnx.py
+#   python convert_onnx.py --models object_detection --opset 13
+# 转换后可用 python -m benchmarks.bench_onnx_parity 检查输出一致性并对比延迟。
+# 变化检测模型由 paddlers.deploy.Predictor 加载，不支持切换执行后端，这里不做转换。
+import argparse
+import os
+import shutil
+import subprocess
+
+from api.backends import ONNX_FILE
+from api.runtime import INT8_SUBDIR
+
+# 模型名 -> (模型目录, 模型结构文件)
+MODELS = {
+    'object_detection': ("models/object_detection/", 'model.pdmodel'),
+    'road_extraction': ("models/road_extraction/", 'model.json'),
+    'land_segmentation': ("models/land_segmentation/", 'model.pdmodel'),
+}
+
+
+def convert(model_dir, model_filename, opset):
+    """调用 paddle2onnx 命令行转换一个模型目录，返回生成的 onnx 文件路径。"""
+    save_file = os.path.join(model_dir, ONNX_FILE)
+    subprocess.run(['paddle2onnx', '--model_dir', model_dir, '--model_filename', model_filename,
+                    '--params_filename', 'model.pdiparams', '--save_file', save_file,
+                    '--opset_version', str(opset), '--enable_onnx_checker', 'True'], check=True)
+    return save_file
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Paddle 推理模型转换为 ONNX")
+    parser.add_argument('--models', nargs='+', default=list(MODELS), choices=list(MODELS))
+    parser.add_argument('--opset', type=int, default=13, help="ONNX opset 版本，检测模型的 NMS 至少需要 11")
+    args = parser.parse_args()
+
+    if shutil.which('paddle2onnx') is None:
+        raise SystemExit("未找到 paddle2onnx 命令，请先安装: pip install paddle2onnx")
+    for name in args.models:
+        model_dir, model_filename = MODELS[name]
+        for target in (model_dir, os.path.join(model_dir, INT8_SUBDIR)):
+            if not os.path.exists(os.path.join(target, model_filename)):
+                continue
+            try:
+                print(f"{name}: 已生成 {convert(target, model_filename, args.opset)}")
+            except subprocess.CalledProcessError as e:
+                print(f"{name}: 转换 {target} 失败（返回码 {e.returncode}）")
+
+
+if __name__ == '__main__':
+    main()
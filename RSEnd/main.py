@@ -3,12 +3,19 @@ from flask_cors import CORS
 
 DEBUG = True
 from PIL import Image
-from api.map_analysis import map_analysis_bp
+from api.map_analysis import map_analysis_bp, tile_fetcher
 from api.change_detection备份 import change_detection_bf_bp
 from api.history import history_bp
 from api.road_extraction import road_extraction_bp
 from api.object_detection import object_detection_bp
 from api.land_segmentation import land_segmentation_bp
+from api.model_registry import registry
+from api.runtime import self_benchmark
+from services.persistence import persistence
+from services.db import db_pool
+from services.cache import history_cache
+from services.result_cache import result_cache
+from config import RUNTIME_SELF_BENCHMARK, RUNTIME_BENCHMARK_IMAGE, MODEL_WARMUP_ON_STARTUP, PERSIST_WAIT_TIMEOUT_S
 
 
 app = Flask(__name__)
@@ -21,6 +28,36 @@ app.register_blueprint(road_extraction_bp, url_prefix='/api/road_extraction')
 app.register_blueprint(object_detection_bp, url_prefix='/api/object_detection')
 app.register_blueprint(land_segmentation_bp, url_prefix='/api/land_segmentation')
 app.register_blueprint(map_analysis_bp, url_prefix='/api/map_analysis')
+# 请求结束时释放它从注册表取得的模型，被淘汰的模型在最后一个持有者释放后才关闭
+app.teardown_request(registry.release_request)
+
+
+@app.before_request
+def wait_for_pending_static_file():
+    # 结果图和历史输入图由后台写回队列保存，URL 可能先于文件落盘返回给前端；请求到达时文件还在队列中就等它写完
+    if request.path.startswith('/static/'):
+        persistence.wait_for(request.path.lstrip('/'), timeout=PERSIST_WAIT_TIMEOUT_S)
+
+
+@app.route('/api/health', methods=['GET'])
+def health():
+    # 服务进程启动即可应答，模型在后台加载，各模型的就绪状态单独返回
+    # persistence 中的 queue_depth / last_lag_seconds 持续增长说明后台写回跟不上请求速度
+    # db_pool 中 waits / timeouts 增长说明连接池上限 DB_POOL_SIZE 偏小
+    # history_cache 的 hit_ratio / saved_seconds 是历史查询缓存的命中率与估算节省的数据库查询时间
+    # result_cache 的 hit_ratio 是重复分析直接复用缓存结果、未调用模型的比例
+    # tiles 为地图瓦片下载统计，其中 cache 为本地瓦片缓存的命中情况
+    models = registry.status()
+    return jsonify({"status": "ok", "all_models_ready": all(m["state"] == 'ready' for m in models.values()),
+                    "models": models, "memory": registry.usage(), "persistence": persistence.stats(),
+                    "db_pool": db_pool.stats(), "history_cache": history_cache.stats(),
+                    "result_cache": result_cache.stats(), "tiles": tile_fetcher.stats()})
+
+
+if MODEL_WARMUP_ON_STARTUP:
+    registry.warm_up_async()
 
 if __name__ == '__main__':
+    if RUNTIME_SELF_BENCHMARK:
+        self_benchmark(RUNTIME_BENCHMARK_IMAGE)
     app.run(host="127.0.0.1", port=5000, debug=True)
\ No newline at end of file
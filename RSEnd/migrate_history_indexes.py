@@ -0,0 +1,52 @@
+# 文件名: migrate_history_indexes.py
+# 为 history_records 表补建历史记录分页查询所需的索引，可重复执行（已存在的索引会跳过）。在 RSEnd 目录下运行:
+#   python migrate_history_indexes.py
+#   python migrate_history_indexes.py --dry-run    # 只打印将要执行的 DDL
+# 两个索引都以 (created_at, id) 结尾，与 GET /api/history/ 的 ORDER BY created_at DESC, id DESC 一致：
+#   - idx_history_created_id       不按任务类型过滤的列表、按时间范围过滤；
+#   - idx_history_task_created_id  前端各页面按 task_type 过滤的列表。
+# 键集分页的 WHERE (created_at, id) < (游标) 直接在索引上定位，翻到多深都不需要扫描前面的行。
+# 三个路径列上的前缀索引用于删除记录时判断内容存储中的文件是否还被其他记录引用（路径以内容哈希开头，前缀足以区分）。
+import argparse
+
+from config import DB_CONFIG
+from services.db import db_pool
+
+INDEXES = {
+    'idx_history_created_id': ('created_at', 'id'),
+    'idx_history_task_created_id': ('task_type', 'created_at', 'id'),
+    'idx_history_result_url': ('result_url(80)',),
+    'idx_history_before_url': ('before_image_url(80)',),
+    'idx_history_after_url': ('after_image_url(80)',),
+}
+
+
+def existing_indexes(cursor):
+    cursor.execute("SELECT DISTINCT INDEX_NAME FROM information_schema.STATISTICS "
+                   "WHERE TABLE_SCHEMA = %s AND TABLE_NAME = 'history_records'", (DB_CONFIG['db'],))
+    return {row[0] for row in cursor.fetchall()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="为 history_records 表补建分页查询索引")
+    parser.add_argument('--dry-run', action='store_true', help="只打印 DDL，不执行")
+    args = parser.parse_args()
+
+    with db_pool.connection() as db_conn:
+        with db_conn.cursor() as cursor:
+            existing = existing_indexes(cursor)
+            for name, columns in INDEXES.items():
+                if name in existing:
+                    print(f"索引 {name} 已存在，跳过")
+                    continue
+                ddl = f"ALTER TABLE history_records ADD INDEX {name} ({', '.join(columns)})"
+                print(ddl)
+                if not args.dry_run:
+                    cursor.execute(ddl)
+            if not args.dry_run:
+                cursor.execute("ANALYZE TABLE history_records")
+                cursor.fetchall()
+
+
+if __name__ == '__main__':
+    main()
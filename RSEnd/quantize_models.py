@@ -0,0 +1,237 @@
+# 文件名: quantize_models.py
+# 离线 INT8 训练后量化：用 LEVIR-CD 列表中的样例图片校准 models/ 下的四个模型，
+# 量化结果保存到各模型目录下的 int8/ 子目录，然后对比 FP32 与 INT8 的延迟、内存和任务精度。
+# 在 RSEnd 目录下运行（需要 pip install paddleslim）:
+#   python quantize_models.py --data-root datasets/LEVIR-CD
+#   python quantize_models.py --report-only              # 只重新生成对比报告
+# 服务端通过 runtime.yml 中 precision: int8 的 profile（如 onednn_int8）使用量化模型，
+# 在 config.RUNTIME_PROFILE_OVERRIDES 中按模型指定即可。
+import argparse
+import os
+import shutil
+import time
+
+import cv2
+import numpy as np
+
+from api.metrics import confusion_matrix, mean_iou, f1_score, detection_map
+from api.preprocess import PreprocessPlan, normalize_lut
+from api.runtime import INT8_SUBDIR, RUNTIME_FILE, resolve_profile, paddlers_kwargs, model_variant_dir
+from api.utils import CustomPaddleDetPredictor, CustomPaddleSegPredictor, CustomPaddleSegPredictorFromDetConfig
+from config import DET_SCORE_THRESHOLD
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# 模型名 -> (模型目录, 模型结构文件, 参数文件, 精度指标名)
+MODELS = {
+    'object_detection': ("models/object_detection/", 'model.pdmodel', 'model.pdiparams', 'mAP@0.5'),
+    'road_extraction': ("models/road_extraction/", 'model.json', 'model.pdiparams', 'mIoU'),
+    'land_segmentation': ("models/land_segmentation/", 'model.pdmodel', 'model.pdiparams', 'mIoU'),
+    'rscd': ("models/rscd/", 'model.pdmodel', 'model.pdiparams', 'F1'),
+}
+FP32_PROFILE = 'onednn'
+INT8_PROFILE = 'onednn_int8'
+
+
+def read_samples(data_root, list_file, limit):
+    """读取 LEVIR-CD 风格的列表文件，返回 [(A 图路径, B 图路径, 标签路径或 None)]，跳过不存在的图片。"""
+    samples = []
+    with open(os.path.join(data_root, list_file), 'r', encoding='utf-8') as f:
+        for line in f:
+            parts = [os.path.join(data_root, p) for p in line.split()]
+            if len(parts) < 2 or not (os.path.exists(parts[0]) and os.path.exists(parts[1])):
+                continue
+            label = parts[2] if len(parts) > 2 and os.path.exists(parts[2]) else None
+            samples.append((parts[0], parts[1], label))
+            if len(samples) >= limit:
+                break
+    return samples
+
+
+def build_loader(name, profile):
+    model_dir = MODELS[name][0]
+    if name == 'object_detection':
+        return CustomPaddleDetPredictor(model_dir, profile)
+    if name == 'road_extraction':
+        return CustomPaddleSegPredictor(model_dir, profile)
+    if name == 'land_segmentation':
+        return CustomPaddleSegPredictorFromDetConfig(model_dir, profile)
+    from paddlers.deploy import Predictor
+    _, cfg = resolve_profile(model_dir, profile)
+    return Predictor(model_variant_dir(model_dir, cfg), **paddlers_kwargs(cfg))
+
+
+def run_model(name, loader, sample):
+    """对一个样例推理，检测返回 DetectionResult，其余返回标签图。"""
+    a, b, _ = sample
+    if name == 'object_detection':
+        return loader.predict(a).filter(score_threshold=DET_SCORE_THRESHOLD)
+    if name == 'rscd':
+        rgb = [cv2.cvtColor(cv2.imread(p), cv2.COLOR_BGR2RGB) for p in (a, b)]
+        return loader.predict(tuple(rgb))['label_map']
+    return loader.predict(a)['label_map']
+
+
+def calibration_reader(name, loader, samples):
+    """返回量化校准用的生成器函数，每次产出一个 {输入名: 数组} 的 feed 字典（batch=1）。"""
+    # paddlers.deploy.Predictor 把 Paddle 预测器保存在 .predictor 属性上
+    input_names = loader.predictor.get_input_names()
+    # BIT 的预处理：RGB、(v / 255 - 0.5) / 0.5，两期影像分别作为两个输入
+    cd_plan = PreprocessPlan(lut=normalize_lut([0.5] * 3, [0.5] * 3), to_rgb=True)
+
+    def reader():
+        for a, b, _ in samples:
+            img = cv2.imread(a)
+            if name == 'object_detection':
+                image, im_shape, scale_factor = loader.preprocess(img)
+                feed = {'image': image.copy(), 'im_shape': im_shape, 'scale_factor': scale_factor}
+                yield {k: v for k, v in feed.items() if k in input_names}
+            elif name == 'rscd':
+                yield {input_names[0]: cd_plan(img).copy(), input_names[1]: cd_plan(cv2.imread(b)).copy()}
+            elif name == 'land_segmentation':
+                yield {input_names[0]: loader.preprocess(img)[0].copy()}
+            else:
+                yield {input_names[0]: loader.preprocess(img).copy()}
+    return reader
+
+
+def quantize(name, reader, batch_nums, algo):
+    """调用 PaddleSlim 的静态离线量化，把模型写到 int8/ 子目录并拷贝部署所需的 yml 文件。"""
+    try:
+        from paddleslim.quant import quant_post_static
+    except ImportError:
+        raise ImportError("离线量化需要 PaddleSlim，请先安装: pip install paddleslim")
+    import paddle
+
+    model_dir, model_file, params_file, _ = MODELS[name]
+    out_dir = os.path.join(model_dir, INT8_SUBDIR)
+    paddle.enable_static()
+    try:
+        quant_post_static(executor=paddle.static.Executor(paddle.CPUPlace()), model_dir=model_dir,
+                          quantize_model_path=out_dir, data_loader=reader,
+                          model_filename=model_file, params_filename=params_file,
+                          save_model_filename=model_file, save_params_filename=params_file,
+                          batch_nums=batch_nums, algo=algo)
+    finally:
+        paddle.disable_static()
+    # model.yml / deploy.yaml 等与精度无关，paddlers 需要它们和模型文件在同一目录；runtime.yml 只在原目录维护
+    for f in os.listdir(model_dir):
+        if f.endswith(('.yml', '.yaml')) and f != RUNTIME_FILE:
+            shutil.copy(os.path.join(model_dir, f), out_dir)
+    return out_dir
+
+
+def rss_mb():
+    return psutil.Process().memory_info().rss / 1024 / 1024 if psutil else None
+
+
+def evaluate(name, profile, samples, warmup=2):
+    """
+    用指定 profile 加载模型并在评估样例上推理。
+
+    Returns:
+        dict: latency_ms、memory_mb（加载模型并完成首次推理后进程常驻内存的增量，近似值；未安装 psutil 时为 None）
+            以及每个样例的输出 outputs。
+    """
+    before = rss_mb()
+    loader = build_loader(name, profile)
+    for sample in samples[:warmup]:
+        run_model(name, loader, sample)
+    memory = rss_mb() - before if before is not None else None
+    outputs = []
+    start = time.perf_counter()
+    for sample in samples:
+        outputs.append(run_model(name, loader, sample))
+    latency = (time.perf_counter() - start) / len(samples) * 1000
+    return {'latency_ms': latency, 'memory_mb': memory, 'outputs': outputs}
+
+
+def task_metric(name, outputs, references, samples, num_classes):
+    """
+    任务精度。变化检测有真值标签时对标签计算变化类 F1；其余模型没有随仓库提供的标注，
+    以 FP32 模型的输出作为参照（FP32 自身的得分恒为 1），衡量量化带来的精度损失。
+    """
+    if name == 'object_detection':
+        return detection_map(outputs, references, num_classes)
+    if name == 'rscd':
+        cm = np.zeros((2, 2), dtype=np.int64)
+        for out, ref, (_, _, label) in zip(outputs, references, samples):
+            truth = (cv2.imread(label, cv2.IMREAD_GRAYSCALE) > 0) if label else ref > 0
+            cm += confusion_matrix(out > 0, truth, 2)
+        return f1_score(cm)
+    cm = np.zeros((num_classes, num_classes), dtype=np.int64)
+    for out, ref in zip(outputs, references):
+        cm += confusion_matrix(out, ref, num_classes)
+    return mean_iou(cm)
+
+
+def num_classes_of(name, fp32_outputs):
+    if name == 'object_detection':
+        return len(fp32_outputs[0].label_list)
+    if name == 'rscd':
+        return 2
+    return int(max(out.max() for out in fp32_outputs)) + 1
+
+
+def print_report(rows):
+    print("\n--- FP32 / INT8 对比报告 ---")
+    print(f"{'模型':<20}{'精度':<6}{'延迟(ms)':>10}{'内存(MB)':>10}{'加速比':>8}  指标")
+    for name, metric_name, fp32, int8 in rows:
+        for tag, r in (('FP32', fp32), ('INT8', int8)):
+            if r is None:
+                continue
+            if 'error' in r:
+                print(f"{name:<20}{tag:<6}  {r['error']}")
+                continue
+            memory = f"{r['memory_mb']:10.1f}" if r['memory_mb'] is not None else f"{'N/A':>10}"
+            speedup = f"{fp32['latency_ms'] / r['latency_ms']:8.2f}" if 'error' not in fp32 else f"{'-':>8}"
+            print(f"{name:<20}{tag:<6}{r['latency_ms']:10.1f}{memory}{speedup}  {metric_name}={r['metric']:.4f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="模型离线 INT8 量化与精度/速度对比")
+    parser.add_argument('--models', nargs='+', default=list(MODELS), choices=list(MODELS))
+    parser.add_argument('--data-root', default='datasets/LEVIR-CD')
+    parser.add_argument('--calib-list', default='train_list.txt')
+    parser.add_argument('--eval-list', default='val_list.txt')
+    parser.add_argument('--calib-num', type=int, default=32, help="校准使用的样例数量")
+    parser.add_argument('--eval-num', type=int, default=20, help="对比评估使用的样例数量")
+    parser.add_argument('--algo', default='hist', choices=['KL', 'hist', 'avg', 'mse', 'abs_max'])
+    parser.add_argument('--report-only', action='store_true', help="不重新量化，只对比已有的 int8/ 模型")
+    args = parser.parse_args()
+
+    calib_samples = read_samples(args.data_root, args.calib_list, args.calib_num)
+    eval_samples = read_samples(args.data_root, args.eval_list, args.eval_num)
+    if not eval_samples or (not args.report_only and not calib_samples):
+        raise SystemExit(f"在 {args.data_root} 下没有找到列表中的图片，请检查 --data-root")
+
+    rows = []
+    for name in args.models:
+        metric_name = MODELS[name][3]
+        print(f"=== {name} ===")
+        try:
+            if not args.report_only:
+                loader = build_loader(name, FP32_PROFILE)
+                out_dir = quantize(name, calibration_reader(name, loader, calib_samples), len(calib_samples), args.algo)
+                print(f"量化模型已保存到 {out_dir}")
+                del loader
+            fp32 = evaluate(name, FP32_PROFILE, eval_samples)
+        except Exception as e:
+            rows.append((name, metric_name, {'error': f"失败: {e}"}, None))
+            continue
+        num_classes = num_classes_of(name, fp32['outputs'])
+        fp32['metric'] = task_metric(name, fp32['outputs'], fp32['outputs'], eval_samples, num_classes)
+        try:
+            int8 = evaluate(name, INT8_PROFILE, eval_samples)
+            int8['metric'] = task_metric(name, int8['outputs'], fp32['outputs'], eval_samples, num_classes)
+        except Exception as e:
+            int8 = {'error': f"失败: {e}"}
+        rows.append((name, metric_name, fp32, int8))
+    print_report(rows)
+
+
+if __name__ == '__main__':
+    main()
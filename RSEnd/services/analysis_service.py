@@ -1,19 +1,62 @@
-import os, shutil, uuid, json, pymysql
+import os, json
 import numpy as np
 from PIL import Image
-from skimage.morphology import skeletonize
 import cv2
-from config import RESULT_FOLDER, HISTORY_INPUT_FOLDER, DB_CONFIG
+from config import (DET_SCORE_THRESHOLD, DET_NMS_IOU,
+                    ROAD_SKELETON_TILE_SIZE, ROAD_SKELETON_HALO, ROAD_SKELETON_WORKERS)
+from api.utils import load_image
+from api.label_maps import class_statistics, class_pixel_counts, build_palette, save_palettized_png
+from api.road_network import analyze_road_network
+from api.model_registry import registry
+from services.persistence import persistence, PersistJob, history_input_job, history_record, result_job
+from services.result_cache import result_cache
+from services.storage import content_key
 
 
-def perform_road_extraction_analysis(image_path: str, predictor):
+def _check_image_input(image):
+    """路径输入需要存在；编码字节和数组输入直接放行。返回错误信息或 None。"""
+    if isinstance(image, str) and not os.path.exists(image):
+        return f"图片路径不存在: {image}"
+    return None
+
+
+def _cached_result(cache_key, task_type=None, inputs=()):
+    """
+    查询结果缓存，命中时不调用预测器，直接返回服务函数的结果字典；未命中返回 None。
+    缓存指向的结果图已被回收时丢弃该条目。task_type 不为 None 时像正常分析一样为本次请求追加一条历史记录，
+    inputs 为 [(图片, 内容键)]，依次作为 before / after 图片。
+    """
+    cached = result_cache.get(cache_key)
+    if not cached:
+        return None
+    result_path = cached["result_url_relative"]
+    if not (os.path.exists(result_path) or persistence.is_pending(result_path)):
+        result_cache.discard(cache_key)
+        return None
+    if task_type:
+        jobs = [history_input_job(image, key) for image, key in inputs]
+        input_paths = [path for path, _ in jobs]
+        sql, params = history_record(task_type, result_path, input_paths[0],
+                                     json.dumps(cached["metrics"], ensure_ascii=False),
+                                     after_url=input_paths[1] if len(input_paths) > 1 else None)
+        persistence.submit(PersistJob([file for _, file in jobs], sql, params))
+    return {"success": True, **cached}
+
+
+def _store_result(cache_key, response):
+    result_cache.put(cache_key, {k: v for k, v in response.items() if k != "success"})
+    return response
+
+
+def perform_road_extraction_analysis(image, predictor, model_name='road_extraction'):
     """
     一个纯粹的、可复用的道路提取分析函数。
     它不依赖任何Flask的request或jsonify。
 
     Args:
-        image_path (str): 输入的待分析图片的本地路径。
+        image: 输入的待分析图片，可以是本地路径、编码后的图片字节或已解码的 BGR 数组。
         predictor: 已加载的PaddleX模型实例。
+        model_name: 预测器在注册表中的名字，用于取模型版本作为结果缓存键的一部分。
 
     Returns:
         dict: 包含分析结果的字典。
@@ -22,63 +65,60 @@ def perform_road_extraction_analysis(image_path: str, predictor):
     if not predictor:
         print("错误：模型未被加载！")
         return None
-    if not os.path.exists(image_path):
-        print(f"错误：图片路径不存在: {image_path}")
+    error = _check_image_input(image)
+    if error:
+        print(f"错误：{error}")
         return None
 
     try:
+        # 0. 同一输入、同一模型版本分析过时直接返回缓存结果
+        input_key = content_key(image)
+        cache_key = result_cache.key(model_name, registry.version(model_name), {}, [input_key])
+        cached = _cached_result(cache_key, '道路提取', [(image, input_key)])
+        if cached:
+            return cached
+
         # 1. AI模型预测
-        result = predictor.predict(image_path)
+        result = predictor.predict(image)
         original_label_map = result['label_map']
 
         # 2. 计算专属指标
         binary_map = (original_label_map > 0).astype(np.uint8)
-        skeleton = skeletonize(binary_map.astype(bool))
+        # 分块并行骨架化，在骨架的稀疏像素图上一次得到长度、交叉口、端点、路段和连通分量
+        network = analyze_road_network(binary_map, tile_size=ROAD_SKELETON_TILE_SIZE, halo=ROAD_SKELETON_HALO,
+                                       max_workers=ROAD_SKELETON_WORKERS)
 
-        road_pixel_length = np.sum(skeleton)
         # 假设每个像素代表0.5米，这个值未来可以根据地图的zoom-level动态计算
-        total_road_length_km = round((road_pixel_length * 0.5) / 1000, 4)
-        num_labels, _, _, _ = cv2.connectedComponentsWithStats(binary_map, connectivity=8)
-        road_segment_count = num_labels - 1
-
+        pixel_size_m = 0.5
+        segment_lengths_m = network["segment_lengths_px"] * pixel_size_m
         metrics_data = {
-            "道路网络总长度(km)": total_road_length_km,
-            "独立路段数量": road_segment_count,
-            "道路覆盖率(%)": round((np.sum(binary_map) / binary_map.size) * 100, 2)
+            "道路网络总长度(km)": round(network["length_px"] * pixel_size_m / 1000, 4),
+            "独立路段数量": network["components"],
+            "道路覆盖率(%)": round((np.count_nonzero(binary_map) / binary_map.size) * 100, 2),
+            "交叉口数量": network["junctions"],
+            "端点数量": network["endpoints"],
+            "分段数量": int(segment_lengths_m.shape[0]),
+            "平均分段长度(m)": round(float(segment_lengths_m.mean()), 2) if segment_lengths_m.size else 0,
+            "最长分段长度(m)": round(float(segment_lengths_m[0]), 2) if segment_lengths_m.size else 0
         }
 
-        # 3. 保存结果图片和历史输入图片
-        result_filename = f"{uuid.uuid4()}.png"
-        result_relative_path = os.path.join(RESULT_FOLDER, result_filename)
-        Image.fromarray(binary_map * 255).save(result_relative_path)
-
-        # 将输入图片复制到历史记录文件夹
-        history_input_filename = os.path.basename(image_path)
-        final_input_relative_path = os.path.join(HISTORY_INPUT_FOLDER, history_input_filename)
-        shutil.copy(image_path, final_input_relative_path)
+        # 3. 确定结果图片和历史输入图片的路径（按内容寻址，重复内容不再写盘），编码写盘交给后台写回队列
+        result_relative_path, result_file = result_job(
+            'road_extraction', [binary_map], lambda path: Image.fromarray(binary_map * 255).save(path))
+        final_input_relative_path, input_file = history_input_job(image, input_key)
 
-        # 4. 保存历史记录到数据库
-        # 注意：每次都重新连接数据库不是最高效的方式，但对于当前场景是可行的。
-        db_conn = pymysql.connect(**DB_CONFIG)
-        cursor = db_conn.cursor()
+        # 4. 历史记录与文件一起在后台批量写入数据库，存储相对路径，不包含域名
         metrics_str = json.dumps(metrics_data, ensure_ascii=False)  # ensure_ascii=False 支持中文
-
-        sql = "INSERT INTO history_records (task_type, result_url, before_image_url, detection_metrics_json) VALUES (%s, %s, %s, %s)"
-        # 存储相对路径，不包含域名
-        cursor.execute(sql, ('道路提取', result_relative_path.replace('\\', '/'),
-                             final_input_relative_path.replace('\\', '/'), metrics_str))
-
-        db_conn.commit()
-        cursor.close()
-        db_conn.close()
+        sql, params = history_record('道路提取', result_relative_path, final_input_relative_path, metrics_str)
+        persistence.submit(PersistJob([result_file, input_file], sql, params))
 
         # 5. 返回一个包含所有信息的纯字典
-        return {
+        return _store_result(cache_key, {
             "success": True,
             "result_url_relative": result_relative_path.replace('\\', '/'),
             "metrics": metrics_data,
             "raw_results": None
-        }
+        })
 
     except Exception as e:
         print(f"!!! 道路提取核心分析函数出错: {e}")
@@ -86,13 +126,18 @@ def perform_road_extraction_analysis(image_path: str, predictor):
         traceback.print_exc()
         return {"success": False, "error": str(e)}
 
-def perform_object_detection(image_path: str, predictor):
+def perform_object_detection(image, predictor, score_threshold=None, class_thresholds=None, nms_iou=None,
+                             model_name='object_detection'):
     """
     一个纯粹的、可复用的目标检测分析函数。
 
     Args:
-        image_path (str): 输入的待分析图片的本地路径。
+        image: 输入的待分析图片，可以是本地路径、编码后的图片字节或已解码的 BGR 数组。
         predictor: 已加载的目标检测模型实例。
+        score_threshold (float): 本次请求的分数阈值，默认 config.DET_SCORE_THRESHOLD。
+        class_thresholds (dict): {类别名: 阈值}，按类别覆盖 score_threshold。
+        nms_iou (float): 不为 None 时额外做一次逐类 NMS，默认 config.DET_NMS_IOU。
+        model_name: 预测器在注册表中的名字，用于取模型版本作为结果缓存键的一部分。
 
     Returns:
         dict: 包含分析结果的字典 {success: bool, ...}。
@@ -100,53 +145,61 @@ def perform_object_detection(image_path: str, predictor):
     if not predictor:
         print("错误：目标检测模型未被加载！")
         return {"success": False, "error": "模型未加载"}
-    if not os.path.exists(image_path):
-        print(f"错误：图片路径不存在: {image_path}")
+    error = _check_image_input(image)
+    if error:
+        print(f"错误：{error}")
         return {"success": False, "error": "图片路径不存在"}
 
     try:
-        # 1. 模型预测
-        results = predictor.predict(image_path)
+        score_threshold = DET_SCORE_THRESHOLD if score_threshold is None else score_threshold
+        nms_iou = DET_NMS_IOU if nms_iou is None else nms_iou
+        # 0. 同一输入、同一模型版本和后处理参数分析过时直接返回缓存结果
+        input_key = content_key(image)
+        cache_key = result_cache.key(model_name, registry.version(model_name),
+                                     {"score_threshold": score_threshold, "class_thresholds": class_thresholds,
+                                      "nms_iou": nms_iou}, [input_key])
+        cached = _cached_result(cache_key, '目标检测', [(image, input_key)])
+        if cached:
+            return cached
+
+        # 1. 模型预测（只解码一次，预测和画框共用同一份数组）
+        decoded = load_image(image)
+        # 预测器返回列式结果（数组），阈值过滤和 NMS 按本次请求的参数在数组上完成
+        results = predictor.predict(decoded).filter(
+            score_threshold=score_threshold, class_thresholds=class_thresholds, nms_iou=nms_iou)
 
         # 2. 计算专属指标
-        count_by_class = {}
-        for item in results:
-            category = item['category']
-            count_by_class[category] = count_by_class.get(category, 0) + 1
-        metrics_data = {"检测总数": len(results), "各类别数量": count_by_class}
-
-        # 3. 在原图上绘制检测框
-        image = cv2.imread(image_path)
-        for item in results:
-            x1, y1, w, h = [int(v) for v in item['bbox']]
-            cv2.rectangle(image, (x1, y1), (x1 + w, y1 + h), (0, 255, 0), 2)
-            cv2.putText(image, f"{item['category']}: {item['score']:.2f}", (x1, y1 - 10),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
-
-        result_filename = f"{uuid.uuid4()}.png"
-        result_relative_path = os.path.join(RESULT_FOLDER, result_filename)
-        cv2.imwrite(result_relative_path, image)
+        metrics_data = {"检测总数": len(results), "各类别数量": results.counts_by_class()}
+
+        # 3. 在原图上绘制检测框并保存（在后台写回线程中执行；调用者传入的数组不能被改写，需要拷贝一份）
+        def draw_and_save(path):
+            canvas = decoded.copy() if decoded is image else decoded
+            labels = results.label_list
+            for (x1, y1, x2, y2), class_id, score in zip(results.boxes.astype(int).tolist(),
+                                                         results.class_ids.tolist(), results.scores.tolist()):
+                cv2.rectangle(canvas, (x1, y1), (x2, y2), (0, 255, 0), 2)
+                cv2.putText(canvas, f"{labels[class_id]}: {score:.2f}", (x1, y1 - 10),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+            cv2.imwrite(path, canvas)
+
+        # 结果图由原图和画上去的检测框决定
+        result_relative_path, result_file = result_job(
+            'object_detection', [decoded, results.boxes, results.class_ids, results.scores,
+                                 '|'.join(results.label_list)], draw_and_save)
 
         # 4. 保存历史记录
-        final_input_relative_path = os.path.join(HISTORY_INPUT_FOLDER, os.path.basename(image_path))
-        shutil.copy(image_path, final_input_relative_path)
-
-        db_conn = pymysql.connect(**DB_CONFIG) # 假设DB_CONFIG在config.py中
-        cursor = db_conn.cursor()
+        final_input_relative_path, input_file = history_input_job(image, input_key)
         metrics_str = json.dumps(metrics_data, ensure_ascii=False)
-        sql = "INSERT INTO history_records (task_type, result_url, before_image_url, detection_metrics_json) VALUES (%s, %s, %s, %s)"
-        cursor.execute(sql, ('目标检测', result_relative_path.replace('\\','/'), final_input_relative_path.replace('\\','/'), metrics_str))
-        db_conn.commit()
-        cursor.close()
-        db_conn.close()
-
-        # 5. 返回包含所有信息的纯字典
-        return {
+        sql, params = history_record('目标检测', result_relative_path, final_input_relative_path, metrics_str)
+        persistence.submit(PersistJob([result_file, input_file], sql, params))
+
+        # 5. 返回包含所有信息的纯字典（到这里才把列式结果转换成 JSON 用的字典列表）
+        return _store_result(cache_key, {
             "success": True,
             "result_url_relative": result_relative_path.replace('\\', '/'),
             "metrics": metrics_data,
-            "raw_results": results
-        }
+            "raw_results": results.to_json()
+        })
     except Exception as e:
         print(f"!!! 目标检测核心分析函数出错: {e}")
         import traceback
@@ -154,67 +207,74 @@ def perform_object_detection(image_path: str, predictor):
         return {"success": False, "error": str(e)}
 
 
-def perform_change_detection(image_path_a: str, image_path_b: str, predictor):
+def perform_change_detection(image_a, image_b, predictor, model_name='change_detection'):
     """
     一个纯粹的、可复用的变化检测分析函数。
 
     Args:
-        image_path_a (str): 时期A的图片路径。
-        image_path_b (str): 时期B的图片路径。
+        image_a: 时期A的图片，可以是路径、编码后的图片字节或已解码的 BGR 数组。
+        image_b: 时期B的图片，形式同上。
         predictor: 已加载的变化检测模型实例。
+        model_name: 预测器在注册表中的名字，用于取模型版本作为结果缓存键的一部分。
 
     Returns:
         dict: 包含分析结果的字典 {success: bool, ...}。
     """
     if not predictor:
         return {"success": False, "error": "模型未加载"}
-    if not os.path.exists(image_path_a) or not os.path.exists(image_path_b):
+    if _check_image_input(image_a) or _check_image_input(image_b):
         return {"success": False, "error": "图片路径不完整或不存在"}
 
     try:
+        # 0. 同一对输入、同一模型版本分析过时直接返回缓存结果
+        key_a, key_b = content_key(image_a), content_key(image_b)
+        cache_key = result_cache.key(model_name, registry.version(model_name), {}, [key_a, key_b])
+        cached = _cached_result(cache_key, '变化检测', [(image_a, key_a), (image_b, key_b)])
+        if cached:
+            return cached
+
         # 1. 模型预测
-        result = predictor.predict((image_path_a, image_path_b))
+        # paddlers 的 Predictor 直接读取路径；内存中的图片需要解码后以 RGB 数组传入（与它读文件后的通道顺序一致）
+        if isinstance(image_a, str) and isinstance(image_b, str):
+            result = predictor.predict((image_a, image_b))
+        else:
+            result = predictor.predict((cv2.cvtColor(load_image(image_a), cv2.COLOR_BGR2RGB),
+                                        cv2.cvtColor(load_image(image_b), cv2.COLOR_BGR2RGB)))
         label_map = result['label_map']
 
-        # 2. 保存历史输入图片
-        final_path_a_relative = os.path.join(HISTORY_INPUT_FOLDER, os.path.basename(image_path_a))
-        final_path_b_relative = os.path.join(HISTORY_INPUT_FOLDER, os.path.basename(image_path_b))
-        shutil.copy(image_path_a, final_path_a_relative)
-        shutil.copy(image_path_b, final_path_b_relative)
+        # 2. 历史输入图片的保存路径
+        final_path_a_relative, input_file_a = history_input_job(image_a, key_a)
+        final_path_b_relative, input_file_b = history_input_job(image_b, key_b)
+
+        # 3. 结果图路径（二值化和 PNG 编码在后台完成）
+        def save_result(path):
+            binary_map = (label_map > 0).astype(np.uint8) * 255  # 通常变化检测结果是0和1
+            Image.fromarray(binary_map).save(path)
 
-        # 3. 保存结果图
-        result_filename = f"{uuid.uuid4()}.png"
-        result_relative_path = os.path.join(RESULT_FOLDER, result_filename)
-        binary_map = (label_map > 0).astype(np.uint8) * 255  # 通常变化检测结果是0和1
-        Image.fromarray(binary_map).save(result_relative_path)
+        result_relative_path, result_file = result_job('change_detection', [label_map], save_result)
 
         # 4. 计算指标
         # 假设每个像素代表0.5m x 0.5m
         pixel_area_m2 = 0.5 * 0.5
-        change_area_m2 = np.sum(label_map == 1) * pixel_area_m2
+        changed_pixels = int(class_pixel_counts(label_map, 2)[1])
+        change_area_m2 = changed_pixels * pixel_area_m2
         metrics_data = {
             "变化区域面积(km²)": round(change_area_m2 / 1_000_000, 4),
-            "变化率(%)": round((np.sum(label_map == 1) / label_map.size) * 100, 2) if label_map.size > 0 else 0
+            "变化率(%)": round((changed_pixels / label_map.size) * 100, 2) if label_map.size > 0 else 0
         }
 
-        # 5. 存入数据库
-        db_conn = pymysql.connect(**DB_CONFIG)
-        cursor = db_conn.cursor()
+        # 5. 文件和数据库记录交给后台写回队列
         metrics_str = json.dumps(metrics_data, ensure_ascii=False)
-        sql = "INSERT INTO history_records (task_type, result_url, before_image_url, after_image_url, detection_metrics_json) VALUES (%s, %s, %s, %s, %s)"
-        cursor.execute(sql,
-                       ('变化检测', result_relative_path.replace('\\', '/'), final_path_a_relative.replace('\\', '/'),
-                        final_path_b_relative.replace('\\', '/'), metrics_str))
-        db_conn.commit()
-        cursor.close()
-        db_conn.close()
+        sql, params = history_record('变化检测', result_relative_path, final_path_a_relative, metrics_str,
+                                     after_url=final_path_b_relative)
+        persistence.submit(PersistJob([result_file, input_file_a, input_file_b], sql, params))
 
         # 6. 返回成功结果
-        return {
+        return _store_result(cache_key, {
             "success": True,
             "result_url_relative": result_relative_path.replace('\\', '/'),
             "metrics": metrics_data
-        }
+        })
     except Exception as e:
         print(f"!!! 变化检测核心分析函数出错: {e}")
         import traceback
@@ -233,63 +293,57 @@ CLASS_COLOR_MAP = {
     6: [255, 0, 255]  # 其他 - 紫色
 }
 CLASS_NAMES = {0: "背景", 1: "建筑", 2: "道路", 3: "水体", 4: "植被", 5: "耕地", 6: "其他"}
+# 调色板在导入时构建一次，结果图直接以调色板 PNG 保存
+CLASS_PALETTE = build_palette(CLASS_COLOR_MAP)
 
 
-def perform_land_segmentation(image_path: str, predictor):
+def perform_land_segmentation(image, predictor, model_name='land_segmentation'):
     """
     一个纯粹的、可复用的地物分类分析函数。
+    image 可以是本地路径、编码后的图片字节或已解码的 BGR 数组；model_name 为预测器在注册表中的名字（含变体）。
     返回格式与其他服务函数保持一致。
     """
     if not predictor:
         return {"success": False, "error": "地物分割模型未加载"}
-    if not os.path.exists(image_path):
-        return {"success": False, "error": f"图片路径不存在: {image_path}"}
+    error = _check_image_input(image)
+    if error:
+        return {"success": False, "error": error}
 
     try:
+        # 0. 同一输入、同一模型版本分析过时直接返回缓存结果（这里不写历史记录，缓存命中时同样不写）
+        cache_key = result_cache.key(model_name, registry.version(model_name), {}, [content_key(image)])
+        cached = _cached_result(cache_key)
+        if cached:
+            return cached
+
         # 1. 模型预测
-        result = predictor.predict(image_path)
+        result = predictor.predict(image)
         if 'label_map' not in result:
             raise KeyError("预测结果格式不正确，缺少'label_map'")
         label_map = result['label_map']
 
-        # 2. 计算指标
-        metrics_data = []
-        total_pixels = label_map.size
-        for class_id, class_name in CLASS_NAMES.items():
-            if class_id == 0: continue  # 通常不统计背景
-            pixel_count = np.sum(label_map == class_id)
-            # 假设像素分辨率是 0.5m x 0.5m
-            area_m2 = round(pixel_count * 0.5 * 0.5, 2)
-            percentage = round((pixel_count / total_pixels) * 100, 2) if total_pixels > 0 else 0
-            metrics_data.append({
-                "地物类别": class_name,
-                "面积(平方米)": area_m2,
-                "占比(%)": percentage
-            })
+        # 2. 计算指标：一次直方图统计得到所有类别的像素数（不统计背景）
+        # 假设像素分辨率是 0.5m x 0.5m
+        metrics_data = [{"地物类别": s["class_name"], "面积(平方米)": s["area_m2"], "占比(%)": s["percentage"]}
+                        for s in class_statistics(label_map, CLASS_NAMES, pixel_area_m2=0.5 * 0.5)]
 
         # 3. 生成彩色结果图
-        # 注意：我们需要的是RGBA格式的PNG，以便在地图上实现半透明叠加
-        color_map_image_rgba = np.zeros((label_map.shape[0], label_map.shape[1], 4), dtype=np.uint8)
-        for class_id, color_bgr in CLASS_COLOR_MAP.items():
-            if class_id == 0: continue  # 背景保持透明
-            # 将 BGR 转换为 RGBA
-            color_rgba = [color_bgr[2], color_bgr[1], color_bgr[0], 255]  # R, G, B, Alpha
-            color_map_image_rgba[label_map == class_id] = color_rgba
-
-        result_filename = f"{uuid.uuid4()}.png"
-        result_relative_path = os.path.join(RESULT_FOLDER, result_filename)
-        Image.fromarray(color_map_image_rgba, 'RGBA').save(result_relative_path)
+        # 保存为调色板 PNG，背景(0)通过 tRNS 设为透明，以便在地图上实现半透明叠加，不再构建 RGBA 缓冲区
+        result_relative_path, result_file = result_job(
+            'land_segmentation_transparent', [CLASS_PALETTE, label_map],
+            lambda path: save_palettized_png(label_map, CLASS_PALETTE, path, transparent_index=0))
+        persistence.submit(PersistJob([result_file]))
 
         # 4. 保存历史记录 (这部分逻辑和之前一样)
         # ... (省略数据库操作代码，假设它和你的原代码一样)
 
         # 5. 返回统一格式的结果
-        return {
+        return _store_result(cache_key, {
             "success": True,
             "result_url_relative": result_relative_path.replace('\\', '/'),
             "metrics": metrics_data,
             "raw_results": None  # 地物分割通常不返回这个
-        }
+        })
     except Exception as e:
         import traceback
         traceback.print_exc()
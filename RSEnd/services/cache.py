@@ -0,0 +1,165 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from config import HISTORY_CACHE_TTL_S, HISTORY_CACHE_MAX_ENTRIES, HISTORY_CACHE_REDIS_URL
+
+
+class TTLCache:
+    """进程内缓存：超过 ttl_s 的条目视为不存在，条目数超过 max_entries 时淘汰最久未使用的条目。"""
+
+    def __init__(self, max_entries=1024, ttl_s=30):
+        self.max_entries = max(1, int(max_entries))
+        self.ttl_s = ttl_s
+        self._entries = OrderedDict()  # key -> (过期时间, 值)
+        self._generations = {}
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key):
+        """返回 (是否命中, 值)。"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            if entry[0] < time.monotonic():
+                del self._entries[key]
+                return False, None
+            self._entries.move_to_end(key)
+            return True, entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_s, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def generation(self, name):
+        with self._lock:
+            return self._generations.get(name, 0)
+
+    def bump(self, name):
+        """让以 generation(name) 为键前缀的所有条目一次性失效；旧条目不再被访问，由 LRU 逐步淘汰。"""
+        with self._lock:
+            self._generations[name] = self._generations.get(name, 0) + 1
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RedisCache:
+    """
+    与 TTLCache 接口相同的 Redis 缓存，多个服务进程共享同一份缓存和失效状态。
+    值以 JSON 保存并设置 ttl_s 过期；容量上限和 LRU 淘汰交给 Redis 的 maxmemory / maxmemory-policy allkeys-lru。
+    """
+
+    def __init__(self, url, ttl_s=30, prefix='rsend:'):
+        import redis  # 可选依赖，只有配置了 Redis 地址时才需要安装
+
+        self.client = redis.Redis.from_url(url)
+        self.ttl_s = ttl_s
+        self.prefix = prefix
+        self.evictions = 0
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        return (False, None) if raw is None else (True, json.loads(raw))
+
+    def set(self, key, value):
+        self.client.set(self.prefix + key, json.dumps(value, ensure_ascii=False), ex=max(1, int(self.ttl_s)))
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def generation(self, name):
+        return int(self.client.get(f"{self.prefix}gen:{name}") or 0)
+
+    def bump(self, name):
+        self.client.incr(f"{self.prefix}gen:{name}")
+
+    def __len__(self):
+        return -1
+
+
+class ReadThroughCache:
+    """
+    读穿透缓存：get_or_load() 未命中时调用 loader 查询数据库并写入缓存。
+    每个条目记录它当初的加载耗时，命中时累加到 saved_seconds，用来估算缓存节省的数据库查询时间。
+    loader 返回 None（如记录不存在）时不缓存，避免新插入的记录在 TTL 内被当作不存在。
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "invalidations": 0, "load_seconds": 0.0, "saved_seconds": 0.0}
+
+    def get_or_load(self, key, loader):
+        hit, entry = self.backend.get(key)
+        if hit:
+            value, load_seconds = entry
+            with self._lock:
+                self._stats["hits"] += 1
+                self._stats["saved_seconds"] += load_seconds
+            return value
+        start = time.perf_counter()
+        value = loader()
+        load_seconds = time.perf_counter() - start
+        with self._lock:
+            self._stats["misses"] += 1
+            self._stats["load_seconds"] += load_seconds
+        if value is not None:
+            self.backend.set(key, (value, load_seconds))
+        return value
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        stats["avg_load_ms"] = round(stats["load_seconds"] / stats["misses"] * 1000, 2) if stats["misses"] else 0.0
+        stats["load_seconds"] = round(stats["load_seconds"], 3)
+        stats["saved_seconds"] = round(stats["saved_seconds"], 3)
+        stats["entries"] = len(self.backend)
+        stats["evictions"] = self.backend.evictions
+        return stats
+
+    def _count_invalidation(self):
+        with self._lock:
+            self._stats["invalidations"] += 1
+
+
+class HistoryCache(ReadThroughCache):
+    """
+    history_records 查询缓存。详情按 id 缓存；列表按查询参数缓存，键中带有列表代数(generation)，
+    插入或删除任何记录时代数加一，所有列表结果同时失效（新记录总是出现在列表第一页，无法只失效部分列表）。
+    """
+
+    def list(self, query_key, loader):
+        generation = self.backend.generation('history_list')
+        return self.get_or_load(f"history:list:{generation}:{query_key}", loader)
+
+    def detail(self, record_id, loader):
+        return self.get_or_load(f"history:detail:{record_id}", loader)
+
+    def invalidate(self, record_id=None):
+        """有记录插入（record_id 为 None）或删除时调用。"""
+        self.backend.bump('history_list')
+        if record_id is not None:
+            self.backend.delete(f"history:detail:{record_id}")
+        self._count_invalidation()
+
+
+def _history_backend():
+    if HISTORY_CACHE_REDIS_URL:
+        return RedisCache(HISTORY_CACHE_REDIS_URL, ttl_s=HISTORY_CACHE_TTL_S)
+    return TTLCache(max_entries=HISTORY_CACHE_MAX_ENTRIES, ttl_s=HISTORY_CACHE_TTL_S)
+
+
+history_cache = HistoryCache(_history_backend())
@@ -0,0 +1,122 @@
+import atexit
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import pymysql
+
+from config import DB_CONFIG, DB_POOL_SIZE, DB_POOL_TIMEOUT_S, DB_POOL_PING_INTERVAL_S
+
+
+class ConnectionPool:
+    """
+    进程内共享的 MySQL 连接池，所有数据库访问都通过 connection() 检出连接、用完归还。
+
+    - 最多同时存在 max_size 个连接，用完时等待 timeout 秒，仍没有空闲连接则抛出 TimeoutError；
+    - 空闲超过 ping_interval 秒的连接检出前先 ping(reconnect=True)，MySQL 因 wait_timeout 断开的连接会被自动重连；
+    - with 块内出现连接级错误（OperationalError / InterfaceError）时丢弃该连接，下次检出时重新创建；
+      其他异常只回滚本次事务，连接照常归还；
+    - 连接没有开启 autocommit，归还前总会 rollback() 结束当前事务（写入需要在 with 块内自行 commit）。
+      否则只执行过 SELECT 的连接会带着 REPEATABLE READ 快照回到池中，之后的检出一直看不到新插入的记录。
+    """
+
+    def __init__(self, db_config, max_size=8, timeout=5, ping_interval=30):
+        self.db_config = db_config
+        self.max_size = max(1, int(max_size))
+        self.timeout = timeout
+        self.ping_interval = ping_interval
+        self._idle = deque()  # (连接, 归还时间)，后进先出，让少数连接保持热状态
+        self._created = 0
+        self._cond = threading.Condition()
+        self._stats = {"checkouts": 0, "waits": 0, "timeouts": 0, "health_checks": 0, "discarded": 0}
+
+    @contextmanager
+    def connection(self):
+        conn = self._checkout()
+        try:
+            yield conn
+        except (pymysql.err.OperationalError, pymysql.err.InterfaceError):
+            self._discard(conn)
+            raise
+        except Exception:
+            self._release(conn)
+            raise
+        else:
+            self._release(conn)
+
+    def stats(self):
+        with self._cond:
+            return {**self._stats, "size": self._created, "idle": len(self._idle),
+                    "in_use": self._created - len(self._idle), "max_size": self.max_size}
+
+    def close_all(self):
+        with self._cond:
+            idle, self._idle = list(self._idle), deque()
+            self._created -= len(idle)
+        for conn, _ in idle:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def _checkout(self):
+        deadline = time.monotonic() + self.timeout
+        with self._cond:
+            self._stats["checkouts"] += 1
+            while not self._idle and self._created >= self.max_size:
+                self._stats["waits"] += 1
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._cond.wait(remaining):
+                    if not self._idle and self._created >= self.max_size:
+                        self._stats["timeouts"] += 1
+                        raise TimeoutError(f"等待数据库连接超时（连接池上限 {self.max_size}）")
+            if self._idle:
+                conn, released_at = self._idle.pop()
+            else:
+                # 先占位再在锁外建立连接，避免建连期间阻塞其他线程
+                self._created += 1
+                conn, released_at = None, None
+        if conn is None:
+            try:
+                return pymysql.connect(**self.db_config)
+            except Exception:
+                with self._cond:
+                    self._created -= 1
+                    self._cond.notify()
+                raise
+        if time.monotonic() - released_at > self.ping_interval:
+            try:
+                conn.ping(reconnect=True)
+                with self._cond:
+                    self._stats["health_checks"] += 1
+            except Exception:
+                self._discard(conn)
+                raise
+        return conn
+
+    def _release(self, conn):
+        """结束当前事务（未提交的写入被丢弃，读快照被释放）后放回空闲队列；回滚失败的连接直接丢弃。"""
+        try:
+            conn.rollback()
+        except Exception:
+            self._discard(conn)
+            return
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._created -= 1
+            self._stats["discarded"] += 1
+            self._cond.notify()
+
+
+db_pool = ConnectionPool(DB_CONFIG, max_size=DB_POOL_SIZE, timeout=DB_POOL_TIMEOUT_S,
+                         ping_interval=DB_POOL_PING_INTERVAL_S)
+atexit.register(db_pool.close_all)
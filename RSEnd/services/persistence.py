@@ -0,0 +1,206 @@
+import atexit
+import os
+import queue
+import threading
+import time
+import traceback
+from collections import defaultdict
+
+import cv2
+
+from config import PERSIST_QUEUE_SIZE, PERSIST_BATCH_SIZE, PERSIST_FLUSH_INTERVAL_MS
+from api.utils import load_image, image_extension
+from services.db import db_pool
+from services.cache import history_cache
+from services.storage import blob_store, content_key
+
+HISTORY_INSERT_SQL = ("INSERT INTO history_records (task_type, result_url, before_image_url, after_image_url, "
+                      "detection_metrics_json) VALUES (%s, %s, %s, %s, %s)")
+
+
+class PersistJob:
+    """一次分析产生的所有副作用：若干待写文件 [(路径, 写入函数)] 和一条历史记录。为 None 的文件（内容已存在）被忽略。"""
+
+    def __init__(self, files, sql=None, params=None):
+        self.files = [f for f in files if f]
+        self.sql = sql
+        self.params = params
+        self.enqueued_at = time.monotonic()
+
+
+class PersistenceQueue:
+    """
+    结果图保存、历史输入拷贝和数据库写入的后台写回(write-behind)队列。
+
+    服务函数在指标算好后只需要确定文件路径、提交一个 PersistJob 就可以返回，编码/拷贝/INSERT 由后台线程完成：
+    每次取出最多 batch_size 个任务，先写文件，再把同一条 SQL 的记录合并成一次 executemany + commit。
+    队列有界，写回跟不上时 submit() 阻塞，请求退化为同步写入而不是无限堆积内存；进程退出时 close() 写完剩余任务。
+
+    结果文件在写完之前就已经把 URL 返回给了前端，wait_for() 供静态文件请求在文件仍在队列中时等待它落盘。
+    """
+
+    def __init__(self, pool, max_size=256, batch_size=32, flush_interval_ms=200):
+        self.pool = pool
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = flush_interval_ms / 1000.0
+        self._queue = queue.Queue(maxsize=max_size)
+        self._pending = {}  # 规范化路径 -> threading.Event，文件写完后 set
+        self._pending_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {"submitted": 0, "written_files": 0, "inserted_rows": 0, "batches": 0, "failures": 0,
+                       "blocked_submits": 0, "last_lag_seconds": 0.0, "max_lag_seconds": 0.0}
+        self._closed = False
+        self._worker = threading.Thread(target=self._loop, name="persistence-writer", daemon=True)
+        self._worker.start()
+
+    def submit(self, job):
+        if self._closed:
+            # 关闭之后（进程退出阶段）不再排队，直接在当前线程写入
+            self._process([job])
+            return
+        with self._pending_lock:
+            for path, _ in job.files:
+                self._pending[os.path.normpath(path)] = threading.Event()
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._stats_lock:
+                self._stats["blocked_submits"] += 1
+            self._queue.put(job)
+        with self._stats_lock:
+            self._stats["submitted"] += 1
+
+    def wait_for(self, path, timeout=None):
+        """path 仍在队列中等待写入时阻塞到写完（或超时），返回 False 表示超时。不在队列中的路径立即返回 True。"""
+        with self._pending_lock:
+            event = self._pending.get(os.path.normpath(path))
+        return event.wait(timeout) if event else True
+
+    def is_pending(self, path):
+        """path 是否已提交、仍在队列中等待写入。"""
+        with self._pending_lock:
+            return os.path.normpath(path) in self._pending
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["queue_depth"] = self._queue.qsize()
+        stats["pending_files"] = len(self._pending)
+        return stats
+
+    def close(self, timeout=None):
+        """写完队列中剩余的任务后停止后台线程。"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._worker.join(timeout)
+
+    def _loop(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            batch = [job]
+            # 在 flush_interval 内尽量凑满一批，合并数据库写入
+            deadline = time.monotonic() + self.flush_interval
+            stop = False
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    job = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if job is None:
+                    stop = True
+                    break
+                batch.append(job)
+            self._process(batch)
+            if stop:
+                return
+
+    def _process(self, batch):
+        for job in batch:
+            for path, write in job.files:
+                try:
+                    write(path)
+                    with self._stats_lock:
+                        self._stats["written_files"] += 1
+                except Exception as e:
+                    print(f"!!! 后台写入文件 {path} 失败: {e}")
+                    with self._stats_lock:
+                        self._stats["failures"] += 1
+                finally:
+                    with self._pending_lock:
+                        event = self._pending.pop(os.path.normpath(path), None)
+                    if event:
+                        event.set()
+        self._insert(batch)
+        lag = time.monotonic() - min(job.enqueued_at for job in batch)
+        with self._stats_lock:
+            self._stats["batches"] += 1
+            self._stats["last_lag_seconds"] = round(lag, 3)
+            self._stats["max_lag_seconds"] = round(max(self._stats["max_lag_seconds"], lag), 3)
+
+    def _insert(self, batch):
+        rows = defaultdict(list)
+        for job in batch:
+            if job.sql:
+                rows[job.sql].append(job.params)
+        if not rows:
+            return
+        try:
+            with self.pool.connection() as db_conn:
+                with db_conn.cursor() as cursor:
+                    for sql, params in rows.items():
+                        cursor.executemany(sql, params)
+                db_conn.commit()
+            # 新记录出现在历史列表的第一页，缓存的列表查询全部失效
+            history_cache.invalidate()
+            with self._stats_lock:
+                self._stats["inserted_rows"] += sum(len(p) for p in rows.values())
+        except Exception as e:
+            print(f"!!! 后台写入历史记录失败（{sum(len(p) for p in rows.values())} 条）: {e}")
+            traceback.print_exc()
+            with self._stats_lock:
+                self._stats["failures"] += 1
+
+
+def history_input_job(image, key=None):
+    """
+    为输入图片确定它在内容寻址存储中的路径，返回 (相对路径, (路径, 写入函数) 或 None)，写入本身交给后台队列。
+    路径输入按文件字节取键并硬链接入库；编码字节原样写盘；解码后的数组按像素取键并编码成 PNG。
+    相同内容已经存在时不产生写入任务。key 为调用方已经算好的 content_key(image)，避免重复哈希。
+    """
+    key = key or content_key(image)
+    if isinstance(image, str):
+        return blob_store.reserve_file(image, key)
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        data = bytes(image)
+
+        def write(path):
+            with open(path, 'wb') as f:
+                f.write(data)
+        return blob_store.reserve(key, image_extension(data), write)
+    decoded = load_image(image)
+    return blob_store.reserve(key, '.png', lambda path: cv2.imwrite(path, decoded))
+
+
+def result_job(kind, parts, write, ext='.png'):
+    """
+    结果图的内容寻址路径与写入任务，返回值同 history_input_job。
+    kind 区分不同的渲染方式，parts 是决定结果图内容的全部数据（如标签图），同一份数据重复分析时复用已有文件。
+    """
+    return blob_store.reserve(blob_store.key_for(kind, *parts), ext, write)
+
+
+def history_record(task_type, result_url, before_url, metrics_str, after_url=None):
+    """history_records 表的一行，路径中的反斜杠统一换成 '/'。"""
+    before_url, result_url = before_url.replace('\\', '/'), result_url.replace('\\', '/')
+    after_url = after_url.replace('\\', '/') if after_url else None
+    return HISTORY_INSERT_SQL, (task_type, result_url, before_url, after_url, metrics_str)
+
+
+persistence = PersistenceQueue(db_pool, max_size=PERSIST_QUEUE_SIZE, batch_size=PERSIST_BATCH_SIZE,
+                               flush_interval_ms=PERSIST_FLUSH_INTERVAL_MS)
+atexit.register(persistence.close)
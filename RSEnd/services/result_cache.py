@@ -0,0 +1,116 @@
+import json
+import os
+import shutil
+import threading
+import uuid
+
+from config import (RESULT_CACHE_ENABLED, RESULT_CACHE_FOLDER, RESULT_CACHE_MEMORY_ENTRIES, RESULT_CACHE_MEMORY_TTL_S,
+                    RESULT_CACHE_SCHEMA)
+from services.cache import TTLCache
+from services.storage import ContentStore
+
+
+class ResultCache:
+    """
+    分析结果缓存，键为 (任务, 模型版本, 参数, 输入内容键)，值是服务函数返回的指标与结果图路径。
+
+    两级存储：内存中的 TTLCache（条目数有上限，LRU 淘汰）和磁盘上的 JSON 文件（进程重启后仍然有效），
+    磁盘命中时回填内存。磁盘条目按 <任务>/<模型版本>/ 分目录保存，发现某个任务的模型版本变化时
+    （models/ 下的模型目录被替换或修改）删除该任务其他版本的目录；内存中旧版本的条目因键不同不会再命中，随 LRU 淘汰。
+    """
+
+    def __init__(self, root, memory_entries=256, memory_ttl_s=3600, enabled=True):
+        self.root = root
+        self.enabled = enabled
+        self.memory = TTLCache(max_entries=memory_entries, ttl_s=memory_ttl_s)
+        self._versions = {}  # 任务 -> 最近一次见到的模型版本
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "stale": 0, "invalidations": 0}
+
+    def key(self, task, model_version, params, input_keys):
+        """
+        task 为注册表中的模型名（如 'land_segmentation:变体'），params 为影响结果的请求参数（需可 JSON 序列化），
+        input_keys 为各输入图片的 content_key。
+        """
+        task = task.replace(':', '-')  # 用作目录名，Windows 下不能含 ':'
+        self._check_version(task, model_version)
+        raw = json.dumps([RESULT_CACHE_SCHEMA, task, model_version, params, list(input_keys)],
+                         sort_keys=True, ensure_ascii=False)
+        return f"{task}/{model_version}/{ContentStore.key_for(raw)}"
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        hit, value = self.memory.get(key)
+        if hit:
+            self._count("memory_hits")
+            return value
+        try:
+            with open(self._disk_path(key), encoding='utf-8') as f:
+                value = json.load(f)
+        except (OSError, ValueError):
+            self._count("misses")
+            return None
+        self.memory.set(key, value)
+        self._count("disk_hits")
+        return value
+
+    def put(self, key, value):
+        if not self.enabled:
+            return
+        self.memory.set(key, value)
+        path = self._disk_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(value, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+            self._count("stores")
+        except OSError as e:
+            print(f"!!! 写入结果缓存失败: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def discard(self, key):
+        """缓存的结果图已被回收等情况下丢弃条目。"""
+        self.memory.delete(key)
+        try:
+            os.remove(self._disk_path(key))
+        except OSError:
+            pass
+        self._count("stale")
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_ratio"] = round((stats["memory_hits"] + stats["disk_hits"]) / lookups, 4) if lookups else 0.0
+        stats["memory_entries"] = len(self.memory)
+        stats["model_versions"] = dict(self._versions)
+        return stats
+
+    def _disk_path(self, key):
+        task_version, digest = key.rsplit('/', 1)
+        return os.path.join(self.root, task_version, digest[:2], f"{digest}.json")
+
+    def _check_version(self, task, model_version):
+        with self._lock:
+            if self._versions.get(task) == model_version:
+                return
+            self._versions[task] = model_version
+        task_dir = os.path.join(self.root, task)
+        if not os.path.isdir(task_dir):
+            return
+        for version in os.listdir(task_dir):
+            if version != model_version:
+                shutil.rmtree(os.path.join(task_dir, version), ignore_errors=True)
+                self._count("invalidations")
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+
+result_cache = ResultCache(RESULT_CACHE_FOLDER, memory_entries=RESULT_CACHE_MEMORY_ENTRIES,
+                           memory_ttl_s=RESULT_CACHE_MEMORY_TTL_S, enabled=RESULT_CACHE_ENABLED)
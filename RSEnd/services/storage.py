@@ -0,0 +1,136 @@
+import hashlib
+import os
+import shutil
+import threading
+import time
+import uuid
+
+import numpy as np
+
+from config import BLOB_FOLDER, BLOB_GC_GRACE_S
+from api.utils import load_image
+
+
+class ContentStore:
+    """
+    按内容寻址的文件存储：文件保存在 root/<键前两位>/<键><扩展名>，键是内容的 BLAKE2b 哈希。
+    相同内容只保存一份，重复的输入/结果直接复用已有文件，不再每次生成新的 UUID 文件名。
+
+    - 结果图在后台写回队列中才编码，键取自被编码的数据（标签图/二值图等数组）而不是 PNG 字节，
+      编码是确定性的，相同数据得到相同文件；
+    - 本地文件输入用硬链接放入存储（跨文件系统时退回拷贝）；
+    - 写入先写临时文件再 os.replace，读者不会看到写了一半的文件，同一内容并发写入也互不影响；
+    - 没有单独的引用计数表，引用关系就是 history_records 中指向该文件的记录，删除记录后由 collect() 回收。
+    """
+
+    def __init__(self, root, gc_grace_s=60):
+        self.root = root
+        self.gc_grace_s = gc_grace_s
+
+    @staticmethod
+    def key_for(*parts):
+        """对若干部分（bytes、numpy 数组或字符串）计算内容键；数组会连同形状和 dtype 一起参与哈希。"""
+        digest = hashlib.blake2b(digest_size=20)
+        for part in parts:
+            if isinstance(part, np.ndarray):
+                digest.update(f"{part.dtype.str}{part.shape}".encode('utf-8'))
+                part = np.ascontiguousarray(part)
+            elif isinstance(part, str):
+                part = part.encode('utf-8')
+            digest.update(part)
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    @staticmethod
+    def key_for_file(path, chunk_size=1 << 20):
+        digest = hashlib.blake2b(digest_size=20)
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def path(self, key, ext):
+        return os.path.join(self.root, key[:2], f"{key}{ext}")
+
+    def contains(self, path):
+        return os.path.normpath(path).startswith(os.path.normpath(self.root) + os.sep)
+
+    def reserve(self, key, ext, write):
+        """
+        确定内容键对应的文件路径，返回 (路径, 写入任务)。文件已存在时写入任务为 None（去重），
+        否则写入任务是交给后台写回队列的 (路径, 写入函数)，写入函数 write(临时路径) 由这里包装成原子写入。
+        """
+        path = self.path(key, ext)
+        if os.path.exists(path):
+            self._touch(path)
+            return path, None
+
+        def write_atomic(final_path):
+            os.makedirs(os.path.dirname(final_path), exist_ok=True)
+            # 临时文件保留扩展名，cv2.imwrite / PIL 按扩展名选择编码格式
+            tmp_path = os.path.join(os.path.dirname(final_path), f".{uuid.uuid4().hex}{ext}")
+            try:
+                write(tmp_path)
+                os.replace(tmp_path, final_path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+        return path, (path, write_atomic)
+
+    def reserve_file(self, src_path, key=None):
+        """本地文件按字节内容入库：硬链接到存储中，不拷贝数据。"""
+        ext = os.path.splitext(src_path)[1].lower()
+        return self.reserve(key or self.key_for_file(src_path), ext, lambda tmp_path: self._link_or_copy(src_path, tmp_path))
+
+    def collect(self, paths, is_referenced):
+        """
+        删除不再被任何记录引用的文件，返回删除的路径列表。
+        is_referenced(路径) 查询是否还有记录指向该文件，需要自行获取数据库连接（延迟回收时在定时器线程中调用）。
+        最近 gc_grace_s 秒内被写入或复用过的文件先不判断：复用它的记录可能还在写回队列中、尚未插入数据库，
+        等宽限期过后再检查一次。
+        """
+        removed = []
+        for path in set(p for p in paths if p):
+            path = os.path.normpath(path)
+            if not self.contains(path) or not os.path.exists(path):
+                continue
+            age = time.time() - os.path.getmtime(path)
+            if age < self.gc_grace_s:
+                timer = threading.Timer(self.gc_grace_s - age + 1, self.collect, ([path], is_referenced))
+                timer.daemon = True
+                timer.start()
+                continue
+            if is_referenced(path.replace('\\', '/')):
+                continue
+            try:
+                os.remove(path)
+                removed.append(path)
+            except OSError as e:
+                print(f"!!! 回收文件 {path} 失败: {e}")
+        return removed
+
+    @staticmethod
+    def _link_or_copy(src_path, dst_path):
+        try:
+            os.link(src_path, dst_path)
+        except OSError:
+            shutil.copy(src_path, dst_path)
+
+    @staticmethod
+    def _touch(path):
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+
+def content_key(image):
+    """输入图片的内容键：路径按文件字节、编码字节按字节本身、其他形式按解码后的像素计算。"""
+    if isinstance(image, str):
+        return ContentStore.key_for_file(image)
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return ContentStore.key_for(bytes(image))
+    return ContentStore.key_for(load_image(image))
+
+
+blob_store = ContentStore(BLOB_FOLDER, gc_grace_s=BLOB_GC_GRACE_S)
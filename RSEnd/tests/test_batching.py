@@ -0,0 +1,91 @@
+import threading
+import time
+from concurrent.futures import wait
+
+import numpy as np
+
+from api.batching import BatchingQueue
+
+
+class _EchoPredictor:
+    def predict_batch(self, images):
+        time.sleep(0.001)
+        return [[image] for image in images]
+
+
+def test_concurrent_submit_and_close_resolves_every_future():
+    for _ in range(20):
+        batcher = BatchingQueue(_EchoPredictor(), max_batch_size=4, max_wait_ms=1, num_workers=2)
+        futures, lock = [], threading.Lock()
+        start = threading.Barrier(5)
+
+        def submitter():
+            start.wait()
+            for i in range(200):
+                try:
+                    future = batcher.submit(np.array([i]))
+                except RuntimeError:
+                    return  # 关闭后的提交直接报错，不会留下悬空的 Future
+                with lock:
+                    futures.append((i, future))
+
+        threads = [threading.Thread(target=submitter) for _ in range(4)]
+        for t in threads:
+            t.start()
+        start.wait()
+        time.sleep(0.002)
+        batcher.close()
+        for t in threads:
+            t.join()
+
+        _, not_done = wait([f for _, f in futures], timeout=5)
+        assert not not_done
+        for i, future in futures:
+            if future.exception() is None:
+                assert future.result()[0][0] == i
+            else:
+                assert isinstance(future.exception(), RuntimeError)
+
+
+def test_submit_after_close_raises():
+    batcher = BatchingQueue(_EchoPredictor())
+    assert batcher.predict(np.array([1]), timeout=5)[0][0] == 1
+    batcher.close()
+    try:
+        batcher.submit(np.array([2]))
+    except RuntimeError:
+        pass
+    else:
+        raise AssertionError("close() 之后 submit() 应当报错")
+
+
+class _PickyPredictor:
+    """批次中含有全零图片时整批失败，模拟单张图片导致的推理错误。"""
+
+    def predict_batch(self, images):
+        if any(not image.any() for image in images):
+            raise ValueError("bad image")
+        return [[int(image[0, 0, 0])] for image in images]
+
+
+def test_undecodable_image_fails_only_its_caller():
+    batcher = BatchingQueue(_EchoPredictor())
+    try:
+        batcher.submit(b"not an image")
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("无法解码的图片应当在 submit() 时报错")
+    image = np.zeros((2, 2, 3), np.uint8)
+    assert batcher.predict(image, timeout=5)[0] is image
+    batcher.close()
+
+
+def test_failing_image_does_not_fail_the_rest_of_the_batch():
+    batcher = BatchingQueue(_PickyPredictor(), max_batch_size=8, max_wait_ms=50)
+    images = [np.full((2, 2, 3), i, np.uint8) for i in range(4)]
+    futures = [batcher.submit(image) for image in images]
+    wait(futures, timeout=5)
+    assert isinstance(futures[0].exception(), ValueError)
+    assert [f.result() for f in futures[1:]] == [[1], [2], [3]]
+    batcher.close()
@@ -0,0 +1,26 @@
+# 在 RSEnd 目录下运行: python -m pytest tests
+from datetime import date, datetime
+
+from api.history import HistoryQuery, build_list_query
+
+
+def test_date_only_end_includes_whole_day():
+    query = HistoryQuery.model_validate({"end": "2024-05-01"})
+    assert query.end == date(2024, 5, 1)
+    sql, params = build_list_query(query)
+    assert "created_at < %s" in sql and "created_at <= %s" not in sql
+    assert params[0] == date(2024, 5, 2)
+
+
+def test_end_with_time_is_inclusive():
+    query = HistoryQuery.model_validate({"end": "2024-05-01 08:30:00"})
+    sql, params = build_list_query(query)
+    assert "created_at <= %s" in sql
+    assert params[0] == datetime(2024, 5, 1, 8, 30)
+
+
+def test_date_only_start():
+    query = HistoryQuery.model_validate({"start": "2024-05-01", "task_type": "目标检测"})
+    sql, params = build_list_query(query)
+    assert "created_at >= %s" in sql
+    assert params[:2] == ["目标检测", date(2024, 5, 1)]